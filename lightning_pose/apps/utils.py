@@ -8,6 +8,8 @@ from typing import Dict, List, Tuple
 import pandas as pd
 import streamlit as st
 
+from lightning_pose.utils.io import split_prediction_file
+
 pix_error_key = "pixel error"
 conf_error_key = "confidence"
 temp_norm_error_key = "temporal norm"
@@ -54,7 +56,7 @@ def update_vid_metric_files_list(
             continue
         model_preds = [
             f for f in os.listdir(video_dir) if
-            (os.path.isfile(os.path.join(video_dir, f)) and f.endswith(".csv"))
+            (os.path.isfile(os.path.join(video_dir, f)) and split_prediction_file(f) is not None)
         ]
         ret_files = []
         for file in model_preds:
@@ -76,14 +78,14 @@ def get_all_videos(model_preds_folders: List[str], video_subdir: str = "video_pr
             continue
         model_preds = [
             f for f in os.listdir(video_dir) if
-            (os.path.isfile(os.path.join(video_dir, f)) and f.endswith(".csv"))
+            (os.path.isfile(os.path.join(video_dir, f)) and split_prediction_file(f) is not None)
         ]
         for file in model_preds:
             if "temporal" in file:
                 vid_file = file.split("_temporal_norm.csv")[0]
                 ret_videos.add(vid_file)
             elif "temporal" not in file and "pca" not in file:
-                vid_file = file.split(".csv")[0]
+                vid_file = split_prediction_file(file)[0]
                 ret_videos.add(vid_file)
     return list(ret_videos)
 
@@ -245,10 +247,11 @@ def get_model_folders(
     # find all directories two levels deep
     for root, dirs, files in os.walk(model_dir):
         if root.count(os.sep) - model_dir.count(os.sep) == 2:
-            # only include directory if it has predictions.csv file (model training finished)
+            # only include directory if it has a predictions file (model training finished)
             if require_predictions or require_tb_logs:
                 append = True
-                if require_predictions and ("predictions.csv" not in os.listdir(root)):
+                stems = [s[0] for s in map(split_prediction_file, os.listdir(root)) if s]
+                if require_predictions and ("predictions" not in stems):
                     append &= False
                 if require_tb_logs and ("tb_logs" not in os.listdir(root)):
                     append &= False
@@ -26,6 +26,7 @@ from lightning_pose.apps.utils import (
     get_model_folders_vis,
     update_vid_metric_files_list,
 )
+from lightning_pose.utils.io import load_predictions
 
 catplot_options = ["boxen", "box", "violin", "strip", "hist"]
 scale_options = ["linear", "log"]
@@ -103,7 +104,7 @@ def run():
                     dframe = pd.read_csv(model_pred_file_path, index_col=None)
                     dframes_metrics[model_name][str(model_pred_file)] = dframe
                 else:
-                    dframe = pd.read_csv(model_pred_file_path, header=[1, 2], index_col=0)
+                    dframe = load_predictions(model_pred_file_path, header_rows=[1, 2])
                     dframes_traces[model_name] = dframe
                     dframes_metrics[model_name]["confidence"] = dframe
                 # data_types = dframe.iloc[:, -1].unique()
@@ -5,6 +5,7 @@ from lightning.pytorch.callbacks import Callback
 # to ignore imports for sphix-autoapidoc
 __all__ = [
     "AnnealWeight",
+    "FrameCacheMonitor",
 ]
 
 
@@ -112,3 +113,30 @@ class UnfreezeBackbone(Callback):
             if next_lr == upsampling_lr:
                 self._warmed_up = True
             return next_lr
+
+
+class FrameCacheMonitor(Callback):
+    """Callback that logs hits and misses of the shared frame cache after each training epoch."""
+
+    @staticmethod
+    def _frame_caches(trainer: "pl.Trainer") -> list:
+        datamodule = getattr(trainer, "datamodule", None)
+        if datamodule is None:
+            return []
+        dataset = datamodule.dataset
+        # multiview datasets hold one dataset (and cache) per view
+        views = getattr(dataset, "dataset", None)
+        datasets = views.values() if isinstance(views, dict) else [dataset]
+        return [d.frame_cache for d in datasets if getattr(d, "frame_cache", None) is not None]
+
+    def on_train_epoch_end(self, trainer: "pl.Trainer", pl_module: "pl.LightningModule") -> None:
+        caches = self._frame_caches(trainer)
+        if len(caches) == 0:
+            return
+        hits = sum(cache.hits for cache in caches)
+        misses = sum(cache.misses for cache in caches)
+        frames = sum(len(cache) for cache in caches)
+        pl_module.log("frame_cache_hits", float(hits), sync_dist=True)
+        pl_module.log("frame_cache_misses", float(misses), sync_dist=True)
+        if trainer.is_global_zero:
+            print(f"frame cache: {hits} hits, {misses} misses, {frames} frames cached")
@@ -1,12 +1,24 @@
 """Functions to build augmentation pipeline."""
 
+import math
+from typing import List, Optional, Tuple
+
 import imgaug.augmenters as iaa
+import numpy as np
+import torch
 from omegaconf import DictConfig
+from torch.nn import functional as F
+from torchtyping import TensorType
 from typeguard import typechecked
 
+from lightning_pose.data import _IMAGENET_MEAN, _IMAGENET_STD
+
 # to ignore imports for sphix-autoapidoc
 __all__ = [
     "imgaug_transform",
+    "torch_transform",
+    "BatchAugmentationCollate",
+    "TorchAugmentation",
 ]
 
 
@@ -114,3 +126,470 @@ def imgaug_transform(cfg: DictConfig) -> iaa.Sequential:
             ))
 
     return iaa.Sequential(data_transform)
+
+
+@typechecked
+def torch_transform(cfg: DictConfig) -> "TorchAugmentation":
+    """Create batched data transform pipeline that augments images with torch tensor ops.
+
+    This is the torch counterpart of :func:`imgaug_transform` and is used when
+    "cfg.training.imgaug_backend" is set to "torch". Images are resized by the datasets; the
+    returned pipeline operates on batches of resized images, on any device.
+
+    Args:
+        cfg: standard config file that carries around dataset info; relevant is the parameter
+            "cfg.training.imgaug" which can take on the values "default", "dlc", "dlc-top-down"
+
+    Returns:
+        torch augmentation pipeline
+
+    """
+    kind = cfg.training.get("imgaug", "default")
+    print(f"using {kind} image augmentation pipeline (torch backend)")
+    return TorchAugmentation(kind=kind)
+
+
+class BatchAugmentationCollate(object):
+    """Collate function that augments a whole batch of labeled frames with one imgaug call.
+
+    The dataset must have `return_raw_images` set to True, so that each example contains the
+    decoded uint8 frame and the untransformed (num_keypoints, 2) keypoints. The full imgaug
+    pipeline (including the final resize) is then applied to the list of frames at once, which
+    removes the per-call overhead of augmenting batches of size one in `__getitem__`. Frames are
+    normalized, and heatmaps are computed if the dataset returns heatmaps, so the output matches
+    the batches of the default collate function.
+
+    """
+
+    def __init__(self, dataset: torch.utils.data.Dataset) -> None:
+        """
+
+        Args:
+            dataset: BaseTrackingDataset or HeatmapDataset that returns raw frames
+
+        """
+        self.dataset = dataset
+        self.mean = torch.tensor(_IMAGENET_MEAN).view(1, 3, 1, 1)
+        self.std = torch.tensor(_IMAGENET_STD).view(1, 3, 1, 1)
+
+    def __call__(self, examples: List[dict]) -> dict:
+
+        images = [example["images"] for example in examples]
+        keypoints = [example["keypoints"].numpy() for example in examples]
+        if self.dataset.imgaug_transform is not None:
+            images, keypoints = self.dataset.imgaug_transform(images=images, keypoints=keypoints)
+
+        # uint8 (batch, height, width, 3) -> normalized float (batch, 3, height, width)
+        images = torch.from_numpy(np.stack(images)).permute(0, 3, 1, 2).float().div_(255.0)
+        images = images.sub_(self.mean).div_(self.std)
+        keypoints = torch.from_numpy(np.stack(keypoints)).reshape(len(examples), -1)
+
+        batch = {
+            "images": images,
+            "keypoints": keypoints,
+            "idxs": torch.tensor([example["idxs"] for example in examples]),
+            "bbox": torch.stack([example["bbox"] for example in examples]),
+        }
+        if getattr(self.dataset, "return_heatmaps", False):
+            # keypoints that augmentation moved out of the frame are set to nan in place
+            batch["heatmaps"] = self.dataset.compute_batch_heatmaps(keypoints)
+
+        return batch
+
+
+class TorchAugmentation(object):
+    """Batched torch re-implementation of the imgaug augmentation pipelines.
+
+    The "default", "dlc" and "dlc-top-down" pipelines of :func:`imgaug_transform` are reproduced
+    with the same augmenters, order, and probabilities, and keypoints follow the same geometric
+    transforms. Augmentation parameters are sampled per example; all context frames of an example
+    share the same parameters. Unlike imgaug, augmentations are applied after resizing; pixel-sized
+    parameters (motion blur kernel, coarse dropout cells, elastic transform, crop/pad rounding)
+    are rescaled with the per-example resize ratio, so that they match imgaug in original image
+    pixels. The 3x3 emboss kernel and the CLAHE tile grid are not rescaled and act at the resized
+    resolution.
+
+    """
+
+    def __init__(self, kind: str = "default") -> None:
+        """
+
+        Args:
+            kind: "default" (no augmentation), "dlc", or "dlc-top-down"
+
+        """
+        if kind not in ["default", "dlc", "dlc-top-down"]:
+            raise NotImplementedError(
+                "must choose imgaug kind from 'default', 'dlc', 'dlc-top-down'"
+            )
+        self.kind = kind
+        self.mean = torch.tensor(_IMAGENET_MEAN).view(1, 3, 1, 1)
+        self.std = torch.tensor(_IMAGENET_STD).view(1, 3, 1, 1)
+
+    def __call__(
+        self,
+        images: TensorType["batch", "RGB":3, "height", "width"],
+        keypoints: TensorType["batch", "num_targets"],
+        scale: Optional[TensorType["batch"]] = None,
+    ) -> Tuple[
+        TensorType["batch", "RGB":3, "height", "width"],
+        TensorType["batch", "num_targets"],
+    ]:
+        """Augment a batch of normalized images and their (x, y) keypoints.
+
+        Args:
+            images: normalized images of shape (batch, 3, height, width), or context frames of
+                shape (batch, frames, 3, height, width)
+            keypoints: pixel coordinates of shape (batch, num_keypoints * 2)
+            scale: ratio of the resized to the original frame size of each example, used to
+                rescale pixel-sized augmentation parameters; None for unresized frames
+
+        Returns:
+            tuple
+                - augmented images with the same shape as the input
+                - augmented keypoints with the same shape as the input
+
+        """
+        if self.kind == "default":
+            return images, keypoints
+
+        batch_size = images.shape[0]
+        num_frames = images.shape[1] if images.dim() == 5 else 1
+        height, width = images.shape[-2:]
+        device = images.device
+        mean = self.mean.to(device)
+        std = self.std.to(device)
+
+        # operate on unnormalized images in [0, 1]; context frames are folded into the batch dim
+        x = images.reshape(-1, 3, height, width) * std + mean
+        kps = keypoints.reshape(batch_size, -1, 2).clone()
+
+        if scale is None:
+            scale = torch.ones(batch_size, device=device)
+        scale = scale.to(device=device, dtype=x.dtype)
+
+        def sometimes(p: float) -> torch.Tensor:
+            return torch.rand(batch_size, device=device) < p
+
+        # flip around horizontal/vertical axes first
+        if self.kind == "dlc-top-down":
+            x, kps = self._flip(x, kps, sometimes(0.5), sometimes(0.5), num_frames)
+
+        # rotate
+        rotation = 25
+        angle = (torch.rand(batch_size, device=device) * 2 - 1) * rotation
+        x, kps = self._rotate(x, kps, angle * sometimes(0.4), num_frames)
+
+        # motion blur
+        x = self._apply(
+            x, sometimes(0.5), num_frames, self._motion_blur, scale, k=5, angle=90,
+        )
+
+        # coarse dropout
+        x = self._apply(
+            x, sometimes(0.5), num_frames, self._coarse_dropout, scale,
+            p=0.02, size_percent=0.3, per_channel=0.5,
+        )
+
+        # elastic transform; keypoints are moved by the same displacement field
+        mask = sometimes(0.5)
+        if mask.any():
+            x_sel, kps_sel = self._elastic(
+                x[self._frames(mask, num_frames)], kps[mask], scale[mask], alpha=(0, 10), sigma=5,
+            )
+            x[self._frames(mask, num_frames)] = x_sel
+            kps[mask] = kps_sel
+
+        # hist eq
+        x = self._apply(x, sometimes(0.1), num_frames, self._histogram_equalization)
+
+        # clahe (contrast limited adaptive histogram equalization)
+        x = self._apply(x, sometimes(0.1), num_frames, self._clahe, clip_limit=(0.1, 8))
+
+        # emboss
+        x = self._apply(x, sometimes(0.1), num_frames, self._emboss, alpha=(0, 0.5))
+
+        # crop/pad each side, then resize back to the original size
+        crop_by = 0.15
+        percent = (torch.rand(batch_size, 4, device=device) * 2 - 1) * crop_by
+        percent = percent * sometimes(0.4).unsqueeze(1)
+        x, kps = self._crop_and_pad(x, kps, percent, num_frames, scale)
+
+        images = ((x.clamp(0, 1) - mean) / std).reshape(images.shape)
+        keypoints = kps.reshape(keypoints.shape)
+        return images, keypoints
+
+    @staticmethod
+    def _frames(mask: torch.Tensor, num_frames: int) -> torch.Tensor:
+        """Expand a per-example tensor to all context frames."""
+        return mask.repeat_interleave(num_frames, dim=0)
+
+    def _apply(self, x, mask, num_frames, fn, scale=None, **kwargs) -> torch.Tensor:
+        """Apply a photometric augmentation to the examples selected by `mask`.
+
+        If `scale` is not None, the resize ratios of the selected examples are passed to `fn`.
+
+        """
+        if mask.any():
+            idxs = self._frames(mask, num_frames)
+            if scale is not None:
+                kwargs["scale"] = scale[mask]
+            x[idxs] = fn(x[idxs], num_frames, **kwargs)
+        return x
+
+    @staticmethod
+    def _warp_affine(x: torch.Tensor, inv_matrix: torch.Tensor) -> torch.Tensor:
+        """Warp images with affine transforms that map output to input pixel coordinates.
+
+        Pixel coordinates are continuous with pixel centers at (i + 0.5), as for keypoints.
+
+        """
+        height, width = x.shape[-2:]
+        scale = torch.tensor([width / 2, height / 2], device=x.device, dtype=x.dtype)
+        # convert to the normalized coordinates used by affine_grid (align_corners=False)
+        linear = inv_matrix[:, :, :2] * scale.unsqueeze(0) / scale.unsqueeze(1)
+        offset = (inv_matrix[:, :, :2] @ scale + inv_matrix[:, :, 2] - scale) / scale
+        theta = torch.cat([linear, offset.unsqueeze(-1)], dim=-1)
+        grid = F.affine_grid(theta, list(x.shape), align_corners=False)
+        return F.grid_sample(x, grid, mode="bilinear", padding_mode="zeros", align_corners=False)
+
+    @staticmethod
+    def _transform_keypoints(kps: torch.Tensor, matrix: torch.Tensor) -> torch.Tensor:
+        """Apply (batch, 2, 3) affine transforms to (batch, num_keypoints, 2) keypoints."""
+        return kps @ matrix[:, :, :2].transpose(1, 2) + matrix[:, :, 2].unsqueeze(1)
+
+    def _flip(self, x, kps, flip_lr, flip_ud, num_frames) -> Tuple[torch.Tensor, torch.Tensor]:
+        height, width = x.shape[-2:]
+        lr = self._frames(flip_lr, num_frames).view(-1, 1, 1, 1)
+        ud = self._frames(flip_ud, num_frames).view(-1, 1, 1, 1)
+        x = torch.where(lr, x.flip(-1), x)
+        x = torch.where(ud, x.flip(-2), x)
+        kps = kps.clone()
+        kps[:, :, 0] = torch.where(flip_lr.unsqueeze(1), width - kps[:, :, 0], kps[:, :, 0])
+        kps[:, :, 1] = torch.where(flip_ud.unsqueeze(1), height - kps[:, :, 1], kps[:, :, 1])
+        return x, kps
+
+    def _rotate(self, x, kps, angle, num_frames) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Rotate images and keypoints by `angle` degrees around the image center."""
+        height, width = x.shape[-2:]
+        rad = torch.deg2rad(angle)
+        cos, sin = torch.cos(rad), torch.sin(rad)
+
+        def rotation_matrix(c_x, c_y, sign):
+            matrix = torch.zeros(angle.shape[0], 2, 3, device=x.device, dtype=x.dtype)
+            matrix[:, 0, 0] = cos
+            matrix[:, 0, 1] = -sign * sin
+            matrix[:, 1, 0] = sign * sin
+            matrix[:, 1, 1] = cos
+            matrix[:, 0, 2] = c_x - cos * c_x + sign * sin * c_y
+            matrix[:, 1, 2] = c_y - sign * sin * c_x - cos * c_y
+            return matrix
+
+        # like imgaug, rotate images and keypoints around (width / 2, height / 2); images are
+        # sampled with the inverse rotation
+        inv_matrix = rotation_matrix(width / 2, height / 2, -1)
+        x_rot = self._warp_affine(x, self._frames(inv_matrix, num_frames))
+        x = torch.where(self._frames(angle != 0, num_frames).view(-1, 1, 1, 1), x_rot, x)
+        kps = self._transform_keypoints(kps, rotation_matrix(width / 2, height / 2, 1))
+        return x, kps
+
+    def _crop_and_pad(
+        self, x, kps, percent, num_frames, scale=None,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Crop (negative) or pad (positive) each side, then resize to the original size.
+
+        Args:
+            percent: fraction of the image size to pad on the (top, right, bottom, left) sides
+            scale: resize ratio of each example; like imgaug, pixel amounts are rounded in
+                original image pixels
+
+        """
+        height, width = x.shape[-2:]
+        if scale is None:
+            scale = torch.ones(percent.shape[0], device=x.device, dtype=x.dtype)
+        scale = scale.unsqueeze(1)
+        size = torch.tensor([height, width, height, width], device=x.device, dtype=x.dtype)
+        px = torch.round(percent * size / scale) * scale
+        top, right, bottom, left = px.unbind(dim=1)
+        scale_x = (width + left + right) / width
+        scale_y = (height + top + bottom) / height
+        inv_matrix = torch.zeros(percent.shape[0], 2, 3, device=x.device, dtype=x.dtype)
+        inv_matrix[:, 0, 0] = scale_x
+        inv_matrix[:, 0, 2] = -left
+        inv_matrix[:, 1, 1] = scale_y
+        inv_matrix[:, 1, 2] = -top
+        x_crop = self._warp_affine(x, self._frames(inv_matrix, num_frames))
+        changed = self._frames((px != 0).any(dim=1), num_frames).view(-1, 1, 1, 1)
+        x = torch.where(changed, x_crop, x)
+        kps = kps.clone()
+        kps[:, :, 0] = (kps[:, :, 0] + left.unsqueeze(1)) / scale_x.unsqueeze(1)
+        kps[:, :, 1] = (kps[:, :, 1] + top.unsqueeze(1)) / scale_y.unsqueeze(1)
+        return x, kps
+
+    @staticmethod
+    def _depthwise_conv(x: torch.Tensor, kernels: torch.Tensor) -> torch.Tensor:
+        """Convolve each image with its own (k, k) kernel, using reflected borders."""
+        n, c, height, width = x.shape
+        k = kernels.shape[-1]
+        weight = kernels.repeat_interleave(c, dim=0).unsqueeze(1)
+        x = F.pad(x.reshape(1, n * c, height, width), [k // 2] * 4, mode="reflect")
+        return F.conv2d(x, weight, groups=n * c).reshape(n, c, height, width)
+
+    def _motion_blur(self, x, num_frames, k, angle, scale) -> torch.Tensor:
+        num = x.shape[0] // num_frames
+        # line length in resized pixels; all kernels share an odd size so that they stay centered
+        length = (k * scale).round().clamp(min=1).view(-1, 1)
+        size = int(length.max()) // 2 * 2 + 1
+        # line kernel with direction-dependent weights, rotated by a random angle
+        direction = torch.rand(num, 1, device=x.device)  # (direction + 1) / 2 in imgaug
+        pos = torch.arange(size, device=x.device, dtype=x.dtype) - (size - length) // 2
+        weights = direction + pos / (length - 1).clamp(min=1) * (1 - 2 * direction)
+        weights = weights * ((pos >= 0) & (pos < length))
+        kernels = torch.zeros(num, 1, size, size, device=x.device, dtype=x.dtype)
+        kernels[:, 0, :, size // 2] = weights
+        angles = (torch.rand(num, device=x.device) * 2 - 1) * angle
+        rad = torch.deg2rad(angles)
+        cos, sin = torch.cos(rad), torch.sin(rad)
+        inv_matrix = torch.zeros(num, 2, 3, device=x.device, dtype=x.dtype)
+        inv_matrix[:, 0, 0] = cos
+        inv_matrix[:, 0, 1] = sin
+        inv_matrix[:, 1, 0] = -sin
+        inv_matrix[:, 1, 1] = cos
+        inv_matrix[:, 0, 2] = size / 2 - cos * size / 2 - sin * size / 2
+        inv_matrix[:, 1, 2] = size / 2 + sin * size / 2 - cos * size / 2
+        kernels = self._warp_affine(kernels, inv_matrix)[:, 0]
+        kernels = kernels / kernels.sum(dim=(1, 2), keepdim=True).clamp(min=1e-8)
+        return self._depthwise_conv(x, self._frames(kernels, num_frames)).clamp(0, 1)
+
+    def _coarse_dropout(self, x, num_frames, p, size_percent, per_channel, scale) -> torch.Tensor:
+        num = x.shape[0] // num_frames
+        height, width = x.shape[-2:]
+        # like imgaug, the low-res mask size is relative to the original image size
+        size_h = (height / scale * size_percent).round().clamp(min=1).long()
+        size_w = (width / scale * size_percent).round().clamp(min=1).long()
+        keep = torch.rand(num, 3, int(size_h.max()), int(size_w.max()), device=x.device) >= p
+        keep = keep.to(x.dtype)
+        keep_shared = keep[:, :1].expand(-1, 3, -1, -1)
+        use_per_channel = (torch.rand(num, device=x.device) < per_channel).view(-1, 1, 1, 1)
+        keep = torch.where(use_per_channel, keep, keep_shared)
+        # nearest upsampling of the mask of each example to the image size
+        rows = torch.arange(height, device=x.device) * size_h.view(-1, 1) // height
+        cols = torch.arange(width, device=x.device) * size_w.view(-1, 1) // width
+        idxs = torch.arange(num, device=x.device).view(-1, 1, 1)
+        keep = keep[idxs, :, rows.unsqueeze(2), cols.unsqueeze(1)].permute(0, 3, 1, 2)
+        return x * self._frames(keep, num_frames)
+
+    def _elastic(self, x, kps, scale, alpha, sigma) -> Tuple[torch.Tensor, torch.Tensor]:
+        num = kps.shape[0]
+        num_frames = x.shape[0] // num
+        height, width = x.shape[-2:]
+        # smoothed random displacement field in pixels, shape (num, 2, height, width); sigma
+        # scales with the resize ratio, alpha with its square since smoothed noise shrinks as
+        # 1 / sigma
+        sigmas = (sigma * scale).clamp(min=0.1).repeat_interleave(2).view(-1, 1)
+        # imgaug truncates the gaussian kernel to the cv2 kernel size of its blur_gaussian_
+        ksize = int(max((3.3 if sigma < 3 else 2.9 if sigma < 5 else 2.6) * sigma, 5)) // 2 * 2 + 1
+        truncate = (ksize // 2) / sigma
+        radius = max(int(truncate * float(sigmas.max())), 1)
+        coords = torch.arange(-radius, radius + 1, device=x.device, dtype=x.dtype)
+        gauss = torch.exp(-coords ** 2 / (2 * sigmas ** 2))
+        gauss = gauss * (coords.abs() <= (truncate * sigmas).clamp(min=1))
+        gauss = (gauss / gauss.sum(dim=1, keepdim=True)).view(num * 2, 1, 1, -1)
+        dxy = torch.rand(1, num * 2, height, width, device=x.device, dtype=x.dtype) * 2 - 1
+        dxy = F.pad(dxy, [radius, radius, 0, 0], mode="reflect")
+        dxy = F.conv2d(dxy, gauss, groups=num * 2)
+        dxy = F.pad(dxy, [0, 0, radius, radius], mode="reflect")
+        dxy = F.conv2d(dxy, gauss.transpose(2, 3), groups=num * 2)
+        strength = alpha[0] + torch.rand(num, device=x.device) * (alpha[1] - alpha[0])
+        strength = strength * scale ** 2
+        dxy = dxy.view(num, 2, height, width) * strength.view(-1, 1, 1, 1)
+        # sample images at the displaced locations
+        scale = torch.tensor([2 / width, 2 / height], device=x.device, dtype=x.dtype)
+        identity = torch.eye(2, 3, device=x.device, dtype=x.dtype).unsqueeze(0).expand(num, -1, -1)
+        grid = F.affine_grid(identity, [num, 1, height, width], align_corners=False)
+        grid = grid + dxy.permute(0, 2, 3, 1) * scale
+        x = F.grid_sample(
+            x, self._frames(grid, num_frames), mode="bilinear", padding_mode="zeros",
+            align_corners=False,
+        )
+        # move keypoints by the inverse of the displacement at their location
+        kps_grid = (kps * scale - 1).unsqueeze(1)
+        disp = F.grid_sample(dxy, kps_grid.nan_to_num(), align_corners=False)
+        kps = kps - disp[:, :, 0].permute(0, 2, 1)
+        return x, kps
+
+    @staticmethod
+    def _to_uint8(x: torch.Tensor) -> torch.Tensor:
+        return (x * 255).round().clamp(0, 255).long()
+
+    def _histogram_equalization(self, x, num_frames) -> torch.Tensor:
+        n, c, height, width = x.shape
+        values = self._to_uint8(x).view(n * c, -1)
+        hist = torch.zeros(n * c, 256, device=x.device, dtype=x.dtype)
+        hist.scatter_add_(1, values, torch.ones_like(values, dtype=x.dtype))
+        cdf = hist.cumsum(dim=1)
+        # value of the cdf at the smallest intensity present in each channel
+        cdf_min = torch.gather(cdf, 1, (hist > 0).to(x.dtype).argmax(dim=1, keepdim=True))
+        lut = ((cdf - cdf_min) / (cdf[:, -1:] - cdf_min).clamp(min=1)).clamp(min=0)
+        return torch.gather(lut, 1, values).view(n, c, height, width)
+
+    def _clahe(self, x, num_frames, clip_limit) -> torch.Tensor:
+        n, c, height, width = x.shape
+        num = n // num_frames
+        grid = int(torch.randint(3, 13, (1,)))  # number of tiles along each axis
+        limit = clip_limit[0] + torch.rand(num, device=x.device) * (clip_limit[1] - clip_limit[0])
+        limit = self._frames(limit, num_frames).repeat_interleave(c)
+
+        # pad so that the image divides evenly into tiles
+        tile_h, tile_w = math.ceil(height / grid), math.ceil(width / grid)
+        values = self._to_uint8(x).view(n * c, 1, height, width).to(x.dtype)
+        values = F.pad(
+            values, [0, tile_w * grid - width, 0, tile_h * grid - height], mode="reflect",
+        ).long().view(n * c, grid, tile_h, grid, tile_w)
+        values = values.permute(0, 1, 3, 2, 4).reshape(n * c, grid * grid, -1)
+
+        # clipped histograms per tile, excess redistributed uniformly
+        tile_size = tile_h * tile_w
+        hist = torch.zeros(n * c, grid * grid, 256, device=x.device, dtype=x.dtype)
+        hist.scatter_add_(2, values, torch.ones_like(values, dtype=x.dtype))
+        clip = (limit * tile_size / 256).clamp(min=1).view(-1, 1, 1)
+        excess = (hist - clip).clamp(min=0).sum(dim=2, keepdim=True)
+        hist = hist.clamp(max=clip) + excess / 256
+        lut = (hist.cumsum(dim=2) / tile_size).clamp(0, 1).view(n * c, -1)
+
+        # bilinear interpolation between the mappings of the four nearest tiles
+        pix = self._to_uint8(x).view(n * c, -1)
+        ty = torch.arange(height, device=x.device, dtype=x.dtype) / tile_h - 0.5
+        tx = torch.arange(width, device=x.device, dtype=x.dtype) / tile_w - 0.5
+        ty0, tx0 = ty.floor(), tx.floor()
+        wy, wx = (ty - ty0).view(-1, 1), (tx - tx0).view(1, -1)
+        ty0, tx0 = ty0.long().view(-1, 1), tx0.long().view(1, -1)
+
+        def lookup(tile_y, tile_x):
+            tile = tile_y.clamp(0, grid - 1) * grid + tile_x.clamp(0, grid - 1)
+            return torch.gather(lut, 1, tile.view(1, -1) * 256 + pix)
+
+        out = (
+            lookup(ty0, tx0) * ((1 - wy) * (1 - wx)).view(1, -1)
+            + lookup(ty0, tx0 + 1) * ((1 - wy) * wx).view(1, -1)
+            + lookup(ty0 + 1, tx0) * (wy * (1 - wx)).view(1, -1)
+            + lookup(ty0 + 1, tx0 + 1) * (wy * wx).view(1, -1)
+        )
+        return out.view(n, c, height, width)
+
+    def _emboss(self, x, num_frames, alpha) -> torch.Tensor:
+        num = x.shape[0] // num_frames
+        mix = alpha[0] + torch.rand(num, device=x.device) * (alpha[1] - alpha[0])
+        strength = 0.5 + torch.rand(num, device=x.device)
+        no_change = torch.zeros(num, 3, 3, device=x.device, dtype=x.dtype)
+        no_change[:, 1, 1] = 1
+        effect = torch.zeros(num, 3, 3, device=x.device, dtype=x.dtype)
+        effect[:, 0, 0] = -1 - strength
+        effect[:, 0, 1] = -strength
+        effect[:, 1, 0] = -strength
+        effect[:, 1, 1] = 1
+        effect[:, 1, 2] = strength
+        effect[:, 2, 1] = strength
+        effect[:, 2, 2] = 1 + strength
+        kernels = (1 - mix.view(-1, 1, 1)) * no_change + mix.view(-1, 1, 1) * effect
+        return self._depthwise_conv(x, self._frames(kernels, num_frames)).clamp(0, 1)
@@ -1,7 +1,6 @@
 """Data pipelines based on efficient video reading by nvidia dali package."""
 
-import os
-from typing import Dict, List, Literal, Optional, Union
+from typing import List, Literal, Optional, Union
 
 import numpy as np
 import nvidia.dali.fn as fn
@@ -9,10 +8,10 @@ import nvidia.dali.types as types
 import torch
 from nvidia.dali import pipeline_def
 from nvidia.dali.plugin.pytorch import DALIGenericIterator, LastBatchPolicy
-from omegaconf import DictConfig
 
 from lightning_pose.data import _IMAGENET_MEAN, _IMAGENET_STD
-from lightning_pose.data.utils import MultiviewUnlabeledBatchDict, UnlabeledBatchDict, count_frames
+from lightning_pose.data.utils import MultiviewUnlabeledBatchDict, UnlabeledBatchDict
+from lightning_pose.data.video import PrepareVideoLoader
 
 # to ignore imports for sphix-autoapidoc
 __all__ = [
@@ -240,173 +239,13 @@ class LitDaliWrapper(DALIGenericIterator):
         return self._dali_output_to_tensors(batch=batch)
 
 
-class PrepareDALI(object):
+class PrepareDALI(PrepareVideoLoader):
     """All the DALI stuff in one place.
 
     Big picture: this will initialize the pipes and dataloaders for both training and prediction.
 
     """
 
-    def __init__(
-        self,
-        train_stage: Literal["predict", "train"],
-        model_type: Literal["base", "context"],
-        filenames: Union[List[str], List[List[str]]],
-        resize_dims: List[int],
-        dali_config: Union[dict, DictConfig] = None,
-        imgaug: Optional[str] = "default",
-        num_threads: int = 1,
-    ) -> None:
-
-        # determine if we have a multiview pipeline
-        if isinstance(filenames, list) and isinstance(filenames[0], list):
-            self.multiview = True
-        else:
-            self.multiview = False
-
-        # make sure `filenames` is a list of existing video files
-        if isinstance(filenames, list) and isinstance(filenames[0], str):
-            filenames = [filenames]
-        for view_list in filenames:
-            for vid in view_list:
-                if not os.path.exists(vid) or not os.path.isfile(vid):
-                    raise FileNotFoundError(f"{vid} is not a video file!")
-
-        self.train_stage = train_stage
-        self.model_type = model_type
-        self.filenames = filenames
-        self.resize_dims = resize_dims
-        self.dali_config = dali_config
-        self.num_threads = num_threads
-        self.frame_count = count_frames(self.filenames)
-        self._pipe_dict: dict = self._setup_pipe_dict(self.filenames, imgaug)
-
-    @property
-    def num_iters(self) -> int:
-        # count frames
-        # "how many times should we enumerate the data loader?"
-        # sum across vids
-        pipe_dict = self._pipe_dict[self.train_stage][self.model_type]
-        if self.model_type == "base":
-            return int(np.ceil(self.frame_count / (pipe_dict["sequence_length"])))
-        elif self.model_type == "context":
-            if pipe_dict["step"] == 1:  # 0-5, 1-6, 2-7, 3-8, 4-9 ...
-                return int(np.ceil(self.frame_count / (pipe_dict["batch_size"])))
-            elif pipe_dict["step"] == pipe_dict["sequence_length"]:
-                # taking the floor because during training we don't care about missing the last
-                # non-full batch. we prefer having fewer batches but valid.
-                return int(
-                    np.floor(
-                        self.frame_count / (pipe_dict["batch_size"] * pipe_dict["sequence_length"])
-                    )
-                )
-            elif (pipe_dict["batch_size"] == 1) and (
-                pipe_dict["step"] == (pipe_dict["sequence_length"] - 4)
-            ):
-                # the case of prediction with a single sequence at a time and internal model
-                # reshapes
-                if pipe_dict["step"] <= 0:
-                    raise ValueError(
-                        "step cannot be 0, please modify "
-                        "cfg.dali.context.predict.sequence_length to be > 4"
-                    )
-                # remove the first sequence
-                data_except_first_batch = self.frame_count - pipe_dict["sequence_length"]
-                # calculate how many "step"s are needed to get at least to the end
-                # count back the first sequence
-                num_iters = int(np.ceil(data_except_first_batch / pipe_dict["step"])) + 1
-                return num_iters
-            else:
-                raise NotImplementedError
-
-    def _setup_pipe_dict(
-        self,
-        filenames: Union[List[str], List[List[str]]],
-        imgaug: str,
-    ) -> Dict[str, dict]:
-        """All of the pipeline args in one place."""
-
-        dict_args = {
-            "predict": {"context": {}, "base": {}},
-            "train": {"context": {}, "base": {}},
-        }
-        gen_cfg = self.dali_config["general"]
-
-        # base (vanilla single-frame model), train pipe args
-        base_train_cfg = self.dali_config["base"]["train"]
-        dict_args["train"]["base"] = {
-            "filenames": filenames,
-            "resize_dims": self.resize_dims,
-            "sequence_length": base_train_cfg["sequence_length"],
-            "step": base_train_cfg["sequence_length"],
-            "batch_size": 1,
-            "seed": gen_cfg["seed"],
-            "num_threads": self.num_threads,
-            "device_id": 0,
-            "random_shuffle": True,
-            "device": "gpu",
-            "imgaug": imgaug,
-        }
-
-        # base (vanilla single-frame model), predict pipe args
-        base_pred_cfg = self.dali_config["base"]["predict"]
-        dict_args["predict"]["base"] = {
-            "filenames": filenames,
-            "resize_dims": self.resize_dims,
-            "sequence_length": base_pred_cfg["sequence_length"],
-            "step": base_pred_cfg["sequence_length"],
-            "batch_size": 1,
-            "seed": gen_cfg["seed"],
-            "num_threads": self.num_threads,
-            "device_id": 0,
-            "random_shuffle": False,
-            "device": "gpu",
-            "name": "reader",
-            "pad_sequences": True,
-            "imgaug": "default",  # no imgaug when predicting
-        }
-
-        # context (five-frame) model, predict pipe args
-        context_pred_cfg = self.dali_config["context"]["predict"]
-        dict_args["predict"]["context"] = {
-            "filenames": filenames,
-            "resize_dims": self.resize_dims,
-            "sequence_length": context_pred_cfg["sequence_length"],
-            "step": context_pred_cfg["sequence_length"] - 4,
-            "batch_size": 1,
-            "num_threads": self.num_threads,
-            "device_id": 0,
-            "random_shuffle": False,
-            "device": "gpu",
-            "name": "reader",
-            "seed": gen_cfg["seed"],
-            "pad_sequences": True,
-            # "pad_last_batch": True,
-            "imgaug": "default",  # no imgaug when predicting
-        }
-
-        # context (five-frame) model, train pipe args
-        # grab a single sequence of frames, will resize into 5-frame chunks at the
-        # representation level inside BaseFeatureExtractor
-        # note: reusing the batch size argument
-        context_train_cfg = self.dali_config["context"]["train"]
-        dict_args["train"]["context"] = {
-            "filenames": filenames,
-            "resize_dims": self.resize_dims,
-            "sequence_length": context_train_cfg["batch_size"],
-            "step": context_train_cfg["batch_size"],
-            "batch_size": 1,
-            "seed": gen_cfg["seed"],
-            "num_threads": self.num_threads,
-            "device_id": 0,
-            "random_shuffle": True,
-            "device": "gpu",
-            "imgaug": imgaug,
-        }
-        # our floor above should prevent us from getting to the very final batch.
-
-        return dict_args
-
     def _get_dali_pipe(self):
         """
         Return a DALI pipe with predefined args.
@@ -1,7 +1,6 @@
 """Data modules split a dataset into train, val, and test modules."""
 
-import copy
-from typing import List, Literal, Optional, Union
+from typing import Callable, List, Literal, Optional, Union
 
 import imgaug.augmenters as iaa
 import lightning.pytorch as pl
@@ -10,7 +9,10 @@ from lightning.pytorch.utilities import CombinedLoader
 from omegaconf import DictConfig
 from torch.utils.data import DataLoader, Subset, random_split
 
-from lightning_pose.data.dali import PrepareDALI
+from lightning_pose.data.augmentations import BatchAugmentationCollate, TorchAugmentation
+from lightning_pose.data.datasets import BaseTrackingDataset
+from lightning_pose.data.opencv import get_video_preparer
+from lightning_pose.data.shards import ShardedLabeledDataset
 from lightning_pose.data.utils import (
     SemiSupervisedDataLoaderDict,
     compute_num_train_frames,
@@ -42,6 +44,10 @@ class BaseDataModule(pl.LightningDataModule):
         test_probability: Optional[float] = None,
         train_frames: Optional[Union[float, int]] = None,
         torch_seed: int = 42,
+        batch_augmentation: bool = False,
+        torch_augmentation: Optional[TorchAugmentation] = None,
+        heatmaps_on_device: bool = False,
+        label_shard_dir: Optional[str] = None,
     ) -> None:
         """Data module splits a dataset into train, val, and test data loaders.
 
@@ -60,6 +66,17 @@ class BaseDataModule(pl.LightningDataModule):
                 (exclusive) and defines the fraction of the initially selected
                 train frames
             torch_seed: control data splits
+            batch_augmentation: augment each training batch with a single imgaug call in the
+                collate function rather than one call per frame in the dataset; only supported
+                for single-view datasets without context frames
+            torch_augmentation: if not None, training datasets only resize frames and this
+                pipeline augments each training batch after it is transferred to the device;
+                only supported for single-view datasets
+            heatmaps_on_device: heatmap datasets only return keypoints, and heatmap targets are
+                generated for each batch after it is transferred to the device
+            label_shard_dir: if not None, stream training frames from the tar shards in this
+                directory (see `lightning_pose.data.shards`) instead of reading one image file per
+                frame; only supported for single-view datasets without context frames
 
         """
         super().__init__()
@@ -76,9 +93,33 @@ class BaseDataModule(pl.LightningDataModule):
         self.val_dataset = None  # populated by self.setup()
         self.test_dataset = None  # populated by self.setup()
         self.torch_seed = torch_seed
+        self.batch_augmentation = batch_augmentation
+        self.torch_augmentation = torch_augmentation
+        self.heatmaps_on_device = heatmaps_on_device
+        self.label_shard_dir = label_shard_dir
+
+    def _split_dataset(self, imgaug_transform: Callable) -> torch.utils.data.Dataset:
+        """Return a shallow copy of the dataset for one or more splits.
+
+        Flags are only set on the copy, so that the dataset passed by the caller is not modified.
+
+        """
+        dataset = self.dataset.with_transform(imgaug_transform)
+        if self.heatmaps_on_device and hasattr(dataset, "return_heatmaps"):
+            # heatmaps are computed in on_after_batch_transfer instead
+            dataset.return_heatmaps = False
+        return dataset
 
     def setup(self, stage: Optional[str] = None) -> None:  # stage arg needed for ptl
 
+        if self.torch_augmentation is not None \
+                and not isinstance(self.dataset, BaseTrackingDataset):
+            print(
+                "torch augmentation backend is only supported for single-view datasets; "
+                "using imgaug"
+            )
+            self.torch_augmentation = None
+
         datalen = self.dataset.__len__()
         print(f"Number of labeled images in the full dataset (train+val+test): {datalen}")
 
@@ -93,29 +134,49 @@ class BaseDataModule(pl.LightningDataModule):
         if len(self.dataset.imgaug_transform) == 1:
             # no augmentations in the pipeline; subsets can share same underlying dataset
             self.train_dataset, self.val_dataset, self.test_dataset = random_split(
-                self.dataset,
+                self._split_dataset(self.dataset.imgaug_transform),
                 data_splits_list,
                 generator=torch.Generator().manual_seed(self.torch_seed),
             )
         else:
             # augmentations in the pipeline; we want validation and test datasets that only resize
             # we can't simply change the imgaug pipeline in the datasets after they've been split
-            # because the subsets actually point to the same underlying dataset, so we create
-            # separate datasets here
+            # because the subsets actually point to the same underlying dataset, so each split
+            # gets a shallow copy of the dataset that shares all labels and frames but carries its
+            # own imgaug pipeline
             train_idxs, val_idxs, test_idxs = random_split(
                 range(len(self.dataset)),
                 data_splits_list,
                 generator=torch.Generator().manual_seed(self.torch_seed),
             )
 
-            self.train_dataset = Subset(copy.deepcopy(self.dataset), indices=list(train_idxs))
-            self.val_dataset = Subset(copy.deepcopy(self.dataset), indices=list(val_idxs))
-            self.test_dataset = Subset(copy.deepcopy(self.dataset), indices=list(test_idxs))
-
             # only use the final resize transform for the validation and test datasets
             resize_transform = iaa.Sequential([self.dataset.imgaug_transform[-1]])
-            self.val_dataset.dataset.imgaug_transform = resize_transform
-            self.test_dataset.dataset.imgaug_transform = resize_transform
+            if self.torch_augmentation is not None:
+                # training batches are augmented after transfer to the device
+                train_transform = resize_transform
+            else:
+                train_transform = self.dataset.imgaug_transform
+
+            self.train_dataset = Subset(
+                self._split_dataset(train_transform), indices=list(train_idxs),
+            )
+            self.val_dataset = Subset(
+                self._split_dataset(resize_transform), indices=list(val_idxs),
+            )
+            self.test_dataset = Subset(
+                self._split_dataset(resize_transform), indices=list(test_idxs),
+            )
+
+            if self.torch_augmentation is None and self.batch_augmentation:
+                # defer training augmentations to the collate function
+                if isinstance(self.dataset, BaseTrackingDataset) and not self.dataset.do_context:
+                    self.train_dataset.dataset.return_raw_images = True
+                else:
+                    print(
+                        "batch augmentation is only supported for single-view datasets without "
+                        "context frames; augmenting frames individually"
+                    )
 
         # further subsample training data if desired
         if self.train_frames is not None:
@@ -126,6 +187,20 @@ class BaseDataModule(pl.LightningDataModule):
                 # train_frames
                 self.train_dataset.indices = self.train_dataset.indices[:n_frames]
 
+        if self.label_shard_dir is not None:
+            if isinstance(self.dataset, BaseTrackingDataset) and not self.dataset.do_context:
+                # read training frames sequentially from a few large files
+                self.train_dataset = ShardedLabeledDataset(
+                    dataset=self.train_dataset.dataset,
+                    shard_dir=self.label_shard_dir,
+                    indices=list(self.train_dataset.indices),
+                )
+            else:
+                print(
+                    "label shards are only supported for single-view datasets without context "
+                    "frames; reading individual image files"
+                )
+
         print(
             f"Dataset splits -- "
             f"train: {len(self.train_dataset)}, "
@@ -134,14 +209,49 @@ class BaseDataModule(pl.LightningDataModule):
         )
 
     def train_dataloader(self) -> torch.utils.data.DataLoader:
+        if getattr(self.train_dataset.dataset, "return_raw_images", False):
+            collate_fn = BatchAugmentationCollate(self.train_dataset.dataset)
+        else:
+            collate_fn = None
         return DataLoader(
             self.train_dataset,
             batch_size=self.train_batch_size,
             num_workers=self.num_workers,
             persistent_workers=True if self.num_workers > 0 else False,
-            shuffle=True,
+            # streaming datasets shuffle internally
+            shuffle=not isinstance(self.train_dataset, ShardedLabeledDataset),
             generator=torch.Generator().manual_seed(self.torch_seed),
+            collate_fn=collate_fn,
+        )
+
+    def on_after_batch_transfer(self, batch: dict, dataloader_idx: int) -> dict:
+        # semi-supervised batches contain labeled and unlabeled data; only modify the former
+        labeled_batch = batch["labeled"] if "labeled" in batch else batch
+        if self.torch_augmentation is not None and self.trainer is not None \
+                and self.trainer.training:
+            self.augment_labeled_batch(labeled_batch)
+        if self.heatmaps_on_device and hasattr(self.dataset, "compute_batch_heatmaps") \
+                and "keypoints" in labeled_batch and "heatmaps" not in labeled_batch:
+            labeled_batch["heatmaps"] = self.dataset.compute_batch_heatmaps(
+                labeled_batch["keypoints"]
+            )
+        return batch
+
+    def augment_labeled_batch(self, batch: dict) -> dict:
+        """Apply the torch augmentation pipeline to a labeled batch in place."""
+        # bbox is (x, y, height, width) of the original frame; pixel-sized augmentation
+        # parameters are rescaled by the (geometric mean) resize ratio
+        height, width = batch["images"].shape[-2:]
+        bbox = batch["bbox"].to(batch["images"].dtype)
+        scale = torch.sqrt(height / bbox[:, 2] * width / bbox[:, 3])
+        images, keypoints = self.torch_augmentation(
+            images=batch["images"], keypoints=batch["keypoints"], scale=scale,
         )
+        batch["images"] = images
+        batch["keypoints"] = keypoints
+        if "heatmaps" in batch:
+            batch["heatmaps"] = self.dataset.compute_batch_heatmaps(keypoints)
+        return batch
 
     def val_dataloader(self) -> torch.utils.data.DataLoader:
         return DataLoader(
@@ -185,6 +295,10 @@ class UnlabeledDataModule(BaseDataModule):
         train_frames: Optional[float] = None,
         torch_seed: int = 42,
         imgaug: Literal["default", "dlc", "dlc-top-down"] = "default",
+        batch_augmentation: bool = False,
+        torch_augmentation: Optional[TorchAugmentation] = None,
+        heatmaps_on_device: bool = False,
+        label_shard_dir: Optional[str] = None,
     ) -> None:
         """Data module that contains labeled and unlabeled data loaders.
 
@@ -209,6 +323,11 @@ class UnlabeledDataModule(BaseDataModule):
             torch_seed: control data splits
             torch_seed: control randomness of labeled data loading
             imgaug: type of image augmentation to apply to unlabeled frames
+            batch_augmentation: augment each labeled training batch with a single imgaug call
+            torch_augmentation: if not None, augment labeled training batches on the device with
+                this pipeline rather than with imgaug in the dataset
+            heatmaps_on_device: generate labeled heatmap targets per batch on the device
+            label_shard_dir: stream labeled training frames from the tar shards in this directory
 
         """
         super().__init__(
@@ -222,10 +341,16 @@ class UnlabeledDataModule(BaseDataModule):
             test_probability=test_probability,
             train_frames=train_frames,
             torch_seed=torch_seed,
+            batch_augmentation=batch_augmentation,
+            torch_augmentation=torch_augmentation,
+            heatmaps_on_device=heatmaps_on_device,
+            label_shard_dir=label_shard_dir,
         )
         self.video_paths_list = video_paths_list
         self.filenames = check_video_paths(self.video_paths_list, view_names=view_names)
-        self.num_workers_for_unlabeled = 1  # WARNING!! do not increase above 1, weird behavior
+        # WARNING!! do not increase above 1, weird behavior with dali; the opencv backend instead
+        # decodes in `dali.general.num_workers` processes
+        self.num_workers_for_unlabeled = 1
         self.dali_config = dali_config
         self.unlabeled_dataloader = None  # initialized in setup_unlabeled
         self.imgaug = imgaug
@@ -236,7 +361,7 @@ class UnlabeledDataModule(BaseDataModule):
 
     def setup_unlabeled(self) -> None:
         """Sets up the unlabeled data loader."""
-        dali_prep = PrepareDALI(
+        dali_prep = get_video_preparer(self.dali_config)(
             train_stage="train",
             model_type="context" if self.dataset.do_context else "base",
             filenames=self.filenames,
@@ -1,23 +1,33 @@
 """Dataset objects store images, labels, and functions for manipulation."""
 
+import copy
+import hashlib
 import os
-from typing import Callable, List, Literal, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Iterator, List, Literal, Optional, Tuple, Union
 
+import imgaug.augmenters as iaa
 import numpy as np
-import pandas as pd
 import torch
 from PIL import Image
 from torchtyping import TensorType
 from torchvision import transforms
 
 from lightning_pose.data import _IMAGENET_MEAN, _IMAGENET_STD
+from lightning_pose.data.frame_cache import SharedFrameCache
+from lightning_pose.data.frame_store import LabeledFrameStore
 from lightning_pose.data.utils import (
     BaseLabeledExampleDict,
     HeatmapLabeledExampleDict,
     MultiviewHeatmapLabeledExampleDict,
     generate_heatmaps,
 )
-from lightning_pose.utils.io import get_keypoint_names
+from lightning_pose.data.video import (
+    VideoFrameReader,
+    split_video_frame_name,
+    video_frame_name,
+)
+from lightning_pose.utils.io import get_keypoint_names, load_label_csv
 
 # to ignore imports for sphix-autoapidoc
 __all__ = [
@@ -39,7 +49,10 @@ class BaseTrackingDataset(torch.utils.data.Dataset):
         header_rows: Optional[List[int]] = [0, 1, 2],
         imgaug_transform: Optional[Callable] = None,
         do_context: bool = False,
-        delimiter: str = "img"
+        delimiter: str = "img",
+        frame_store_dir: Optional[str] = None,
+        reduced_resolution_decode: bool = False,
+        frame_cache_bytes: Optional[int] = None,
     ) -> None:
         """Initialize a dataset for regression (rather than heatmap) models.
 
@@ -60,6 +73,15 @@ class BaseTrackingDataset(torch.utils.data.Dataset):
             header_rows: which rows in the csv are header rows
             imgaug_transform: imgaug transform pipeline to apply to images
             do_context: include additional frames of context if possible.
+            frame_store_dir: if not None, decode all labeled (and context) frames once and store
+                them in a memory-mapped array in this directory; subsequent reads (in every epoch
+                and every data loader worker) are served from the store instead of the image files
+            reduced_resolution_decode: decode jpeg frames at the smallest power-of-two reduction
+                (1/2, 1/4, 1/8) that is not smaller than the final resize dimensions; keypoints are
+                rescaled to match
+            frame_cache_bytes: if not None, keep up to this many bytes of decoded frames in a
+                least-recently-used cache in shared memory that is visible to all data loader
+                workers; ignored if `frame_store_dir` is set
 
         """
         self.root_directory = root_directory
@@ -68,6 +90,8 @@ class BaseTrackingDataset(torch.utils.data.Dataset):
         self.imgaug_transform = imgaug_transform
         self.do_context = do_context
         self.delimiter = delimiter
+        self.frame_store_dir = frame_store_dir
+        self.reduced_resolution_decode = reduced_resolution_decode
 
         # load csv data
         if os.path.isfile(csv_path):
@@ -77,7 +101,7 @@ class BaseTrackingDataset(torch.utils.data.Dataset):
         if not os.path.exists(csv_file):
             raise FileNotFoundError(f"Could not find csv file at {csv_file}!")
 
-        csv_data = pd.read_csv(csv_file, header=header_rows, index_col=0)
+        csv_data = load_label_csv(csv_file, header_rows=list(header_rows))
         self.keypoint_names = get_keypoint_names(csv_file=csv_file, header_rows=header_rows)
         self.image_names = list(csv_data.index)
         self.keypoints = torch.tensor(csv_data.to_numpy(), dtype=torch.float32)
@@ -90,6 +114,9 @@ class BaseTrackingDataset(torch.utils.data.Dataset):
             transforms.Normalize(mean=_IMAGENET_MEAN, std=_IMAGENET_STD),
         ]
         self.pytorch_transform = transforms.Compose(pytorch_transform_list)
+        # normalization constants for stacks of context frames
+        self._imagenet_mean = torch.tensor(_IMAGENET_MEAN).view(1, 3, 1, 1)
+        self._imagenet_std = torch.tensor(_IMAGENET_STD).view(1, 3, 1, 1)
 
         # keypoints has been already transformed above
         self.num_targets = self.keypoints.shape[1] * 2
@@ -97,6 +124,197 @@ class BaseTrackingDataset(torch.utils.data.Dataset):
 
         self.data_length = len(self.image_names)
 
+        # if True, skip augmentation and return decoded uint8 frames with (num_keypoints, 2)
+        # keypoints; augmentation is then applied to full batches by BatchAugmentationCollate
+        self.return_raw_images = False
+
+        # labeled frames may also be referenced as "<video file>:<frame index>" and are then read
+        # directly from the video
+        self.video_reader = VideoFrameReader()
+
+        # resolve context frames once; self.frame_names lists every frame that can be loaded, and
+        # row i of self.context_idxs indexes frames t-2, ..., t+2 of labeled frame i
+        if do_context:
+            self.frame_names, self.context_idxs = self._build_context_index()
+        else:
+            self.frame_names = list(self.image_names)
+            self.context_idxs = None
+
+        # frames are decoded at reduced resolution only if the final resize is known
+        if reduced_resolution_decode and imgaug_transform is not None:
+            self.decode_size = (self.width, self.height)
+        else:
+            self.decode_size = None
+
+        # decode labeled (and context) frames once and serve them from disk-backed memory
+        if frame_store_dir is not None:
+            self.frame_store = LabeledFrameStore(
+                store_dir=frame_store_dir,
+                root_directory=root_directory,
+                image_names=self.frame_names,
+                csv_file=csv_file,
+                decode_fn=self._decode_image,
+                decode_options=f"decode_size={self.decode_size}",
+            )
+        else:
+            self.frame_store = None
+
+        # keep decoded frames in memory shared by all data loader workers
+        if frame_cache_bytes is not None and self.frame_store is None:
+            # slots are sized by the first decoded frame; all frames usually share the same size
+            first_frame, _ = self._decode_image(os.path.join(root_directory, self.frame_names[0]))
+            self.frame_cache = SharedFrameCache(
+                frame_names=self.frame_names,
+                max_bytes=frame_cache_bytes,
+                frame_bytes=first_frame.nbytes,
+            )
+            print(
+                f"Caching up to {self.frame_cache.num_slots} of {len(self.frame_names)} decoded "
+                f"frames in memory"
+            )
+        else:
+            self.frame_cache = None
+
+    def _get_context_names(self, img_name: str) -> List[str]:
+        """Return the relative paths of frames t-2, ..., t+2 around a labeled frame."""
+        video_frame = split_video_frame_name(img_name)
+        if video_frame is not None:
+            video_file, idx_img = video_frame
+            # replace frame number with 0 if we're at the beginning of the video
+            return [
+                video_frame_name(video_file, max(0, fr_num))
+                for fr_num in range(idx_img - 2, idx_img + 3)
+            ]
+        # get index of the image
+        idx_img_basename = os.path.basename(img_name)
+        idx_img_basename_delimated = idx_img_basename.split(self.delimiter)[-1]
+        idx_img_str = idx_img_basename_delimated.split(".")[0]
+        # figure out length of integer
+        idx_img = int(idx_img_str)
+        int_len = len(idx_img_str)
+        # get the frames -> t-2, t-1, t, t+1, t + 2
+        list_idx = [idx_img - 2, idx_img - 1, idx_img, idx_img + 1, idx_img + 2]
+        list_img_names = []
+        for fr_num in list_idx:
+            # replace frame number with 0 if we're at the beginning of the video
+            fr_num = max(0, fr_num)
+            # split name into pieces
+            img_pieces = img_name.split("/")
+            # replace original frame number with context frame number
+            fr_num = str(fr_num)
+            if len(fr_num) > int_len:
+                fr_num = fr_num.zfill(int_len + 1)
+            else:
+                fr_num = fr_num.zfill(int_len)
+            img_pieces[-1] = img_pieces[-1].replace(idx_img_str, fr_num)
+            list_img_names.append("/".join(img_pieces))
+        return list_img_names
+
+    def _build_context_index(self) -> Tuple[List[str], np.ndarray]:
+        """Find the context frames of all labeled frames, reverting to the center frame if missing.
+
+        Each directory is listed once rather than checking every context frame for existence,
+        which keeps the number of filesystem calls small on network file systems.
+
+        Returns:
+            tuple
+                - list of relative paths to all labeled and context frames; labeled frames first
+                - context frame indices into this list, shape (n_labeled_frames, 5)
+
+        """
+        dir_contents = {}
+
+        def _exists(name: str) -> bool:
+            video_frame = split_video_frame_name(name)
+            if video_frame is not None:
+                video_file, frame_idx = video_frame
+                video_file = os.path.join(self.root_directory, video_file)
+                return frame_idx < self.video_reader.num_frames(video_file)
+            dirname, basename = os.path.split(os.path.join(self.root_directory, name))
+            if dirname not in dir_contents:
+                try:
+                    dir_contents[dirname] = set(os.listdir(dirname or "."))
+                except FileNotFoundError:
+                    dir_contents[dirname] = set()
+            return basename in dir_contents[dirname]
+
+        frame_names = list(self.image_names)
+        name_to_idx = {name: i for i, name in enumerate(frame_names)}
+        context_idxs = np.zeros((self.data_length, 5), dtype=np.int64)
+        for idx, img_name in enumerate(self.image_names):
+            for j, name in enumerate(self._get_context_names(img_name)):
+                if name not in name_to_idx:
+                    if not _exists(name):
+                        # revert to center frame
+                        context_idxs[idx, j] = idx
+                        continue
+                    name_to_idx[name] = len(frame_names)
+                    frame_names.append(name)
+                context_idxs[idx, j] = name_to_idx[name]
+        return frame_names, context_idxs
+
+    def _decode_image(
+        self, file_name: Union[str, BinaryIO],
+    ) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """Decode an image file (path or file object) into a (height, width, 3) uint8 array.
+
+        Paths of the form "<video file>:<frame index>" are read from the video.
+
+        Returns:
+            tuple
+                - decoded image
+                - original (height, width) of the image file
+
+        """
+        video_frame = split_video_frame_name(file_name) if isinstance(file_name, str) else None
+        if video_frame is not None:
+            image = self.video_reader.read(*video_frame)
+            return image, image.shape[:2]
+        with Image.open(file_name) as img:
+            original_shape = (img.height, img.width)
+            if self.decode_size is not None:
+                # scaled decoding in the DCT domain; no-op for formats other than jpeg
+                img.draft("RGB", self.decode_size)
+            # if 1 color channel, change to 3.
+            image = np.asarray(img.convert("RGB"))
+        return image, original_shape
+
+    def _read_image(self, img_name: str) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """Return a (height, width, 3) uint8 array for an image path relative to the root.
+
+        Returns:
+            tuple
+                - decoded image
+                - original (height, width) of the image file
+
+        """
+        if self.frame_store is not None and img_name in self.frame_store:
+            return self.frame_store[img_name], self.frame_store.original_shape(img_name)
+        if self.frame_cache is not None:
+            cached = self.frame_cache.get(img_name)
+            if cached is not None:
+                return cached
+            image, original_shape = self._decode_image(
+                os.path.join(self.root_directory, img_name)
+            )
+            self.frame_cache.put(img_name, image, original_shape)
+            return image, original_shape
+        return self._decode_image(os.path.join(self.root_directory, img_name))
+
+    @staticmethod
+    def _rescale_keypoints(
+        keypoints: TensorType["num_keypoints", 2],
+        image: np.ndarray,
+        original_shape: Tuple[int, int],
+    ) -> TensorType["num_keypoints", 2]:
+        """Map keypoints from original image coordinates to those of a reduced-size decode."""
+        if image.shape[:2] == original_shape:
+            return keypoints
+        scale = torch.tensor([
+            image.shape[1] / original_shape[1], image.shape[0] / original_shape[0],
+        ])
+        return keypoints * scale
+
     @property
     def height(self) -> int:
         # assume resizing transformation is the last imgaug one
@@ -107,98 +325,187 @@ class BaseTrackingDataset(torch.utils.data.Dataset):
         # assume resizing transformation is the last imgaug one
         return self.imgaug_transform[-1].get_parameters()[0][1].value
 
+    def get_resized_keypoints(
+        self, idxs: Optional[List[int]] = None,
+    ) -> TensorType["num_frames", "num_keypoints", 2]:
+        """Keypoints after the final resize, computed from the image sizes without decoding.
+
+        Args:
+            idxs: indices of the labeled frames to return; defaults to all frames
+
+        Returns:
+            keypoints in the coordinates of the resized frames
+
+        """
+        if idxs is None:
+            idxs = list(range(self.data_length))
+        # indexing with a list returns a copy
+        keypoints = self.keypoints[idxs]
+        if self.imgaug_transform is None:
+            return keypoints
+        for i, idx in enumerate(idxs):
+            img_name = self.image_names[idx]
+            video_frame = split_video_frame_name(img_name)
+            if self.frame_store is not None and img_name in self.frame_store:
+                orig_height, orig_width = self.frame_store.original_shape(img_name)
+            elif video_frame is not None:
+                orig_height, orig_width = self.video_reader.frame_shape(
+                    os.path.join(self.root_directory, video_frame[0])
+                )
+            else:
+                # only reads the image header
+                with Image.open(os.path.join(self.root_directory, img_name)) as img:
+                    orig_width, orig_height = img.size
+            keypoints[i, :, 0] *= self.width / orig_width
+            keypoints[i, :, 1] *= self.height / orig_height
+        return keypoints
+
+    def with_transform(self, imgaug_transform: Optional[Callable]) -> "BaseTrackingDataset":
+        """Return a shallow copy of the dataset that uses a different imgaug pipeline.
+
+        The copy shares image names, keypoints, context indices and the frame store with the
+        original dataset; only the pipeline and flags such as `return_raw_images` are its own.
+
+        """
+        dataset = copy.copy(self)
+        dataset.imgaug_transform = imgaug_transform
+        return dataset
+
     def __len__(self) -> int:
         return self.data_length
 
+    def example_from_image(
+        self,
+        image: np.ndarray,
+        keypoints: TensorType["num_keypoints", 2],
+        original_shape: Tuple[int, int],
+        idx: int,
+    ) -> BaseLabeledExampleDict:
+        """Build an example from a decoded frame and its labels, e.g. when streaming shards.
+
+        Args:
+            image: decoded (height, width, 3) uint8 frame
+            keypoints: labels in the coordinates of the original image file
+            original_shape: (height, width) of the original image file
+            idx: index of the labeled frame in the dataset
+
+        Returns:
+            example dict, identical to the one returned by `__getitem__` without context frames
+
+        """
+        return self._transform_example(image, keypoints, original_shape, idx)
+
+    def _transform_example(
+        self,
+        image: np.ndarray,
+        keypoints: TensorType["num_keypoints", 2],
+        original_shape: Tuple[int, int],
+        idx: int,
+    ) -> BaseLabeledExampleDict:
+        """Apply the imgaug pipeline and normalization to a single decoded frame."""
+        keypoints_on_image = self._rescale_keypoints(keypoints, image, original_shape)
+        if self.return_raw_images:
+            return BaseLabeledExampleDict(
+                images=image,  # shape (img_height, img_width, 3), uint8
+                keypoints=keypoints_on_image,  # shape (n_keypoints, 2)
+                idxs=idx,
+                bbox=torch.tensor([0, 0, original_shape[0], original_shape[1]]),
+            )
+        if self.imgaug_transform is not None:
+            transformed_images, transformed_keypoints = self.imgaug_transform(
+                images=np.expand_dims(image, axis=0),
+                keypoints=np.expand_dims(keypoints_on_image, axis=0),
+            )  # expands add batch dim for imgaug
+            # get rid of the batch dim
+            transformed_images = transformed_images[0]
+            transformed_keypoints = transformed_keypoints[0].reshape(-1)
+        else:
+            transformed_images = np.expand_dims(image, axis=0)
+            transformed_keypoints = np.expand_dims(keypoints_on_image, axis=0)
+
+        transformed_images = self.pytorch_transform(transformed_images)
+
+        assert transformed_keypoints.shape == (self.num_targets,)
+
+        return BaseLabeledExampleDict(
+            images=transformed_images,  # shape (3, img_height, img_width)
+            keypoints=torch.from_numpy(transformed_keypoints),  # shape (n_targets,)
+            idxs=idx,
+            # x,y,h,w of bounding box
+            bbox=torch.tensor([0, 0, original_shape[0], original_shape[1]]),
+        )
+
+    def _augment_context_frames(
+        self, images: Tuple[np.ndarray, ...], keypoints: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Apply the imgaug pipeline with the same parameters to all context frames.
+
+        The frames are stacked along the channel axis, so that a single pass samples one set of
+        augmentation parameters for all of them. A final resize is applied to the frames
+        separately: opencv rounds differently when resizing more than 4 channels at once, and
+        the frames must match those of the per-frame pipeline.
+
+        Returns:
+            tuple
+                - augmented frames, shape (num_frames, height, width, 3)
+                - augmented keypoints, shape (num_keypoints, 2)
+
+        """
+        pipeline, resize = self.imgaug_transform, None
+        if isinstance(pipeline, iaa.Sequential) and not pipeline.random_order \
+                and len(pipeline) > 0 and isinstance(pipeline[-1], iaa.Resize):
+            pipeline, resize = iaa.Sequential(pipeline[:-1]), pipeline[-1]
+        num_frames = len(images)
+        stacked_images, stacked_keypoints = pipeline(
+            images=np.expand_dims(np.concatenate(images, axis=-1), axis=0),
+            keypoints=np.expand_dims(keypoints, axis=0),
+        )
+        height, width = stacked_images[0].shape[:2]
+        frames = np.moveaxis(stacked_images[0].reshape(height, width, num_frames, 3), 2, 0)
+        keypoints = stacked_keypoints[0]
+        if resize is not None:
+            # the resize of this pipeline has a fixed output size, hence identical parameters for
+            # all frames; keypoints are transformed along with the center frame
+            frames = np.stack(resize(images=list(frames)))
+            _, resized_keypoints = resize(
+                images=frames[2:3], keypoints=np.expand_dims(keypoints, axis=0),
+            )
+            keypoints = resized_keypoints[0]
+        return np.ascontiguousarray(frames), keypoints
+
     def __getitem__(self, idx: int) -> BaseLabeledExampleDict:
         img_name = self.image_names[idx]
         keypoints_on_image = self.keypoints[idx]
 
         if not self.do_context:
             # read image from file and apply transformations (if any)
-            file_name = os.path.join(self.root_directory, img_name)
-            # if 1 color channel, change to 3.
-            image = Image.open(file_name).convert("RGB")
-            if self.imgaug_transform is not None:
-                transformed_images, transformed_keypoints = self.imgaug_transform(
-                    images=np.expand_dims(image, axis=0),
-                    keypoints=np.expand_dims(keypoints_on_image, axis=0),
-                )  # expands add batch dim for imgaug
-                # get rid of the batch dim
-                transformed_images = transformed_images[0]
-                transformed_keypoints = transformed_keypoints[0].reshape(-1)
-            else:
-                transformed_images = np.expand_dims(image, axis=0)
-                transformed_keypoints = np.expand_dims(keypoints_on_image, axis=0)
-
-            transformed_images = self.pytorch_transform(transformed_images)
+            image, original_shape = self._read_image(img_name)
+            return self._transform_example(image, keypoints_on_image, original_shape, idx)
 
         else:
-            # get index of the image
-            # idx_img = img_name.split("/")[-1].replace("img", "")
-            idx_img_basename = os.path.basename(img_name)
-            idx_img_basename_delimated = idx_img_basename.split(self.delimiter)[-1]
-            # image_format = idx_img.split('.')[-1]
-            idx_img_str = idx_img_basename_delimated.split('.')[0]
-            # figure out length of integer
-            idx_img = int(idx_img_str)
-            int_len = len(idx_img_str)
-            # get the frames -> t-2, t-1, t, t+1, t + 2
-            list_idx = [idx_img - 2, idx_img - 1, idx_img, idx_img + 1, idx_img + 2]
-            list_img_names = []
-            for fr_num in list_idx:
-                # replace frame number with 0 if we're at the beginning of the video
-                fr_num = max(0, fr_num)
-                # split name into pieces
-                img_pieces = img_name.split("/")
-                # replace original frame number with context frame number
-                fr_num = str(fr_num)
-                if len(fr_num) > int_len:
-                    fr_num = fr_num.zfill(int_len + 1)
-                else:
-                    fr_num = fr_num.zfill(int_len)
-                img_pieces[-1] = img_pieces[-1].replace(idx_img_str, fr_num)
-                list_img_names.append("/".join(img_pieces))
-            # read the images from image list to create dataset
-            images = []
-            for name in list_img_names:
-                # read image from file and apply transformations (if any)
-                file_name = os.path.join(self.root_directory, name)
-                if not os.path.exists(file_name):
-                    # revert to center frame
-                    file_name = os.path.join(self.root_directory, list_img_names[2])
-                # if 1 color channel, change to 3.
-                image = Image.open(file_name).convert("RGB")
-                images.append(np.asarray(image))
+            # read the images from the precomputed list of context frames
+            images, original_shapes = zip(*[
+                self._read_image(self.frame_names[i]) for i in self.context_idxs[idx]
+            ])
+            image = images[2]
+            original_shape = original_shapes[2]
+            keypoints_on_image = self._rescale_keypoints(keypoints_on_image, image, original_shape)
 
             # apply data aug pipeline
             if self.imgaug_transform is not None:
-                # need to apply the same transform to all context frames
-                seed = np.random.randint(low=0, high=123456)
-                transformed_images = []
-                for img in images:
-                    self.imgaug_transform.seed_(seed)
-                    transformed_image, transformed_keypoints = self.imgaug_transform(
-                        images=[img], keypoints=[keypoints_on_image.numpy()]
-                    )
-                    transformed_images.append(transformed_image[0])
-                transformed_images = np.asarray(transformed_images)
-                transformed_keypoints = transformed_keypoints[0].reshape(-1)
+                frames, transformed_keypoints = self._augment_context_frames(
+                    images, keypoints_on_image.numpy(),
+                )
+                transformed_keypoints = transformed_keypoints.reshape(-1)
             else:
-                transformed_images = np.asarray(images)
+                frames = np.stack(images)
                 transformed_keypoints = keypoints_on_image.numpy().reshape(-1)
 
-            # send frames to tensors and normalize
-            # need to loop through because ToTensor transform only operates on single images
-            for i, transformed_image in enumerate(transformed_images):
-                transformed_image = self.pytorch_transform(transformed_image)
-                if i == 0:
-                    image_frames_tensor = torch.unsqueeze(transformed_image, dim=0)
-                else:
-                    image_expand = torch.unsqueeze(transformed_image, dim=0)
-                    image_frames_tensor = torch.cat(
-                        (image_frames_tensor, image_expand), dim=0
-                    )
+            # send frames to a preallocated (5, 3, height, width) tensor and normalize
+            height, width = frames.shape[1:3]
+            image_frames_tensor = torch.empty((len(images), 3, height, width))
+            image_frames_tensor.copy_(torch.from_numpy(frames).permute(0, 3, 1, 2))
+            image_frames_tensor.div_(255.0).sub_(self._imagenet_mean).div_(self._imagenet_std)
 
             transformed_images = image_frames_tensor
 
@@ -208,7 +515,8 @@ class BaseTrackingDataset(torch.utils.data.Dataset):
             images=transformed_images,  # shape (3, img_height, img_width) or (5, 3, H, W)
             keypoints=torch.from_numpy(transformed_keypoints),  # shape (n_targets,)
             idxs=idx,
-            bbox=torch.tensor([0, 0, image.height, image.width])  # x,y,h,w of bounding box
+            # x,y,h,w of bounding box
+            bbox=torch.tensor([0, 0, original_shape[0], original_shape[1]]),
         )
 
 
@@ -225,7 +533,10 @@ class HeatmapDataset(BaseTrackingDataset):
         downsample_factor: Literal[1, 2, 3] = 2,
         do_context: bool = False,
         uniform_heatmaps: bool = False,
-        delimiter: str = "img"
+        delimiter: str = "img",
+        frame_store_dir: Optional[str] = None,
+        reduced_resolution_decode: bool = False,
+        frame_cache_bytes: Optional[int] = None,
     ) -> None:
         """Initialize the Heatmap Dataset.
 
@@ -240,6 +551,12 @@ class HeatmapDataset(BaseTrackingDataset):
             downsample_factor: factor by which to downsample original image dims to have a smaller
                 heatmap
             do_context: include additional frames of context if possible
+            frame_store_dir: if not None, serve decoded frames from a memory-mapped store in this
+                directory; see BaseTrackingDataset
+            reduced_resolution_decode: decode jpeg frames at reduced resolution when the final
+                resize allows it; see BaseTrackingDataset
+            frame_cache_bytes: if not None, cache up to this many bytes of decoded frames in
+                shared memory; see BaseTrackingDataset
 
         """
         super().__init__(
@@ -248,7 +565,10 @@ class HeatmapDataset(BaseTrackingDataset):
             header_rows=header_rows,
             imgaug_transform=imgaug_transform,
             do_context=do_context,
-            delimiter=delimiter
+            delimiter=delimiter,
+            frame_store_dir=frame_store_dir,
+            reduced_resolution_decode=reduced_resolution_decode,
+            frame_cache_bytes=frame_cache_bytes,
         )
 
         if self.height % 128 != 0 or self.height % 128 != 0:
@@ -265,6 +585,10 @@ class HeatmapDataset(BaseTrackingDataset):
         self.num_targets = torch.numel(self.keypoints[0])
         self.num_keypoints = self.num_targets // 2
 
+        # if False, __getitem__ skips heatmap computation; heatmaps are then generated for full
+        # batches on the device with compute_batch_heatmaps
+        self.return_heatmaps = True
+
     @property
     def output_shape(self) -> tuple:
         return (
@@ -276,26 +600,32 @@ class HeatmapDataset(BaseTrackingDataset):
         self, example_dict: BaseLabeledExampleDict
     ) -> TensorType["num_keypoints", "heatmap_height", "heatmap_width"]:
         """Compute 2D heatmaps from arbitrary (x, y) coordinates."""
+        return self.compute_batch_heatmaps(example_dict["keypoints"].unsqueeze(0))[0]
+
+    def compute_batch_heatmaps(
+        self, keypoints: TensorType["batch", "num_targets"]
+    ) -> TensorType["batch", "num_keypoints", "heatmap_height", "heatmap_width"]:
+        """Compute 2D heatmaps for a batch of (x, y) coordinates on any device.
+
+        Keypoints that data augmentation has moved out of the frame are set to nan in place.
+
+        """
 
         # reshape
-        keypoints = example_dict["keypoints"].reshape(self.num_keypoints, 2)
+        keypoints = keypoints.reshape(keypoints.shape[0], self.num_keypoints, 2)
 
         # introduce new nans where data augmentation has moved the keypoint out of the original
         # frame
         new_nans = torch.logical_or(
-            torch.lt(keypoints[:, 0], torch.tensor(0)),
-            torch.lt(keypoints[:, 1], torch.tensor(0)),
-        )
-        new_nans = torch.logical_or(
-            new_nans, torch.ge(keypoints[:, 0], torch.tensor(self.width))
-        )
-        new_nans = torch.logical_or(
-            new_nans, torch.ge(keypoints[:, 1], torch.tensor(self.height))
+            torch.lt(keypoints[:, :, 0], 0),
+            torch.lt(keypoints[:, :, 1], 0),
         )
+        new_nans = torch.logical_or(new_nans, torch.ge(keypoints[:, :, 0], self.width))
+        new_nans = torch.logical_or(new_nans, torch.ge(keypoints[:, :, 1], self.height))
         keypoints[new_nans, :] = torch.nan
 
-        y_heatmap = generate_heatmaps(
-            keypoints=keypoints.unsqueeze(0),  # add batch dim
+        return generate_heatmaps(
+            keypoints=keypoints,
             height=self.height,
             width=self.width,
             output_shape=self.output_shape,
@@ -303,32 +633,111 @@ class HeatmapDataset(BaseTrackingDataset):
             uniform_heatmaps=self.uniform_heatmaps,
         )
 
-        return y_heatmap[0]
+    @property
+    def resize_only(self) -> bool:
+        """True if the imgaug pipeline is deterministic, i.e. only resizes frames."""
+        return self.imgaug_transform is None or len(self.imgaug_transform) == 1
+
+    def iter_heatmaps(self, chunk_size: int = 256) -> Iterator[Tuple[int, torch.Tensor]]:
+        """Compute 2D heatmaps for all labeled data in chunks of consecutive frames.
+
+        If the imgaug pipeline only resizes, keypoints are resized directly and frames are not
+        decoded; otherwise each frame is passed through the augmentation pipeline.
+
+        Args:
+            chunk_size: number of frames per chunk
+
+        Yields:
+            tuple
+                - index of the first frame in the chunk
+                - heatmaps of shape (chunk, num_keypoints, heatmap_height, heatmap_width)
 
-    def compute_heatmaps(self):
+        """
+        num_frames = len(self.image_names)
+        resized_keypoints = self.get_resized_keypoints() if self.resize_only else None
+        for start in range(0, num_frames, chunk_size):
+            idxs = range(start, min(start + chunk_size, num_frames))
+            if resized_keypoints is not None:
+                keypoints = resized_keypoints[start:idxs.stop]
+            else:
+                keypoints = torch.stack([
+                    BaseTrackingDataset.__getitem__(self, idx)["keypoints"] for idx in idxs
+                ])
+            yield start, self.compute_batch_heatmaps(keypoints.reshape(len(idxs), -1))
+
+    def compute_heatmaps(
+        self, chunk_size: int = 256, cache_dir: Optional[str] = None,
+    ) -> TensorType["num_frames", "num_keypoints", "heatmap_height", "heatmap_width"]:
         """Compute initial 2D heatmaps for all labeled data. Note this will apply augmentations.
 
         original image dims e.g., (406, 396) ->
         resized image dims e.g., (384, 384) ->
         potentially downsampled heatmaps e.g., (96, 96)
 
+        Args:
+            chunk_size: number of frames processed at once
+            cache_dir: if not None and the imgaug pipeline only resizes, heatmaps are written to a
+                memory-mapped file in this directory, which is reused by later calls with the same
+                labels and heatmap parameters; the returned tensor is backed by this file, so
+                datasets of any size are handled in bounded memory
+
         """
-        label_heatmaps = torch.empty(
-            size=(len(self.image_names), self.num_keypoints, *self.output_shape)
+        shape = (len(self.image_names), self.num_keypoints, *self.output_shape)
+
+        if cache_dir is None or not self.resize_only:
+            label_heatmaps = torch.empty(size=shape)
+            for start, heatmaps in self.iter_heatmaps(chunk_size=chunk_size):
+                label_heatmaps[start:start + heatmaps.shape[0]] = heatmaps
+            return label_heatmaps
+
+        # heatmaps are fully determined by the resized keypoints and heatmap parameters
+        hasher = hashlib.sha1()
+        hasher.update(self.get_resized_keypoints().numpy().tobytes())
+        hasher.update(
+            f"{self.height}|{self.width}|{self.output_shape}|{self.output_sigma}|"
+            f"{self.uniform_heatmaps}".encode()
         )
-        for idx in range(len(self.image_names)):
-            example_dict: BaseLabeledExampleDict = super().__getitem__(idx)
-            label_heatmaps[idx] = self.compute_heatmap(example_dict)
+        cache_file = os.path.join(cache_dir, f"heatmaps_{hasher.hexdigest()[:16]}.npy")
+
+        if not os.path.isfile(cache_file):
+            os.makedirs(cache_dir, exist_ok=True)
+            # write to a temporary file first so that an interrupted run is never picked up
+            tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+            label_heatmaps = np.lib.format.open_memmap(
+                tmp_file, mode="w+", dtype=np.float32, shape=shape,
+            )
+            for start, heatmaps in self.iter_heatmaps(chunk_size=chunk_size):
+                label_heatmaps[start:start + heatmaps.shape[0]] = heatmaps.numpy()
+            label_heatmaps.flush()
+            del label_heatmaps
+            os.replace(tmp_file, cache_file)
+
+        # copy-on-write so that callers can modify the returned tensor
+        return torch.from_numpy(np.load(cache_file, mmap_mode="c"))
+
+    def _add_heatmaps(self, example_dict: BaseLabeledExampleDict) -> HeatmapLabeledExampleDict:
+        if self.return_raw_images or not self.return_heatmaps:
+            # heatmaps are computed for full batches
+            return example_dict
+        # compute the corresponding heatmaps
+        example_dict["heatmaps"] = self.compute_heatmap(example_dict)
+        return example_dict
 
-        return label_heatmaps
+    def example_from_image(
+        self,
+        image: np.ndarray,
+        keypoints: TensorType["num_keypoints", 2],
+        original_shape: Tuple[int, int],
+        idx: int,
+    ) -> HeatmapLabeledExampleDict:
+        example_dict = super().example_from_image(image, keypoints, original_shape, idx)
+        return self._add_heatmaps(example_dict)
 
     def __getitem__(self, idx: int) -> HeatmapLabeledExampleDict:
         """Get an example from the dataset."""
         # call base dataset to get an image and labels
         example_dict: BaseLabeledExampleDict = super().__getitem__(idx)
-        # compute the corresponding heatmaps
-        example_dict["heatmaps"] = self.compute_heatmap(example_dict)
-        return example_dict
+        return self._add_heatmaps(example_dict)
 
 
 class MultiviewHeatmapDataset(torch.utils.data.Dataset):
@@ -344,7 +753,10 @@ class MultiviewHeatmapDataset(torch.utils.data.Dataset):
         uniform_heatmaps: bool = False,
         do_context: bool = False,
         imgaug_transform: Optional[Callable] = None,
-        delimiter: str = "img"
+        delimiter: str = "img",
+        frame_store_dir: Optional[str] = None,
+        reduced_resolution_decode: bool = False,
+        frame_cache_bytes: Optional[int] = None,
     ) -> None:
         """Initialize the MultiViewHeatmap Dataset.
 
@@ -362,6 +774,12 @@ class MultiviewHeatmapDataset(torch.utils.data.Dataset):
             downsample_factor: factor by which to downsample original image dims to have a smaller
                 heatmap
             do_context: include additional frames of context if possible
+            frame_store_dir: if not None, serve decoded frames from a memory-mapped store in this
+                directory (one store per view); see BaseTrackingDataset
+            reduced_resolution_decode: decode jpeg frames at reduced resolution when the final
+                resize allows it; see BaseTrackingDataset
+            frame_cache_bytes: if not None, cache up to this many bytes of decoded frames in
+                shared memory; the budget is divided equally between views
         """
 
         if len(view_names) != len(csv_paths):
@@ -371,6 +789,8 @@ class MultiviewHeatmapDataset(torch.utils.data.Dataset):
         self.csv_paths = csv_paths
         self.do_context = do_context
         self.delimiter = delimiter
+        self.frame_store_dir = frame_store_dir
+        self.reduced_resolution_decode = reduced_resolution_decode
 
         self.imgaug_transform = imgaug_transform
         self.downsample_factor = downsample_factor
@@ -383,11 +803,17 @@ class MultiviewHeatmapDataset(torch.utils.data.Dataset):
                 root_directory=root_directory,
                 csv_path=csv_path,
                 header_rows=header_rows,
-                imgaug_transform=imgaug_transform,
+                # views are loaded concurrently; give each its own independently seeded pipeline
+                imgaug_transform=self._copy_transform(imgaug_transform),
                 downsample_factor=downsample_factor,
                 do_context=do_context,
                 uniform_heatmaps=uniform_heatmaps,
-                delimiter=self.delimiter
+                delimiter=self.delimiter,
+                frame_store_dir=frame_store_dir,
+                reduced_resolution_decode=reduced_resolution_decode,
+                frame_cache_bytes=(
+                    frame_cache_bytes // len(view_names) if frame_cache_bytes is not None else None
+                ),
             )
             self.keypoint_names[view] = self.dataset[view].keypoint_names
             self.data_length[view] = len(self.dataset[view])
@@ -403,6 +829,47 @@ class MultiviewHeatmapDataset(torch.utils.data.Dataset):
 
         self.num_targets = self.num_keypoints * 2
 
+        # thread pool for loading views concurrently; created lazily in each process
+        self._executor = None
+        self._executor_pid = None
+
+    @staticmethod
+    def _copy_transform(imgaug_transform: Optional[Callable]) -> Optional[Callable]:
+        if imgaug_transform is None:
+            return None
+        imgaug_transform = imgaug_transform.deepcopy()
+        imgaug_transform.seed_()
+        return imgaug_transform
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # worker threads do not survive a fork, so each data loader worker needs its own pool
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.num_views)
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        state["_executor_pid"] = None
+        return state
+
+    def with_transform(self, imgaug_transform: Optional[Callable]) -> "MultiviewHeatmapDataset":
+        """Return a shallow copy of the dataset that uses a different imgaug pipeline.
+
+        Each view dataset is replaced by its own shallow copy with an independently seeded copy of
+        the pipeline; labels and frames are shared with the original views.
+
+        """
+        dataset = copy.copy(self)
+        dataset.imgaug_transform = imgaug_transform
+        dataset.dataset = {
+            view_name: view_dataset.with_transform(self._copy_transform(imgaug_transform))
+            for view_name, view_dataset in self.dataset.items()
+        }
+        return dataset
+
     def check_data_images_names(self):
         """Data checking
         Each object in self.datasets will have the attribute image_names
@@ -459,6 +926,38 @@ class MultiviewHeatmapDataset(torch.utils.data.Dataset):
     def num_views(self) -> int:
         return len(self.view_names)
 
+    def get_resized_keypoints(
+        self, idxs: Optional[List[int]] = None,
+    ) -> TensorType["num_frames", "num_keypoints", 2]:
+        """Keypoints of all views after the final resize, concatenated in view order."""
+        return torch.cat(
+            [self.dataset[view].get_resized_keypoints(idxs) for view in self.view_names], dim=1,
+        )
+
+    @property
+    def return_heatmaps(self) -> bool:
+        return self.dataset[self.view_names[0]].return_heatmaps
+
+    @return_heatmaps.setter
+    def return_heatmaps(self, value: bool) -> None:
+        for dataset in self.dataset.values():
+            dataset.return_heatmaps = value
+
+    def compute_batch_heatmaps(
+        self, keypoints: TensorType["batch", "num_targets"]
+    ) -> TensorType["batch", "num_keypoints", "heatmap_height", "heatmap_width"]:
+        """Compute 2D heatmaps for a batch of keypoints concatenated across views.
+
+        Keypoints that data augmentation has moved out of the frame are set to nan in place.
+
+        """
+        batch_size = keypoints.shape[0]
+        # all views share image and heatmap dimensions, so views can be folded into the batch
+        heatmaps = self.dataset[self.view_names[0]].compute_batch_heatmaps(
+            keypoints.reshape(batch_size * self.num_views, -1)
+        )
+        return heatmaps.reshape(batch_size, -1, *heatmaps.shape[2:])
+
     def fusion(self, datadict: dict) -> Tuple[
         Union[
             TensorType["num_views", "RGB":3, "image_height", "image_width", float],
@@ -483,23 +982,32 @@ class MultiviewHeatmapDataset(torch.utils.data.Dataset):
                 - concat order
 
         """
-        images = []
-        keypoints = []
-        heatmaps = []
-        bboxes = []
-        concat_order = []
-        for view, data in datadict.items():
-            images.append(data["images"].unsqueeze(0))
-            data["keypoints"] = data["keypoints"].reshape(int(data["keypoints"].shape[0] / 2), 2)
-            keypoints.append(data["keypoints"])
-            heatmaps.append(data["heatmaps"])
-            bboxes.append(data["bbox"])
-            concat_order.append(view)
-
-        images = torch.cat(images, dim=0)
-        keypoints = torch.cat(keypoints, dim=0).reshape(-1)
-        heatmaps = torch.cat(heatmaps, dim=0)
-        bboxes = torch.cat(bboxes, dim=0)
+        views = list(datadict.keys())
+        first = datadict[views[0]]
+
+        # preallocate outputs and fill them view by view
+        images = torch.empty((len(views), *first["images"].shape), dtype=first["images"].dtype)
+        keypoints = torch.empty((self.num_targets,), dtype=first["keypoints"].dtype)
+        bboxes = torch.empty((len(views) * first["bbox"].shape[0],), dtype=first["bbox"].dtype)
+        if "heatmaps" in first:
+            heatmaps = torch.empty(
+                (self.num_keypoints, *first["heatmaps"].shape[1:]),
+                dtype=first["heatmaps"].dtype,
+            )
+        else:
+            heatmaps = None
+
+        keypoint_idx = 0
+        for v, view in enumerate(views):
+            data = datadict[view]
+            num_keypoints = data["keypoints"].shape[0] // 2
+            images[v] = data["images"]
+            keypoints[2 * keypoint_idx:2 * (keypoint_idx + num_keypoints)] = data["keypoints"]
+            if heatmaps is not None:
+                heatmaps[keypoint_idx:keypoint_idx + num_keypoints] = data["heatmaps"]
+            bboxes[v * data["bbox"].shape[0]:(v + 1) * data["bbox"].shape[0]] = data["bbox"]
+            keypoint_idx += num_keypoints
+        concat_order = views
 
         assert keypoints.shape == (self.num_targets,)
 
@@ -510,14 +1018,20 @@ class MultiviewHeatmapDataset(torch.utils.data.Dataset):
         Calls the heatmapdataset for each csv file to get
         Images and their heatmaps and then stacks them.
         """
-        datadict = {}
-        for view in self.view_names:
-            datadict[view] = self.dataset[view][idx]
+        # decoding and augmentation release the GIL, so views are loaded concurrently
+        if self.num_views > 1:
+            futures = {
+                view: self.executor.submit(self.dataset[view].__getitem__, idx)
+                for view in self.view_names
+            }
+            datadict = {view: future.result() for view, future in futures.items()}
+        else:
+            datadict = {view: self.dataset[view][idx] for view in self.view_names}
 
         images, keypoints, heatmaps, bboxes, concat_order = self.fusion(datadict)
         # images normal:[view, RGB, H, W] context:[view, context, RGB, H, W]
 
-        return MultiviewHeatmapLabeledExampleDict(
+        example_dict = MultiviewHeatmapLabeledExampleDict(
             images=images,  # shape (3, H, W) or (5, 3, H, W)
             keypoints=keypoints,  # shape (n_targets,)
             heatmaps=heatmaps,
@@ -527,3 +1041,7 @@ class MultiviewHeatmapDataset(torch.utils.data.Dataset):
             concat_order=concat_order,  # List[str]
             view_names=self.view_names,  # List[str]
         )
+        if heatmaps is None:
+            # heatmaps are computed for full batches
+            del example_dict["heatmaps"]
+        return example_dict
@@ -0,0 +1,182 @@
+"""In-memory cache of decoded frames shared by all data loader workers."""
+
+import multiprocessing as mp
+import os
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# to ignore imports for sphix-autoapidoc
+__all__ = [
+    "SharedFrameCache",
+]
+
+# per-frame metadata: decoded (height, width, channels) and original (height, width)
+_FRAME_INFO_SIZE = 5
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    block = shared_memory.SharedMemory(name=name)
+    # attaching registers the block with the resource tracker, which would then remove it when
+    # this process exits; only the process that created the block owns it
+    resource_tracker.unregister(block._name, "shared_memory")
+    return block
+
+
+def _release_shared_memory(blocks: List[shared_memory.SharedMemory], owner_pid: int) -> None:
+    # the mappings themselves are released with the process; forked workers inherit this
+    # finalizer but must not remove memory that other processes still use
+    if os.getpid() == owner_pid:
+        for block in blocks:
+            block.unlink()
+
+
+class SharedFrameCache(object):
+    """Least-recently-used cache of decoded, pre-augmentation frames in shared memory.
+
+    The cache holds as many frames as fit into a fixed byte budget. Memory is allocated once, in
+    the process that creates the cache, and divided into slots of the size of one decoded frame;
+    data loader workers (forked or spawned) attach to the same memory, so a frame decoded by any
+    worker is available to all of them in every later epoch. Frames larger than a slot are never
+    cached. Memory is only committed as slots are filled.
+
+    Hit and miss counters are shared as well and summarize lookups from all processes.
+
+    """
+
+    def __init__(self, frame_names: List[str], max_bytes: int, frame_bytes: int) -> None:
+        """Allocate the cache.
+
+        Args:
+            frame_names: names of all frames that may be cached
+            max_bytes: byte budget for decoded frames
+            frame_bytes: size of a single decoded frame in bytes
+
+        """
+        self.max_bytes = max_bytes
+        self.frame_bytes = frame_bytes
+        self.frame_names = list(dict.fromkeys(frame_names))
+        self.num_slots = max_bytes // frame_bytes if frame_bytes > 0 else 0
+        self._frame_idxs = {name: idx for idx, name in enumerate(self.frame_names)}
+        self._lock = mp.Lock()
+
+        num_frames = len(self.frame_names)
+        # clock, hits, misses, slot of each frame, frame info, frame in each slot, last use of slot
+        meta_size = 3 + num_frames * (1 + _FRAME_INFO_SIZE) + 2 * self.num_slots
+        self._meta_block = shared_memory.SharedMemory(create=True, size=8 * meta_size)
+        self._data_block = shared_memory.SharedMemory(
+            create=True, size=max(self.num_slots * frame_bytes, 1),
+        )
+        self._owner_pid = os.getpid()
+        weakref.finalize(
+            self, _release_shared_memory, [self._meta_block, self._data_block], self._owner_pid,
+        )
+        self._map_arrays()
+        self._counters[:] = 0
+        self._slot_of_frame[:] = -1
+        self._frame_of_slot[:] = -1
+        self._last_used[:] = -1
+
+    def _map_arrays(self) -> None:
+        num_frames = len(self.frame_names)
+        meta = np.ndarray(
+            (self._meta_block.size // 8,), dtype=np.int64, buffer=self._meta_block.buf,
+        )
+        start = 0
+        self._counters = meta[start:start + 3]
+        start += 3
+        self._slot_of_frame = meta[start:start + num_frames]
+        start += num_frames
+        self._frame_info = meta[start:start + num_frames * _FRAME_INFO_SIZE].reshape(
+            num_frames, _FRAME_INFO_SIZE,
+        )
+        start += num_frames * _FRAME_INFO_SIZE
+        self._frame_of_slot = meta[start:start + self.num_slots]
+        start += self.num_slots
+        self._last_used = meta[start:start + self.num_slots]
+        self._data = np.ndarray(
+            (self._data_block.size,), dtype=np.uint8, buffer=self._data_block.buf,
+        )
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        # workers attach to the shared memory by name
+        state["_meta_block"] = self._meta_block.name
+        state["_data_block"] = self._data_block.name
+        for key in [
+            "_counters", "_slot_of_frame", "_frame_info", "_frame_of_slot", "_last_used", "_data",
+        ]:
+            del state[key]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._meta_block = _attach_shared_memory(state["_meta_block"])
+        self._data_block = _attach_shared_memory(state["_data_block"])
+        self._map_arrays()
+
+    def __deepcopy__(self, memo: dict) -> "SharedFrameCache":
+        # the cache is a shared resource; copies of a dataset keep using the same cache
+        return self
+
+    def __contains__(self, name: str) -> bool:
+        idx = self._frame_idxs.get(name)
+        return idx is not None and self._slot_of_frame[idx] >= 0
+
+    def __len__(self) -> int:
+        return int(np.sum(self._slot_of_frame >= 0))
+
+    @property
+    def hits(self) -> int:
+        return int(self._counters[1])
+
+    @property
+    def misses(self) -> int:
+        return int(self._counters[2])
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit and miss counts, summed over all processes, and the number of frames."""
+        return {"hits": self.hits, "misses": self.misses, "frames": len(self)}
+
+    def get(self, name: str) -> Optional[Tuple[np.ndarray, Tuple[int, int]]]:
+        """Return a copy of a cached frame and its original (height, width), or None."""
+        idx = self._frame_idxs.get(name)
+        with self._lock:
+            slot = self._slot_of_frame[idx] if idx is not None else -1
+            if slot < 0:
+                self._counters[2] += 1
+                return None
+            self._counters[1] += 1
+            self._counters[0] += 1
+            self._last_used[slot] = self._counters[0]
+            height, width, channels, orig_height, orig_width = self._frame_info[idx]
+            num_bytes = height * width * channels
+            offset = slot * self.frame_bytes
+            # copy so that in-place augmentations never modify the cache
+            image = self._data[offset:offset + num_bytes].reshape(height, width, channels).copy()
+        return image, (int(orig_height), int(orig_width))
+
+    def put(self, name: str, image: np.ndarray, original_shape: Tuple[int, int]) -> None:
+        """Add a decoded frame, evicting the least recently used frame if the cache is full."""
+        idx = self._frame_idxs.get(name)
+        if idx is None or self.num_slots == 0 or image.nbytes > self.frame_bytes:
+            return
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        with self._lock:
+            if self._slot_of_frame[idx] >= 0:
+                # already added by another worker
+                return
+            # free slots are never used and therefore come first
+            slot = int(np.argmin(self._last_used))
+            evicted = self._frame_of_slot[slot]
+            if evicted >= 0:
+                self._slot_of_frame[evicted] = -1
+            offset = slot * self.frame_bytes
+            self._data[offset:offset + image.nbytes] = image.reshape(-1)
+            self._frame_info[idx] = [*image.shape, *original_shape]
+            self._counters[0] += 1
+            self._last_used[slot] = self._counters[0]
+            self._frame_of_slot[slot] = idx
+            self._slot_of_frame[idx] = slot
@@ -0,0 +1,153 @@
+"""On-disk store of pre-decoded labeled frames shared across epochs and data loader workers."""
+
+import hashlib
+import json
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from lightning_pose.data.video import split_video_frame_name
+
+# to ignore imports for sphix-autoapidoc
+__all__ = [
+    "LabeledFrameStore",
+]
+
+
+class LabeledFrameStore(object):
+    """Decode a set of frames once and serve them from a memory-mapped uint8 array.
+
+    All frames are concatenated into a single flat uint8 file; an accompanying json index stores
+    the offset, shape, and original (pre-decoding) size of each frame. The store is keyed by the
+    label csv file, the decoding options, and the size and modification time of every frame, so
+    editing labels or images triggers a rebuild, while an unchanged project reuses the decoded
+    frames from previous runs.
+
+    Frames are returned as views into a copy-on-write memory map, so data loader workers share the
+    same pages through the OS page cache instead of each holding a decoded copy; augmentations that
+    modify frames in place only ever touch private copies of the affected pages.
+
+    """
+
+    def __init__(
+        self,
+        store_dir: str,
+        root_directory: str,
+        image_names: List[str],
+        csv_file: str,
+        decode_fn: Callable[[str], Tuple[np.ndarray, Tuple[int, int]]],
+        decode_options: str = "",
+    ) -> None:
+        """Load the frame store from disk, building it first if necessary.
+
+        Args:
+            store_dir: directory in which the decoded frames and index are saved
+            root_directory: path to data directory; image names are relative to this directory
+            image_names: relative paths of all frames to store
+            csv_file: absolute path to the label csv file; part of the store key
+            decode_fn: function that takes an absolute image path and returns a
+                (height, width, 3) uint8 array and the original (height, width) of the image file
+            decode_options: description of any options of `decode_fn` that change its output;
+                part of the store key
+
+        """
+        self.store_dir = store_dir
+        self.root_directory = root_directory
+        # remove duplicates but keep order
+        self.image_names = list(dict.fromkeys(image_names))
+
+        key = self._compute_key(csv_file, decode_options)
+        self.data_file = os.path.join(store_dir, f"frames_{key}.bin")
+        self.index_file = os.path.join(store_dir, f"frames_{key}.json")
+
+        if not (os.path.isfile(self.data_file) and os.path.isfile(self.index_file)):
+            self._build(decode_fn)
+
+        with open(self.index_file, "r") as f:
+            index = json.load(f)
+        self._offsets: Dict[str, int] = index["offsets"]
+        self._shapes: Dict[str, List[int]] = index["shapes"]
+        self._original_shapes: Dict[str, List[int]] = index["original_shapes"]
+        self._num_bytes = index["num_bytes"]
+
+        # memory map is opened lazily so that it is not pickled when sent to workers
+        self._data: Optional[np.memmap] = None
+
+    def _compute_key(self, csv_file: str, decode_options: str) -> str:
+        """Hash csv and image paths/sizes/mtimes into a key for the current version of the data."""
+        hasher = hashlib.sha1()
+        hasher.update(decode_options.encode())
+        stat = os.stat(csv_file)
+        hasher.update(f"{os.path.abspath(csv_file)}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+        for name in self.image_names:
+            # frames read from videos are versioned by the video file
+            video_frame = split_video_frame_name(name)
+            source = video_frame[0] if video_frame is not None else name
+            stat = os.stat(os.path.join(self.root_directory, source))
+            hasher.update(f"{name}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+        return hasher.hexdigest()[:16]
+
+    def _build(self, decode_fn: Callable[[str], Tuple[np.ndarray, Tuple[int, int]]]) -> None:
+        """Decode all frames and write them to disk."""
+        print(f"Building labeled frame store in {self.store_dir}...")
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        offsets = {}
+        shapes = {}
+        original_shapes = {}
+        num_bytes = 0
+        # write to temporary files first so that an interrupted build is never picked up
+        tmp_data_file = f"{self.data_file}.{os.getpid()}.tmp"
+        tmp_index_file = f"{self.index_file}.{os.getpid()}.tmp"
+        with open(tmp_data_file, "wb") as f:
+            for name in self.image_names:
+                image, original_shape = decode_fn(os.path.join(self.root_directory, name))
+                image = np.ascontiguousarray(image, dtype=np.uint8)
+                offsets[name] = num_bytes
+                shapes[name] = list(image.shape)
+                original_shapes[name] = list(original_shape)
+                f.write(image.tobytes())
+                num_bytes += image.nbytes
+        with open(tmp_index_file, "w") as f:
+            json.dump({
+                "offsets": offsets,
+                "shapes": shapes,
+                "original_shapes": original_shapes,
+                "num_bytes": num_bytes,
+            }, f)
+
+        os.replace(tmp_data_file, self.data_file)
+        os.replace(tmp_index_file, self.index_file)
+        print(f"Stored {len(self.image_names)} frames ({num_bytes / 1e9:.2f} GB)")
+
+    @property
+    def data(self) -> np.memmap:
+        if self._data is None:
+            self._data = np.memmap(
+                self.data_file, dtype=np.uint8, mode="c", shape=(self._num_bytes,),
+            )
+        return self._data
+
+    def __contains__(self, image_name: str) -> bool:
+        return image_name in self._offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, image_name: str) -> np.ndarray:
+        offset = self._offsets[image_name]
+        shape = self._shapes[image_name]
+        num_bytes = int(np.prod(shape))
+        return self.data[offset:offset + num_bytes].reshape(shape)
+
+    def original_shape(self, image_name: str) -> Tuple[int, int]:
+        """Return the (height, width) of the image file before decoding."""
+        height, width = self._original_shapes[image_name]
+        return height, width
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        # each worker maps the file itself; pages are shared through the OS page cache
+        state["_data"] = None
+        return state
@@ -0,0 +1,503 @@
+"""Video loading on the CPU with OpenCV, a drop-in replacement for the DALI pipelines."""
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Literal, Tuple, Type, Union
+
+import cv2
+import numpy as np
+import torch
+from omegaconf import DictConfig
+
+from lightning_pose.data import _IMAGENET_MEAN, _IMAGENET_STD
+from lightning_pose.data.utils import MultiviewUnlabeledBatchDict, UnlabeledBatchDict
+from lightning_pose.data.video import PrepareVideoLoader, VideoFrameReader
+
+# to ignore imports for sphix-autoapidoc
+__all__ = [
+    "OpenCVVideoLoader",
+    "PackedClipLoader",
+    "PrepareOpenCV",
+    "get_video_preparer",
+]
+
+
+def _dlc_augmentation(
+    frames: np.ndarray, rng: np.random.Generator,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Apply the augmentations of the DALI "dlc" pipeline to a (seq_len, H, W, 3) float array.
+
+    The same random transform is applied to every frame of the sequence, as in DALI.
+
+    Returns:
+        tuple
+            - augmented frames
+            - (2, 3) affine matrix that maps original to augmented pixel coordinates
+
+    """
+    height, width = frames.shape[1:3]
+    # the DALI pipeline passes (height / 2, width / 2) as the (x, y) center; kept for parity
+    center = np.array([height / 2, width / 2])
+    angle = np.deg2rad(rng.uniform(-10, 10))
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    scale = np.diag(rng.uniform(0.8, 1.2, size=2))
+    linear = scale @ rotation
+    # rotate about the center, then scale about the center
+    offset = scale @ (center - rotation @ center) + center - scale @ center
+    transform = np.concatenate([linear, offset[:, None]], axis=1).astype(np.float32)
+    frames = np.stack([
+        cv2.warpAffine(frame, transform, (width, height), flags=cv2.INTER_LINEAR, borderValue=0)
+        for frame in frames
+    ])
+    # brightness/contrast around the DALI default contrast center for float inputs
+    contrast = rng.uniform(0.75, 1.25)
+    brightness = rng.uniform(0.75, 1.25)
+    frames = brightness * (0.5 + contrast * (frames - 0.5))
+    # shot noise
+    factor = rng.uniform(0.0, 10.0)
+    if factor > 0:
+        frames = rng.poisson(np.clip(frames, 0, None) / factor) * factor
+    return frames.astype(np.float32), transform
+
+
+class OpenCVVideoLoader(object):
+    """Iterate over video frame sequences decoded on the CPU by OpenCV.
+
+    Batches are identical in layout to those of `LitDaliWrapper`, and sequences follow the same
+    `sequence_length`/`step` semantics as the DALI video reader: sequences of consecutive frames
+    start every `step` frames, never span two videos, and sequences at the end of a video are
+    padded with black frames. Sequences are decoded in background threads, each of which keeps its
+    own decoder per video and decodes forward rather than seeking between nearby sequences.
+
+    Shuffled (training) loaders can instead decode in `num_workers` worker processes, each of
+    which owns a subset of the videos (or, if there are fewer videos than workers, a subset of the
+    sequences of every video) and draws its share of the batches of each epoch from them.
+
+    """
+
+    def __init__(
+        self,
+        filenames: List[List[str]],
+        resize_dims: List[int],
+        sequence_length: int,
+        step: int,
+        num_iters: int,
+        eval_mode: Literal["train", "predict"],
+        do_context: bool = False,
+        random_shuffle: bool = False,
+        seed: int = 123456,
+        pad_sequences: bool = True,
+        imgaug: str = "default",
+        num_threads: int = 1,
+        prefetch: int = 2,
+        num_workers: int = 0,
+    ) -> None:
+        """Initialize the loader.
+
+        Args:
+            filenames: absolute paths of video files, one list per view
+            resize_dims: [height, width] to resize raw frames
+            sequence_length: number of frames per sequence (i.e. per batch)
+            step: number of frames between the starts of consecutive sequences
+            num_iters: number of batches per pass over the loader
+            eval_mode: "train" | "predict"
+            do_context: whether model/loader use 5-frame context or not
+            random_shuffle: True to return sequences in random order; False to sequential read
+            seed: random seed for shuffling and augmentation
+            pad_sequences: allow incomplete sequences at the end of each video
+            imgaug: "default" for no augmentation; "dlc" or "dlc-top-down" to reproduce the
+                augmentations of the DALI pipeline
+            num_threads: number of background decoding threads
+            prefetch: number of sequences decoded ahead per thread or worker process
+            num_workers: number of worker processes decoding shuffled sequences; 0 decodes in
+                threads of the main process
+
+        """
+        if imgaug not in ["default", "dlc", "dlc-top-down"]:
+            raise NotImplementedError(f"imgaug={imgaug} is not supported by the opencv backend")
+        self.filenames = filenames
+        self.multiview = len(filenames) > 1
+        self.resize_dims = resize_dims
+        self.sequence_length = sequence_length
+        self.step = step
+        self.num_iters = num_iters
+        self.eval_mode = eval_mode
+        self.do_context = do_context
+        self.random_shuffle = random_shuffle
+        self.seed = seed
+        self.pad_sequences = pad_sequences
+        self.imgaug = imgaug
+        self.num_threads = num_threads
+        self.prefetch = prefetch
+        self.num_workers = num_workers if random_shuffle else 0
+        self._epoch = 0
+        self._local = threading.local()
+
+        reader = VideoFrameReader()
+        # views are synchronized; use the shortest view of each session
+        self.frame_counts = [
+            min(reader.num_frames(view[v]) for view in filenames)
+            for v in range(len(filenames[0]))
+        ]
+        self.frame_shapes = [
+            [reader.frame_shape(video_file) for video_file in view] for view in filenames
+        ]
+
+    def __len__(self) -> int:
+        return self.num_iters
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        # decoders are opened lazily in every worker process
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _sequence_starts(self) -> List[Tuple[int, int]]:
+        """Return (video index, first frame) of every sequence, in reading order."""
+        starts = []
+        for v, num_frames in enumerate(self.frame_counts):
+            last = num_frames if self.pad_sequences else num_frames - self.sequence_length + 1
+            starts.extend((v, start) for start in range(0, max(last, 0), self.step))
+        return starts
+
+    def _read_frames(self, video_file: str, frame_idxs: range) -> List[np.ndarray]:
+        if not hasattr(self._local, "reader"):
+            # decoders are not thread safe; each thread keeps its own
+            self._local.reader = VideoFrameReader(max_forward=self.sequence_length)
+            self._local.recent = {}
+        # overlapping sequences (context models) reuse the frames of the previous sequence
+        previous = self._local.recent.get(video_file, {})
+        recent = {}
+        for frame_idx in frame_idxs:
+            frame = previous.get(frame_idx)
+            if frame is None:
+                frame = self._local.reader.read(video_file, frame_idx)
+            recent[frame_idx] = frame
+        self._local.recent[video_file] = recent
+        return list(recent.values())
+
+    def _load_sequence(
+        self, video_idx: int, start: int, seed: int,
+    ) -> Union[UnlabeledBatchDict, MultiviewUnlabeledBatchDict]:
+        rng = np.random.default_rng(seed)
+        height, width = self.resize_dims
+        num_frames = self.frame_counts[video_idx]
+        frame_idxs = range(start, min(start + self.sequence_length, num_frames))
+        frames_list, transforms_list, bbox_list = [], [], []
+        for view, filename_list in enumerate(self.filenames):
+            frame_shape = self.frame_shapes[view][video_idx]
+            frames = np.zeros((self.sequence_length, height, width, 3), dtype=np.float32)
+            for i, frame in enumerate(self._read_frames(filename_list[video_idx], frame_idxs)):
+                frames[i] = cv2.resize(frame, (width, height), interpolation=cv2.INTER_LINEAR)
+            if self.imgaug in ["dlc", "dlc-top-down"]:
+                frames, transform = _dlc_augmentation(frames, rng)
+            else:
+                # arbitrary scalar signals that there is no geometric transform to undo
+                transform = np.array([-1], dtype=np.float32)
+            frames = (frames / 255.0 - _IMAGENET_MEAN) / _IMAGENET_STD
+            frames_list.append(torch.from_numpy(frames.transpose(0, 3, 1, 2).astype(np.float32)))
+            transforms_list.append(torch.from_numpy(transform))
+            bbox_list.append(torch.tensor([0, 0, frame_shape[0], frame_shape[1]]))
+
+        if not self.multiview:
+            return UnlabeledBatchDict(
+                frames=frames_list[0],
+                transforms=transforms_list[0],
+                bbox=bbox_list[0].repeat((self.sequence_length, 1)),
+                is_multiview=False,
+            )
+        return MultiviewUnlabeledBatchDict(
+            frames=torch.stack(frames_list, dim=1),
+            transforms=torch.stack([t.unsqueeze(0) for t in transforms_list], dim=0),
+            bbox=torch.cat(bbox_list, dim=0).repeat((self.sequence_length, 1)),
+            is_multiview=True,
+        )
+
+    def _epoch_sequences(self) -> List[Tuple[int, int]]:
+        starts = self._sequence_starts()
+        if not self.random_shuffle:
+            return starts[:self.num_iters]
+        rng = np.random.default_rng(self.seed + self._epoch)
+        sequences = []
+        while len(sequences) < self.num_iters:
+            sequences.extend(starts[i] for i in rng.permutation(len(starts)))
+        return sequences[:self.num_iters]
+
+    def _worker_sequences(
+        self, epoch: int, worker_id: int, num_workers: int,
+    ) -> List[Tuple[int, int, int]]:
+        """Return (video index, first frame, seed) of the sequences decoded by one worker."""
+        starts = self._sequence_starts()
+        if len(self.frame_counts) >= num_workers:
+            starts = [(v, start) for v, start in starts if v % num_workers == worker_id]
+        else:
+            starts = starts[worker_id::num_workers]
+        # batches of the epoch are divided as evenly as possible between workers
+        num_sequences = self.num_iters // num_workers
+        num_sequences += int(worker_id < self.num_iters % num_workers)
+        rng = np.random.default_rng([self.seed, epoch, worker_id])
+        sequences = []
+        while starts and len(sequences) < num_sequences:
+            sequences.extend(starts[i] for i in rng.permutation(len(starts)))
+        seeds = rng.integers(0, 2 ** 31, size=num_sequences)
+        return [(v, start, int(seed)) for (v, start), seed in zip(sequences, seeds)]
+
+    def __iter__(self) -> Iterator[Union[UnlabeledBatchDict, MultiviewUnlabeledBatchDict]]:
+        if self.num_workers > 0:
+            dataset = _WorkerSequenceDataset(self, self._epoch)
+            self._epoch += 1
+            # batch_size=None: every sequence already is a batch
+            yield from torch.utils.data.DataLoader(
+                dataset,
+                batch_size=None,
+                num_workers=self.num_workers,
+                prefetch_factor=self.prefetch,
+            )
+            return
+
+        sequences = self._epoch_sequences()
+        seed = self.seed + self._epoch * len(sequences)
+        self._epoch += 1
+        executor = ThreadPoolExecutor(max_workers=self.num_threads)
+        futures = []
+        try:
+            max_pending = self.num_threads * self.prefetch
+            for i in range(len(sequences)):
+                # keep a bounded number of sequences decoding ahead of the consumer
+                while len(futures) < max_pending and i + len(futures) < len(sequences):
+                    video_idx, start = sequences[i + len(futures)]
+                    futures.append(executor.submit(
+                        self._load_sequence, video_idx, start, seed + i + len(futures),
+                    ))
+                yield futures.pop(0).result()
+        finally:
+            # stop decoding if iteration ends early
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+
+class _WorkerSequenceDataset(torch.utils.data.IterableDataset):
+    """Sequences of one epoch of an `OpenCVVideoLoader`, split across data loader workers."""
+
+    def __init__(self, loader: OpenCVVideoLoader, epoch: int) -> None:
+        self.loader = loader
+        self.epoch = epoch
+
+    def __iter__(self) -> Iterator[Union[UnlabeledBatchDict, MultiviewUnlabeledBatchDict]]:
+        worker_info = torch.utils.data.get_worker_info()
+        worker_id, num_workers = (0, 1) if worker_info is None \
+            else (worker_info.id, worker_info.num_workers)
+        for video_idx, start, seed in self.loader._worker_sequences(
+            self.epoch, worker_id, num_workers,
+        ):
+            yield self.loader._load_sequence(video_idx, start, seed)
+
+
+class PackedClipLoader(object):
+    """Pack the frames of many short videos into full, fixed-size prediction batches.
+
+    The clips are concatenated into a single stream of frames that is cut into sequences of
+    `sequence_length` frames, so only the very last batch is incomplete, however many clips there
+    are. For context models, every clip is padded with two copies of its first and last frames,
+    so that context frames never come from a neighbouring clip, and consecutive sequences overlap
+    by four frames, as in the DALI context pipeline.
+
+    Iterating yields tuples of
+        - an `UnlabeledBatchDict`
+        - clip index of each prediction row of the batch, -1 for rows without a prediction
+        - frame index within the clip of each prediction row, -1 for rows without a prediction
+
+    Frames are decoded sequentially in a background thread. Clips that cannot be opened are
+    treated as clips without frames.
+
+    """
+
+    def __init__(
+        self,
+        filenames: List[str],
+        resize_dims: List[int],
+        sequence_length: int,
+        do_context: bool = False,
+        prefetch: int = 2,
+    ) -> None:
+        """Initialize the loader.
+
+        Args:
+            filenames: absolute paths of the video files
+            resize_dims: [height, width] to resize raw frames
+            sequence_length: number of frames per batch
+            do_context: pad clips and overlap batches for 5-frame context models
+            prefetch: number of batches decoded ahead
+
+        """
+        self.pad = 2 if do_context else 0
+        if sequence_length <= 2 * self.pad:
+            raise ValueError("sequence_length must be > 4 for context models")
+        self.filenames = filenames
+        self.resize_dims = resize_dims
+        self.sequence_length = sequence_length
+        self.do_context = do_context
+        self.prefetch = prefetch
+
+    def _stream(self) -> Iterator[Tuple[np.ndarray, Tuple[int, int], int, int]]:
+        """Yield (resized frame, original shape, clip index, frame index) over all clips."""
+        height, width = self.resize_dims
+        for clip_idx, video_file in enumerate(self.filenames):
+            cap = cv2.VideoCapture(video_file)
+            if not cap.isOpened():
+                # a single bad clip should not stop the prediction of all other clips
+                print(f"Could not open video {video_file}; treating it as a clip without frames")
+                continue
+            frame_idx = 0
+            item = None
+            while True:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                item = (
+                    cv2.resize(frame, (width, height), interpolation=cv2.INTER_LINEAR),
+                    frame.shape[:2],
+                )
+                if frame_idx == 0:
+                    for _ in range(self.pad):
+                        yield (*item, -1, -1)
+                yield (*item, clip_idx, frame_idx)
+                frame_idx += 1
+            cap.release()
+            if item is not None:
+                for _ in range(self.pad):
+                    yield (*item, -1, -1)
+
+    def _make_batch(
+        self, items: list,
+    ) -> Tuple[UnlabeledBatchDict, np.ndarray, np.ndarray]:
+        height, width = self.resize_dims
+        frames = np.zeros((self.sequence_length, height, width, 3), dtype=np.float32)
+        bbox = torch.zeros((self.sequence_length, 4), dtype=torch.int64)
+        clip_idxs = np.full(self.sequence_length, -1)
+        frame_idxs = np.full(self.sequence_length, -1)
+        for i, (frame, frame_shape, clip_idx, frame_idx) in enumerate(items):
+            frames[i] = frame
+            bbox[i] = torch.tensor([0, 0, frame_shape[0], frame_shape[1]])
+            clip_idxs[i] = clip_idx
+            frame_idxs[i] = frame_idx
+        # black frames that fill the last batch keep the bbox of the last real frame
+        bbox[len(items):] = bbox[len(items) - 1]
+        frames = (frames / 255.0 - _IMAGENET_MEAN) / _IMAGENET_STD
+        batch = UnlabeledBatchDict(
+            frames=torch.from_numpy(frames.transpose(0, 3, 1, 2).astype(np.float32)),
+            transforms=torch.tensor([-1.0]),
+            bbox=bbox,
+            is_multiview=False,
+        )
+        # context models predict all but the first and last two frames of a sequence
+        rows = slice(self.pad, self.sequence_length - self.pad)
+        return batch, clip_idxs[rows], frame_idxs[rows]
+
+    def _batches(self) -> Iterator[Tuple[UnlabeledBatchDict, np.ndarray, np.ndarray]]:
+        overlap = 2 * self.pad
+        items = []
+        for item in self._stream():
+            items.append(item)
+            if len(items) == self.sequence_length:
+                yield self._make_batch(items)
+                # frames at the end of a sequence have no prediction yet
+                items = items[self.sequence_length - overlap:]
+        if len(items) > overlap:
+            yield self._make_batch(items)
+
+    def __iter__(self) -> Iterator[Tuple[UnlabeledBatchDict, np.ndarray, np.ndarray]]:
+        batches = queue.Queue(maxsize=self.prefetch)
+        done = object()
+        stop = threading.Event()
+
+        def _put(item) -> bool:
+            # give up once the consumer stops, so that the thread never blocks on a full queue
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def _produce() -> None:
+            try:
+                for batch in self._batches():
+                    if not _put(batch):
+                        return
+                _put(done)
+            except Exception as e:
+                _put(e)
+
+        thread = threading.Thread(target=_produce, daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is done:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            stop.set()
+            thread.join()
+
+
+class PrepareOpenCV(PrepareVideoLoader):
+    """Prepare OpenCV video loaders with the same arguments and semantics as `PrepareDALI`.
+
+    Selected with `dali.general.backend: opencv`; requires neither a GPU nor DALI.
+
+    """
+
+    def __call__(self) -> OpenCVVideoLoader:
+        """
+        Returns an OpenCVVideoLoader object.
+        """
+        pipe_args = self._pipe_dict[self.train_stage][self.model_type]
+        return OpenCVVideoLoader(
+            filenames=self.filenames,
+            resize_dims=self.resize_dims,
+            sequence_length=pipe_args["sequence_length"],
+            step=pipe_args["step"],
+            num_iters=self.num_iters,
+            eval_mode=self.train_stage,
+            do_context=self.model_type == "context",
+            random_shuffle=pipe_args["random_shuffle"],
+            seed=pipe_args["seed"],
+            pad_sequences=pipe_args.get("pad_sequences", True),
+            imgaug=pipe_args["imgaug"],
+            num_threads=self.num_threads,
+            num_workers=self.dali_config["general"].get("num_workers", 0),
+        )
+
+
+def get_video_preparer(dali_config: Union[dict, DictConfig]) -> Type[PrepareVideoLoader]:
+    """Return the class that prepares unlabeled video loaders for `dali.general.backend`.
+
+    Args:
+        dali_config: see `dali` entry of default config file for keys
+
+    Returns:
+        `PrepareDALI` for the "dali" backend (default), `PrepareOpenCV` for the "opencv" backend
+
+    """
+    backend = dali_config["general"].get("backend", "dali")
+    if backend == "dali":
+        # imported here so that the opencv backend does not require DALI
+        from lightning_pose.data.dali import PrepareDALI
+
+        return PrepareDALI
+    elif backend == "opencv":
+        return PrepareOpenCV
+    else:
+        raise NotImplementedError(f"video backend {backend} is not supported")
@@ -0,0 +1,224 @@
+"""Pack labeled frames into a few large tar shards and stream them during training."""
+
+import io
+import json
+import os
+import random
+import tarfile
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import torch
+from PIL import Image
+
+from lightning_pose.data.datasets import BaseTrackingDataset
+from lightning_pose.data.utils import BaseLabeledExampleDict
+from lightning_pose.data.video import split_video_frame_name
+
+# to ignore imports for sphix-autoapidoc
+__all__ = [
+    "write_label_shards",
+    "ShardedLabeledDataset",
+]
+
+_SHARD_INDEX_FILE = "shards.json"
+
+
+def _add_tar_member(tar: tarfile.TarFile, name: str, data: bytes) -> None:
+    info = tarfile.TarInfo(name=name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _image_stats(dataset: BaseTrackingDataset) -> List[List[int]]:
+    """Return [size, modification time] of the file each labeled frame is read from."""
+    stats = {}
+    image_stats = []
+    for img_name in dataset.image_names:
+        video_frame = split_video_frame_name(img_name)
+        file_name = video_frame[0] if video_frame is not None else img_name
+        if file_name not in stats:
+            stat = os.stat(os.path.join(dataset.root_directory, file_name))
+            stats[file_name] = [stat.st_size, stat.st_mtime_ns]
+        image_stats.append(stats[file_name])
+    return image_stats
+
+
+def write_label_shards(
+    dataset: BaseTrackingDataset,
+    shard_dir: str,
+    samples_per_shard: int = 1000,
+) -> List[str]:
+    """Pack the labeled frames and keypoints of a dataset into sequential tar shards.
+
+    Each labeled frame is stored as a tar member named by the index of the frame in the dataset:
+    the original image file, copied byte for byte (i.e. without re-encoding), or a lossless png
+    for frames read from videos. Keypoints are not stored; they are always taken from the
+    dataset. An index file lists the shards, the image names they were built from and the size
+    and modification time of the image (or video) files, so that stale shards are detected when
+    the labeled frames change.
+
+    Args:
+        dataset: dataset whose labeled frames are packed; context frames are not supported
+        shard_dir: output directory for the shards and the index file
+        samples_per_shard: number of labeled frames per shard
+
+    Returns:
+        file names of the shards, relative to `shard_dir`
+
+    """
+    if dataset.do_context:
+        raise NotImplementedError("label shards do not support context frames")
+
+    os.makedirs(shard_dir, exist_ok=True)
+    num_frames = len(dataset.image_names)
+    shard_files = []
+    for start in range(0, num_frames, samples_per_shard):
+        shard_file = f"labels-{start // samples_per_shard:06d}.tar"
+        shard_path = os.path.join(shard_dir, shard_file)
+        # write to a temporary file first so that an interrupted run is never picked up
+        tmp_path = f"{shard_path}.{os.getpid()}.tmp"
+        with tarfile.open(tmp_path, "w") as tar:
+            for idx in range(start, min(start + samples_per_shard, num_frames)):
+                img_name = dataset.image_names[idx]
+                if split_video_frame_name(img_name) is not None:
+                    # frames read from videos are stored losslessly
+                    image, _ = dataset._read_image(img_name)
+                    image_bytes = io.BytesIO()
+                    Image.fromarray(image).save(image_bytes, format="PNG")
+                    _add_tar_member(tar, f"{idx:08d}.image", image_bytes.getvalue())
+                else:
+                    with open(os.path.join(dataset.root_directory, img_name), "rb") as f:
+                        _add_tar_member(tar, f"{idx:08d}.image", f.read())
+        os.replace(tmp_path, shard_path)
+        shard_files.append(shard_file)
+
+    with open(os.path.join(shard_dir, _SHARD_INDEX_FILE), "w") as f:
+        json.dump({
+            "shards": shard_files,
+            "samples_per_shard": samples_per_shard,
+            "image_names": list(dataset.image_names),
+            "image_stats": _image_stats(dataset),
+        }, f)
+    print(f"Packed {num_frames} labeled frames into {len(shard_files)} shards in {shard_dir}")
+
+    return shard_files
+
+
+class ShardedLabeledDataset(torch.utils.data.IterableDataset):
+    """Stream labeled frames from tar shards written by `write_label_shards`.
+
+    Shards are read sequentially, so an epoch opens only a handful of large files rather than one
+    file per labeled frame; this matters on network file systems, where per-file open and metadata
+    latency dominates. Each data loader worker reads its own subset of the shards (or, if there
+    are fewer shards than workers, its own contiguous range of frames, which spans at most a few
+    shards), and frames are shuffled with a buffer of fixed size.
+
+    Decoded frames are augmented and converted to examples by the wrapped dataset, with keypoints
+    taken from the wrapped dataset, so examples are identical to those returned by the wrapped
+    dataset itself. Shards whose image names or image files no longer match the dataset are
+    refused; checking the files costs one `os.stat` per image (or video) file when the dataset
+    is created, but none per epoch.
+
+    """
+
+    def __init__(
+        self,
+        dataset: BaseTrackingDataset,
+        shard_dir: str,
+        indices: Optional[List[int]] = None,
+        shuffle_buffer: int = 256,
+    ) -> None:
+        """Initialize the streaming dataset.
+
+        Args:
+            dataset: labeled dataset the shards were built from; provides the augmentation
+                pipeline and heatmap generation
+            shard_dir: directory containing the shards and their index file
+            indices: indices of the labeled frames to stream, e.g. the training split; defaults
+                to all frames
+            shuffle_buffer: number of frames held in memory for shuffling; 1 disables shuffling
+
+        """
+        if dataset.do_context:
+            raise NotImplementedError("label shards do not support context frames")
+
+        index_file = os.path.join(shard_dir, _SHARD_INDEX_FILE)
+        if not os.path.isfile(index_file):
+            raise FileNotFoundError(
+                f"Could not find label shards in {shard_dir}; create them with "
+                "scripts/create_label_shards.py"
+            )
+        with open(index_file, "r") as f:
+            index = json.load(f)
+        if index["image_names"] != list(dataset.image_names) \
+                or index.get("image_stats") != _image_stats(dataset):
+            raise ValueError(
+                f"Label shards in {shard_dir} do not match the labeled data; recreate them with "
+                "scripts/create_label_shards.py"
+            )
+
+        self.dataset = dataset
+        self.shard_dir = shard_dir
+        self.shard_files = index["shards"]
+        self.samples_per_shard = index["samples_per_shard"]
+        self.indices = list(range(len(dataset))) if indices is None else list(indices)
+        self.shuffle_buffer = shuffle_buffer
+        # advanced on every pass so that frames are shuffled differently in every epoch
+        self._epoch = 0
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def _worker_split(self) -> Tuple[List[str], set]:
+        """Return the shards read and frame indices kept by the current worker."""
+        worker_info = torch.utils.data.get_worker_info()
+        if worker_info is None:
+            return self.shard_files, set(self.indices)
+        num_workers, worker_id = worker_info.num_workers, worker_info.id
+        if len(self.shard_files) >= num_workers:
+            return self.shard_files[worker_id::num_workers], set(self.indices)
+        # contiguous ranges of frames, so that every worker opens only the shards holding them
+        keep = np.array_split(np.array(sorted(self.indices), dtype=int), num_workers)[worker_id]
+        if len(keep) == 0:
+            return [], set()
+        shards = range(keep[0] // self.samples_per_shard, keep[-1] // self.samples_per_shard + 1)
+        return [self.shard_files[i] for i in shards], set(keep.tolist())
+
+    def _read_shards(self, shard_files: List[str], keep: set) -> Iterator[Tuple[int, bytes]]:
+        """Yield (index, encoded image) for the selected frames of the given shards."""
+        last = max(keep, default=-1)
+        for shard_file in shard_files:
+            # stream mode reads the shard strictly sequentially
+            with tarfile.open(os.path.join(self.shard_dir, shard_file), "r|") as tar:
+                for member in tar:
+                    key, field = member.name.split(".", 1)
+                    idx = int(key)
+                    if idx > last:
+                        # frames are stored in order; the rest of the shard is not needed
+                        break
+                    if idx in keep and field == "image":
+                        yield idx, tar.extractfile(member).read()
+
+    def _shuffle(self, samples: Iterator, rng: random.Random) -> Iterator:
+        buffer = []
+        for sample in samples:
+            buffer.append(sample)
+            if len(buffer) >= self.shuffle_buffer:
+                yield buffer.pop(rng.randrange(len(buffer)))
+        rng.shuffle(buffer)
+        yield from buffer
+
+    def __iter__(self) -> Iterator[BaseLabeledExampleDict]:
+        shard_files, keep = self._worker_split()
+        # worker seeds differ across workers and epochs; the epoch counter covers num_workers=0
+        rng = random.Random(torch.initial_seed() + self._epoch)
+        self._epoch += 1
+        shard_files = list(shard_files)
+        rng.shuffle(shard_files)
+        samples = self._shuffle(self._read_shards(shard_files, keep), rng)
+        for idx, image_bytes in samples:
+            image, original_shape = self.dataset._decode_image(io.BytesIO(image_bytes))
+            yield self.dataset.example_from_image(
+                image, self.dataset.keypoints[idx], original_shape, idx,
+            )
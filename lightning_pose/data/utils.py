@@ -6,10 +6,15 @@ import imgaug.augmenters as iaa
 import lightning.pytorch as pl
 import numpy as np
 import torch
-from nvidia.dali.plugin.pytorch import DALIGenericIterator
 from torchtyping import TensorType
 from typeguard import typechecked
 
+try:
+    from nvidia.dali.plugin.pytorch import DALIGenericIterator
+except ImportError:
+    # the opencv video backend does not require DALI
+    DALIGenericIterator = Any
+
 # to ignore imports for sphix-autoapidoc
 __all__ = [
     "BaseLabeledExampleDict",
@@ -176,7 +181,20 @@ class DataExtractor(object):
         self.extract_images = extract_images
         self.remove_augmentations = remove_augmentations
 
-        if self.remove_augmentations:
+        # without images, resize-only keypoints are computed directly from the labels and the
+        # image sizes; no data module is rebuilt and no frames are decoded
+        imgaug_curr = data_module.dataset.imgaug_transform
+        self.keypoints_only = (
+            self.remove_augmentations
+            and not self.extract_images
+            and hasattr(data_module.dataset, "get_resized_keypoints")
+            and getattr(data_module, "%s_dataset" % cond, None) is not None
+            and isinstance(imgaug_curr[-1], iaa.Resize)
+        )
+
+        if self.keypoints_only:
+            self.data_module = data_module
+        elif self.remove_augmentations:
             imgaug_curr = data_module.dataset.imgaug_transform
             if len(imgaug_curr) == 1 and isinstance(imgaug_curr[0], iaa.Resize):
                 # current augmentation just resizes; keep this
@@ -206,6 +224,8 @@ class DataExtractor(object):
                         imgaug_transform=imgaug_new,
                         downsample_factor=dataset_old.downsample_factor,
                         do_context=dataset_old.do_context,
+                        frame_store_dir=dataset_old.frame_store_dir,
+                        reduced_resolution_decode=dataset_old.reduced_resolution_decode,
                     )
                 elif isinstance(dataset_old, BaseTrackingDataset):
                     dataset_new = BaseTrackingDataset(
@@ -213,6 +233,8 @@ class DataExtractor(object):
                         csv_path=dataset_old.csv_path,
                         imgaug_transform=imgaug_new,
                         do_context=dataset_old.do_context,
+                        frame_store_dir=dataset_old.frame_store_dir,
+                        reduced_resolution_decode=dataset_old.reduced_resolution_decode,
                     )
                 elif isinstance(dataset_old, MultiviewHeatmapDataset):
                     dataset_new = MultiviewHeatmapDataset(
@@ -221,6 +243,8 @@ class DataExtractor(object):
                         view_names=dataset_old.view_names,
                         imgaug_transform=imgaug_new,
                         do_context=dataset_old.do_context,
+                        frame_store_dir=dataset_old.frame_store_dir,
+                        reduced_resolution_decode=dataset_old.reduced_resolution_decode,
                     )
                 else:
                     raise NotImplementedError
@@ -318,6 +342,25 @@ class DataExtractor(object):
         )
         return concat_keypoints, concat_images
 
+    def extract_keypoints(self) -> TensorType["num_examples", Any]:
+        """Compute the resize-only keypoints of the split without loading any images."""
+        from lightning_pose.data.datasets import HeatmapDataset, MultiviewHeatmapDataset
+
+        dataset = self.data_module.dataset
+        split = getattr(self.data_module, "%s_dataset" % self.cond)
+        idxs = [int(idx) for idx in split.indices]
+        keypoints = dataset.get_resized_keypoints(idxs)
+        if isinstance(dataset, (HeatmapDataset, MultiviewHeatmapDataset)):
+            # heatmap datasets set keypoints that fall outside of the frame to nan
+            out_of_frame = torch.logical_or(
+                torch.logical_or(keypoints[:, :, 0] < 0, keypoints[:, :, 1] < 0),
+                torch.logical_or(
+                    keypoints[:, :, 0] >= dataset.width, keypoints[:, :, 1] >= dataset.height,
+                ),
+            )
+            keypoints[out_of_frame, :] = torch.nan
+        return keypoints.reshape(len(idxs), -1)
+
     def __call__(
         self,
     ) -> Tuple[
@@ -328,6 +371,8 @@ class DataExtractor(object):
             None,
         ],
     ]:
+        if self.keypoints_only:
+            return self.extract_keypoints(), None
         loader = self.get_loader()
         loader = self.verify_labeled_loader(loader)
         return self.iterate_over_dataloader(loader)
@@ -406,9 +451,13 @@ def clean_any_nans(data: torch.Tensor, dim: int) -> torch.Tensor:
 
 @typechecked
 def count_frames(video_list: Union[List[str], str, List[List[str]]]) -> int:
-    """Simple function to count the number of frames in a video or a list of videos."""
+    """Simple function to count the number of frames in a video or a list of videos.
+
+    Frame counts are exact and cached per video; see `get_video_metadata`.
+
+    """
 
-    import cv2
+    from lightning_pose.data.video import get_video_metadata
 
     if isinstance(video_list, str):
         video_list = [video_list]
@@ -417,9 +466,7 @@ def count_frames(video_list: Union[List[str], str, List[List[str]]]) -> int:
         video_list = video_list[0]
     num_frames = 0
     for video_file in video_list:
-        cap = cv2.VideoCapture(video_file)
-        num_frames += int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        cap.release()
+        num_frames += get_video_metadata(video_file)["num_frames"]
 
     return num_frames
 
@@ -494,21 +541,16 @@ def generate_heatmaps(
     nan_idxs = torch.isnan(keypoints)[:, :, 0]
     xv = torch.arange(out_width, device=keypoints.device)
     yv = torch.arange(out_height, device=keypoints.device)
-    # note flipped order because of pytorch's ij and numpy's xy indexing for meshgrid
-    xx, yy = torch.meshgrid(yv, xv, indexing="ij")
-    # adds batch and num_keypoints dimensions to grids
-    xx = xx.unsqueeze(0).unsqueeze(0)
-    yy = yy.unsqueeze(0).unsqueeze(0)
-    # adds dimension corresponding to the first dimension of the 2d grid
-    keypoints = keypoints.unsqueeze(2)
-    # evaluates 2d gaussian with mean equal to the keypoint and var equal to sigma^2
-    heatmaps = (yy - keypoints[:, :, :, :1]) ** 2  # also flipped order here
-    heatmaps += (xx - keypoints[:, :, :, 1:]) ** 2  # also flipped order here
-    heatmaps *= -1
-    heatmaps /= 2 * sigma**2
-    heatmaps = torch.exp(heatmaps)
-    # normalize all heatmaps to one
-    heatmaps = heatmaps / torch.sum(heatmaps, dim=(2, 3), keepdim=True)
+    # the isotropic 2d gaussian factorizes into 1d gaussians along each axis, so only
+    # O(height + width) exponentials are evaluated per keypoint
+    # shape (batch, num_keypoints, width)
+    gauss_x = torch.exp(-((xv - keypoints[:, :, 0:1]) ** 2) / (2 * sigma**2))
+    # shape (batch, num_keypoints, height)
+    gauss_y = torch.exp(-((yv - keypoints[:, :, 1:2]) ** 2) / (2 * sigma**2))
+    # normalize each factor so that the 2d heatmap sums to one
+    gauss_x = gauss_x / torch.sum(gauss_x, dim=2, keepdim=True)
+    gauss_y = gauss_y / torch.sum(gauss_y, dim=2, keepdim=True)
+    heatmaps = gauss_y.unsqueeze(3) * gauss_x.unsqueeze(2)
     # replace nans with zeros heatmaps
     # (all zeros heatmaps are ignored in the supervised heatmap loss)
     if uniform_heatmaps:
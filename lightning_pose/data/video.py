@@ -0,0 +1,455 @@
+"""Random access to individual video frames for training directly from videos.
+
+Also holds the backend-independent setup of unlabeled video loaders, which does not require DALI.
+
+"""
+
+import json
+import os
+import re
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Dict, List, Literal, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+from omegaconf import DictConfig
+
+from lightning_pose.data.utils import count_frames
+
+# to ignore imports for sphix-autoapidoc
+__all__ = [
+    "get_video_metadata",
+    "PrepareVideoLoader",
+    "split_video_frame_name",
+    "video_frame_name",
+    "VideoFrameReader",
+]
+
+# labeled frames that are read from videos are referenced as "<video file>:<frame index>"
+_VIDEO_FRAME_PATTERN = re.compile(r"^(.+\.(?:mp4|avi|mov|mkv|m4v)):(\d+)$", re.IGNORECASE)
+
+
+# bump to invalidate metadata sidecar files written by older versions
+_METADATA_VERSION = 1
+
+# metadata of videos already probed by this process, keyed by absolute path
+_video_metadata: Dict[str, dict] = {}
+
+
+def _metadata_cache_file(video_file: str) -> str:
+    directory, name = os.path.split(video_file)
+    return os.path.join(directory, f".{name}.meta.json")
+
+
+def _probe_video_av(video_file: str) -> dict:
+    """Read exact metadata by demuxing the video with PyAV; no frames are decoded."""
+    import av
+
+    with av.open(video_file) as container:
+        stream = container.streams.video[0]
+        pts, keyframe_pts = [], []
+        for packet in container.demux(stream):
+            if packet.pts is None:
+                # flush packet
+                continue
+            pts.append(packet.pts)
+            if packet.is_keyframe:
+                keyframe_pts.append(packet.pts)
+        # packets are stored in decoding order; frame indices follow presentation order
+        frame_idx = {p: i for i, p in enumerate(sorted(pts))}
+        return {
+            "num_frames": len(pts),
+            "fps": float(stream.average_rate or stream.guessed_rate or 0),
+            "height": stream.codec_context.height,
+            "width": stream.codec_context.width,
+            "codec": stream.codec_context.name,
+            "keyframes": sorted(frame_idx[p] for p in keyframe_pts),
+        }
+
+
+def _probe_video_cv2(video_file: str, tail: int = 16) -> dict:
+    """Read metadata with OpenCV; keyframes are unknown.
+
+    The frame count reported by the container is only an estimate for some codecs, so it is
+    verified by decoding the last `tail` frames before the reported end, and any frames after
+    it; decoding starts further back if no frame is found there.
+
+    """
+    cap = cv2.VideoCapture(video_file)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video {video_file}")
+    fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+    metadata = {
+        "fps": float(cap.get(cv2.CAP_PROP_FPS)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "codec": "".join(chr((fourcc >> 8 * i) & 0xFF) for i in range(4)).strip(),
+        "keyframes": [],
+    }
+    reported = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    while True:
+        start = max(reported - tail, 0)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        num_grabbed = 0
+        while cap.grab():
+            num_grabbed += 1
+        if num_grabbed > 0 or start == 0:
+            break
+        # the container overestimates the frame count; look further back
+        tail *= 4
+    cap.release()
+    metadata["num_frames"] = start + num_grabbed
+    return metadata
+
+
+def get_video_metadata(video_file: str) -> dict:
+    """Return the exact frame count, fps, resolution, codec and keyframes of a video.
+
+    Videos are probed once; the result is stored in a hidden sidecar file next to the video (if
+    the directory is writable) and reused by all later calls and processes until the size or
+    modification time of the video changes. Videos are probed with PyAV if it is installed,
+    which is fast, exact and also finds keyframes; otherwise the frame count reported by OpenCV
+    is verified by decoding the frames around the end of the video.
+
+    Args:
+        video_file: path to the video
+
+    Returns:
+        dict with keys num_frames, fps, height, width, codec and keyframes (sorted indices of
+        keyframes; empty if unknown)
+
+    """
+    video_file = os.path.abspath(video_file)
+    stat = os.stat(video_file)
+    key = {"version": _METADATA_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    metadata = _video_metadata.get(video_file)
+    if metadata is not None and metadata["key"] == key:
+        return metadata
+
+    cache_file = _metadata_cache_file(video_file)
+    metadata = None
+    try:
+        with open(cache_file, "r") as f:
+            metadata = json.load(f)
+        if metadata.get("key") != key:
+            metadata = None
+    except (OSError, ValueError):
+        pass
+
+    if metadata is None:
+        try:
+            metadata = _probe_video_av(video_file)
+        except ImportError:
+            metadata = _probe_video_cv2(video_file)
+        metadata["key"] = key
+        # write to a temporary file first so that concurrent readers never see a partial file
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, "w") as f:
+                json.dump(metadata, f)
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            pass
+
+    _video_metadata[video_file] = metadata
+    return metadata
+
+
+def split_video_frame_name(name: str) -> Optional[Tuple[str, int]]:
+    """Split a "<video file>:<frame index>" reference into video file and frame index.
+
+    Args:
+        name: frame name from a label csv file
+
+    Returns:
+        tuple (video file, frame index), or None if the name refers to an image file
+
+    """
+    match = _VIDEO_FRAME_PATTERN.match(name)
+    if match is None:
+        return None
+    return match.group(1), int(match.group(2))
+
+
+def video_frame_name(video_file: str, frame_idx: int) -> str:
+    """Return the "<video file>:<frame index>" reference of a video frame."""
+    return f"{video_file}:{frame_idx}"
+
+
+class VideoFrameReader(object):
+    """Read video frames by index, keeping one decoder open per video.
+
+    Decoders remember their position in the video. A request for a frame shortly after the last
+    frame read, or anywhere before the next keyframe, is served by decoding forward instead of
+    seeking, so nearby frames (e.g. the context frames around a labeled frame, which are
+    requested in order) cost a single seek.
+    Decoders are opened lazily in each process and are never shared between processes.
+
+    """
+
+    def __init__(self, max_forward: int = 32, max_open: int = 16) -> None:
+        """Initialize the reader.
+
+        Args:
+            max_forward: largest gap to the next requested frame that is always decoded through
+                rather than skipped with a seek; larger gaps are decoded through only if no
+                keyframe lies in between
+            max_open: number of videos kept open at once; least recently used videos are closed
+
+        """
+        self.max_forward = max_forward
+        self.max_open = max_open
+        self._captures: OrderedDict = OrderedDict()  # video file -> [capture, next frame index]
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_captures"] = OrderedDict()
+        state["_pid"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _capture(self, video_file: str) -> list:
+        if self._pid != os.getpid():
+            # decoders do not survive a fork
+            self._captures = OrderedDict()
+            self._pid = os.getpid()
+        if video_file in self._captures:
+            self._captures.move_to_end(video_file)
+            return self._captures[video_file]
+        cap = cv2.VideoCapture(video_file)
+        if not cap.isOpened():
+            raise IOError(f"Could not open video {video_file}")
+        self._captures[video_file] = [cap, 0]
+        if len(self._captures) > self.max_open:
+            _, (old_cap, _) = self._captures.popitem(last=False)
+            old_cap.release()
+        return self._captures[video_file]
+
+    def num_frames(self, video_file: str) -> int:
+        """Return the number of frames in a video."""
+        return get_video_metadata(video_file)["num_frames"]
+
+    def frame_shape(self, video_file: str) -> Tuple[int, int]:
+        """Return the (height, width) of the frames of a video."""
+        metadata = get_video_metadata(video_file)
+        return metadata["height"], metadata["width"]
+
+    def _must_seek(self, video_file: str, position: int, frame_idx: int) -> bool:
+        if frame_idx < position:
+            return True
+        if frame_idx - position <= self.max_forward:
+            return False
+        # a seek restarts decoding at the last keyframe before the frame, so it only saves work
+        # if that keyframe comes after the current position; without a keyframe index, seek
+        keyframes = get_video_metadata(video_file)["keyframes"]
+        if not keyframes:
+            return True
+        i = bisect_right(keyframes, position)
+        return i < len(keyframes) and keyframes[i] <= frame_idx
+
+    def read(self, video_file: str, frame_idx: int) -> np.ndarray:
+        """Decode a single frame.
+
+        Args:
+            video_file: absolute path to the video
+            frame_idx: index of the frame in the video
+
+        Returns:
+            (height, width, 3) uint8 RGB frame
+
+        """
+        with self._lock:
+            capture = self._capture(video_file)
+            cap, position = capture
+            if self._must_seek(video_file, position, frame_idx):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+                position = frame_idx
+            while position < frame_idx:
+                cap.grab()
+                position += 1
+            ok, frame = cap.read()
+            if not ok:
+                # leave the decoder in a state that forces a seek on the next request
+                capture[1] = np.iinfo(np.int64).max
+                raise IOError(f"Could not read frame {frame_idx} of video {video_file}")
+            capture[1] = frame_idx + 1
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+class PrepareVideoLoader(object):
+    """Sequence and batch sizes of unlabeled video loaders, shared by all video backends.
+
+    Subclasses build the loader itself in `__call__`; see `PrepareDALI` and `PrepareOpenCV`.
+
+    """
+
+    def __init__(
+        self,
+        train_stage: Literal["predict", "train"],
+        model_type: Literal["base", "context"],
+        filenames: Union[List[str], List[List[str]]],
+        resize_dims: List[int],
+        dali_config: Union[dict, DictConfig] = None,
+        imgaug: Optional[str] = "default",
+        num_threads: int = 1,
+    ) -> None:
+
+        # determine if we have a multiview pipeline
+        if isinstance(filenames, list) and isinstance(filenames[0], list):
+            self.multiview = True
+        else:
+            self.multiview = False
+
+        # make sure `filenames` is a list of existing video files
+        if isinstance(filenames, list) and isinstance(filenames[0], str):
+            filenames = [filenames]
+        for view_list in filenames:
+            for vid in view_list:
+                if not os.path.exists(vid) or not os.path.isfile(vid):
+                    raise FileNotFoundError(f"{vid} is not a video file!")
+
+        self.train_stage = train_stage
+        self.model_type = model_type
+        self.filenames = filenames
+        self.resize_dims = resize_dims
+        self.dali_config = dali_config
+        self.num_threads = num_threads
+        self.frame_count = count_frames(self.filenames)
+        self._pipe_dict: dict = self._setup_pipe_dict(self.filenames, imgaug)
+
+    @property
+    def num_iters(self) -> int:
+        # count frames
+        # "how many times should we enumerate the data loader?"
+        # sum across vids
+        pipe_dict = self._pipe_dict[self.train_stage][self.model_type]
+        if self.model_type == "base":
+            return int(np.ceil(self.frame_count / (pipe_dict["sequence_length"])))
+        elif self.model_type == "context":
+            if pipe_dict["step"] == 1:  # 0-5, 1-6, 2-7, 3-8, 4-9 ...
+                return int(np.ceil(self.frame_count / (pipe_dict["batch_size"])))
+            elif pipe_dict["step"] == pipe_dict["sequence_length"]:
+                # taking the floor because during training we don't care about missing the last
+                # non-full batch. we prefer having fewer batches but valid.
+                return int(
+                    np.floor(
+                        self.frame_count / (pipe_dict["batch_size"] * pipe_dict["sequence_length"])
+                    )
+                )
+            elif (pipe_dict["batch_size"] == 1) and (
+                pipe_dict["step"] == (pipe_dict["sequence_length"] - 4)
+            ):
+                # the case of prediction with a single sequence at a time and internal model
+                # reshapes
+                if pipe_dict["step"] <= 0:
+                    raise ValueError(
+                        "step cannot be 0, please modify "
+                        "cfg.dali.context.predict.sequence_length to be > 4"
+                    )
+                # remove the first sequence
+                data_except_first_batch = self.frame_count - pipe_dict["sequence_length"]
+                # calculate how many "step"s are needed to get at least to the end
+                # count back the first sequence
+                num_iters = int(np.ceil(data_except_first_batch / pipe_dict["step"])) + 1
+                return num_iters
+            else:
+                raise NotImplementedError
+
+    def _setup_pipe_dict(
+        self,
+        filenames: Union[List[str], List[List[str]]],
+        imgaug: str,
+    ) -> Dict[str, dict]:
+        """All of the pipeline args in one place."""
+
+        dict_args = {
+            "predict": {"context": {}, "base": {}},
+            "train": {"context": {}, "base": {}},
+        }
+        gen_cfg = self.dali_config["general"]
+
+        # base (vanilla single-frame model), train pipe args
+        base_train_cfg = self.dali_config["base"]["train"]
+        dict_args["train"]["base"] = {
+            "filenames": filenames,
+            "resize_dims": self.resize_dims,
+            "sequence_length": base_train_cfg["sequence_length"],
+            "step": base_train_cfg["sequence_length"],
+            "batch_size": 1,
+            "seed": gen_cfg["seed"],
+            "num_threads": self.num_threads,
+            "device_id": 0,
+            "random_shuffle": True,
+            "device": "gpu",
+            "imgaug": imgaug,
+        }
+
+        # base (vanilla single-frame model), predict pipe args
+        base_pred_cfg = self.dali_config["base"]["predict"]
+        dict_args["predict"]["base"] = {
+            "filenames": filenames,
+            "resize_dims": self.resize_dims,
+            "sequence_length": base_pred_cfg["sequence_length"],
+            "step": base_pred_cfg["sequence_length"],
+            "batch_size": 1,
+            "seed": gen_cfg["seed"],
+            "num_threads": self.num_threads,
+            "device_id": 0,
+            "random_shuffle": False,
+            "device": "gpu",
+            "name": "reader",
+            "pad_sequences": True,
+            "imgaug": "default",  # no imgaug when predicting
+        }
+
+        # context (five-frame) model, predict pipe args
+        context_pred_cfg = self.dali_config["context"]["predict"]
+        dict_args["predict"]["context"] = {
+            "filenames": filenames,
+            "resize_dims": self.resize_dims,
+            "sequence_length": context_pred_cfg["sequence_length"],
+            "step": context_pred_cfg["sequence_length"] - 4,
+            "batch_size": 1,
+            "num_threads": self.num_threads,
+            "device_id": 0,
+            "random_shuffle": False,
+            "device": "gpu",
+            "name": "reader",
+            "seed": gen_cfg["seed"],
+            "pad_sequences": True,
+            # "pad_last_batch": True,
+            "imgaug": "default",  # no imgaug when predicting
+        }
+
+        # context (five-frame) model, train pipe args
+        # grab a single sequence of frames, will resize into 5-frame chunks at the
+        # representation level inside BaseFeatureExtractor
+        # note: reusing the batch size argument
+        context_train_cfg = self.dali_config["context"]["train"]
+        dict_args["train"]["context"] = {
+            "filenames": filenames,
+            "resize_dims": self.resize_dims,
+            "sequence_length": context_train_cfg["batch_size"],
+            "step": context_train_cfg["batch_size"],
+            "batch_size": 1,
+            "seed": gen_cfg["seed"],
+            "num_threads": self.num_threads,
+            "device_id": 0,
+            "random_shuffle": True,
+            "device": "gpu",
+            "imgaug": imgaug,
+        }
+        # our floor above should prevent us from getting to the very final batch.
+
+        return dict_args
+
+    def __call__(self):
+        raise NotImplementedError
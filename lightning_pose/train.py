@@ -21,7 +21,7 @@ from lightning_pose.utils.predictions import predict_dataset
 from lightning_pose.utils.scripts import (
     calculate_train_batches,
     compute_metrics,
-    export_predictions_and_labeled_video,
+    export_predictions_and_labeled_videos,
     get_callbacks,
     get_data_module,
     get_dataset,
@@ -168,10 +168,12 @@ def train(cfg: DictConfig) -> None:
     # predict on all labeled frames (train/val/test)
     # ----------------------------------------------------------------------------------
     # Rebuild trainer with devices=1 for prediction. Training flags not needed.
-    trainer = pl.Trainer(accelerator="gpu", devices=1)
+    trainer = pl.Trainer(accelerator="auto", devices=1)
     pretty_print_str("Predicting train/val/test images...")
+    # file format of all predictions, e.g. csv or parquet
+    preds_ext = "." + cfg.eval.get("predictions_format", "csv")
     # compute and save frame-wise predictions
-    preds_file = os.path.join(hydra_output_directory, "predictions.csv")
+    preds_file = os.path.join(hydra_output_directory, "predictions" + preds_ext)
     predict_dataset(
         cfg=cfg,
         trainer=trainer,
@@ -182,10 +184,10 @@ def train(cfg: DictConfig) -> None:
     )
     # compute and save various metrics
     try:
-        # take care of multiview case, where multiple csv files have been saved
+        # take care of multiview case, where multiple prediction files have been saved
         preds_files = [
             os.path.join(hydra_output_directory, path) for path in
-            os.listdir(hydra_output_directory) if path.endswith(".csv")
+            os.listdir(hydra_output_directory) if path.endswith(preds_ext)
         ]
         if len(preds_files) > 1:
             preds_file = preds_files
@@ -207,41 +209,35 @@ def train(cfg: DictConfig) -> None:
                 f"Found {len(filenames)} {vidstr} to predict (in cfg.eval.test_videos_directory)"
             )
 
+        prediction_csv_files = []
+        labeled_mp4_files = []
         for video_file in filenames:
             assert os.path.isfile(video_file)
-            pretty_print_str(f"Predicting video: {video_file}...")
             # get save name for prediction csv file
             video_pred_dir = os.path.join(hydra_output_directory, "video_preds")
             video_pred_name = os.path.splitext(os.path.basename(video_file))[0]
-            prediction_csv_file = os.path.join(video_pred_dir, video_pred_name + ".csv")
+            prediction_csv_files.append(os.path.join(video_pred_dir, video_pred_name + preds_ext))
             # get save name labeled video csv
             if cfg.eval.save_vids_after_training:
                 labeled_vid_dir = os.path.join(video_pred_dir, "labeled_videos")
-                labeled_mp4_file = os.path.join(labeled_vid_dir, video_pred_name + "_labeled.mp4")
+                labeled_mp4_files.append(
+                    os.path.join(labeled_vid_dir, video_pred_name + "_labeled.mp4")
+                )
             else:
-                labeled_mp4_file = None
-            # predict on video
-            export_predictions_and_labeled_video(
-                video_file=video_file,
-                cfg=cfg,
-                ckpt_file=best_ckpt,
-                prediction_csv_file=prediction_csv_file,
-                labeled_mp4_file=labeled_mp4_file,
-                trainer=trainer,
-                model=model,
-                data_module=data_module_pred,
-                save_heatmaps=cfg.eval.get("predict_vids_after_training_save_heatmaps", False),
-            )
-            # compute and save various metrics
-            # try:
-            compute_metrics(
-                cfg=cfg,
-                preds_file=prediction_csv_file,
-                data_module=data_module_pred,
-            )
-            # except Exception as e:
-            #     print(f"Error predicting on video {video_file}:\n{e}")
-            #     continue
+                labeled_mp4_files.append(None)
+        # predict on videos, preparing the next video and saving the previous one in the
+        # background; also computes and saves various metrics
+        export_predictions_and_labeled_videos(
+            video_files=filenames,
+            cfg=cfg,
+            ckpt_file=best_ckpt,
+            prediction_csv_files=prediction_csv_files,
+            labeled_mp4_files=labeled_mp4_files,
+            trainer=trainer,
+            model=model,
+            data_module=data_module_pred,
+            save_heatmaps=cfg.eval.get("predict_vids_after_training_save_heatmaps", False),
+        )
 
     # ----------------------------------------------------------------------------------
     # predict on OOD frames
@@ -273,7 +269,7 @@ def train(cfg: DictConfig) -> None:
         data_module_ood.setup()
         pretty_print_str("Predicting OOD images...")
         # compute and save frame-wise predictions
-        preds_file_ood = os.path.join(hydra_output_directory, "predictions_new.csv")
+        preds_file_ood = os.path.join(hydra_output_directory, "predictions_new" + preds_ext)
         predict_dataset(
             cfg=cfg_ood,
             trainer=trainer,
@@ -284,10 +280,11 @@ def train(cfg: DictConfig) -> None:
         )
         # compute and save various metrics
         try:
-            # take care of multiview case, where multiple csv files have been saved
+            # take care of multiview case, where multiple prediction files have been saved
             preds_files = [
                 os.path.join(hydra_output_directory, path) for path in
-                os.listdir(hydra_output_directory) if path.startswith("predictions_new")
+                os.listdir(hydra_output_directory)
+                if path.startswith("predictions_new") and path.endswith(preds_ext)
             ]
             if len(preds_files) > 1:
                 preds_file_ood = preds_files
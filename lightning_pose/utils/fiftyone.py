@@ -10,7 +10,12 @@ from tqdm import tqdm
 from typeguard import typechecked
 
 from lightning_pose.utils import pretty_print_str
-from lightning_pose.utils.io import return_absolute_data_paths, return_absolute_path
+from lightning_pose.utils.io import (
+    load_predictions,
+    return_absolute_data_paths,
+    return_absolute_path,
+    split_prediction_file,
+)
 
 # to ignore imports for sphix-autoapidoc
 __all__ = [
@@ -120,10 +125,10 @@ class FiftyOneImagePlotter:
         model_abs_paths = self.get_model_abs_paths()
         if cfg.data.get("view_names", None) and len(cfg.data.view_names) > 1:
             self.pred_csv_files = []
+            stem, extension = split_prediction_file(csv_filename) or os.path.splitext(csv_filename)
             for model_dir in model_abs_paths:
                 csv_list = [
-                    os.path.join(model_dir, csv_filename.replace(".csv", f"_{v}.csv"))
-                    for v in cfg.data.view_names
+                    os.path.join(model_dir, f"{stem}_{v}{extension}") for v in cfg.data.view_names
                 ]
                 self.pred_csv_files.append(csv_list)
         else:
@@ -183,7 +188,7 @@ class FiftyOneImagePlotter:
             # always assume [1, 2] since our code generated the predictions
             temp_df = []
             for pred_csv_file in pred_csv_file_list:
-                temp_df.append(pd.read_csv(pred_csv_file, header=[1, 2]))
+                temp_df.append(load_predictions(pred_csv_file, header_rows=[1, 2]))
             temp_df = pd.concat(temp_df)
             self.model_preds_dict[model_name] = dfConverter(temp_df, self.keypoints_to_plot)()
             self.preds_pandas_df_dict[model_name] = temp_df
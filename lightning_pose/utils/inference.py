@@ -0,0 +1,207 @@
+"""Lean inference loop around `predict_step`, without the overhead of a lightning trainer."""
+
+import queue
+import sys
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+import numpy as np
+import torch
+
+from lightning_pose.models import ALLOWED_MODELS
+
+# to ignore imports for sphix-autoapidoc
+__all__ = [
+    "InferenceEngine",
+]
+
+
+def _is_dali_loader(dataloader: Any) -> bool:
+    """Check for a DALI loader without importing DALI: none exists unless its module is loaded."""
+    dali = sys.modules.get("lightning_pose.data.dali")
+    return dali is not None and isinstance(dataloader, dali.LitDaliWrapper)
+
+
+def _map_tensors(fn: Callable, obj: Any, path: Tuple = ()) -> Any:
+    """Apply fn(path, tensor) to every tensor of a (nested) batch."""
+    if isinstance(obj, torch.Tensor):
+        return fn(path, obj)
+    if isinstance(obj, dict):
+        return {key: _map_tensors(fn, value, path + (key,)) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_map_tensors(fn, value, path + (i,)) for i, value in enumerate(obj))
+    return obj
+
+
+class _PinnedBuffers(object):
+    """Ring of reusable page-locked host buffers, each slot large enough for one batch."""
+
+    def __init__(self, num_slots: int) -> None:
+        self._slots = [{} for _ in range(num_slots)]
+        self._next = 0
+
+    def pin(self, batch: Any) -> Any:
+        """Copy the cpu tensors of a batch into the next slot of the ring."""
+        slot = self._slots[self._next]
+        self._next = (self._next + 1) % len(self._slots)
+
+        def _pin(path: Tuple, tensor: torch.Tensor) -> torch.Tensor:
+            if tensor.device.type != "cpu":
+                return tensor
+            buffer = slot.get(path)
+            if buffer is None or buffer.shape != tensor.shape or buffer.dtype != tensor.dtype:
+                buffer = torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=True)
+                slot[path] = buffer
+            return buffer.copy_(tensor)
+
+        return _map_tensors(_pin, batch)
+
+
+def _grow(array: np.ndarray, num_rows: int) -> np.ndarray:
+    grown = np.empty((max(num_rows, 2 * array.shape[0]), array.shape[1]), dtype=array.dtype)
+    grown[:array.shape[0]] = array
+    return grown
+
+
+class InferenceEngine(object):
+    """Run `predict_step` of a model over a data loader with minimal per-batch overhead.
+
+    Unlike `pl.Trainer.predict`, no callbacks or hooks run and predictions are written into
+    preallocated float32 arrays rather than collected in a list. Batches are loaded by a
+    background thread that keeps up to `prefetch` batches ready; when predicting on a GPU, they
+    are copied into reusable page-locked host buffers, so that host-to-device copies do not
+    block. DALI loaders, whose batches are already on the GPU and prefetched by DALI itself, are
+    iterated directly. On the CPU the same loop runs without pinned memory.
+
+    """
+
+    def __init__(
+        self,
+        model: ALLOWED_MODELS,
+        device: Optional[Union[str, torch.device]] = None,
+        batch_size: Optional[int] = None,
+        prefetch: int = 2,
+    ) -> None:
+        """
+
+        Args:
+            model: model used for prediction
+            device: device the model runs on; defaults to the gpu if one is available
+            batch_size: batch size for torch data loaders, which are rebuilt with this batch
+                size; None keeps the batch size of the loader. Video loaders are unaffected, their
+                batch size is the sequence length
+            prefetch: number of batches loaded ahead of the model; 0 loads batches inline
+
+        """
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.model = model
+        self.device = torch.device(device)
+        self.batch_size = batch_size
+        self.prefetch = prefetch
+
+    def _loader(self, dataloader: Iterable) -> Iterable:
+        if self.batch_size is None or not isinstance(dataloader, torch.utils.data.DataLoader):
+            return dataloader
+        return torch.utils.data.DataLoader(
+            dataloader.dataset,
+            batch_size=self.batch_size,
+            num_workers=dataloader.num_workers,
+            collate_fn=dataloader.collate_fn,
+        )
+
+    def _batches(self, dataloader: Iterable) -> Iterator[Any]:
+        if self.prefetch == 0 or _is_dali_loader(dataloader):
+            yield from dataloader
+            return
+
+        # slots in use: one batch in the model, `prefetch` in the queue and one being filled
+        buffers = _PinnedBuffers(self.prefetch + 2) if self.device.type == "cuda" else None
+        batches = queue.Queue(maxsize=self.prefetch)
+        done = object()
+        stop = threading.Event()
+
+        def _put(item) -> bool:
+            # give up once the consumer stops, so that the thread never blocks on a full queue
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def _produce() -> None:
+            try:
+                for batch in dataloader:
+                    if buffers is not None:
+                        batch = buffers.pin(batch)
+                    if not _put(batch):
+                        return
+                _put(done)
+            except Exception as e:
+                _put(e)
+
+        thread = threading.Thread(target=_produce, daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is done:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            stop.set()
+            thread.join()
+
+    def predict(self, dataloader: Iterable) -> Tuple[np.ndarray, np.ndarray]:
+        """Predict keypoints for all batches of a data loader.
+
+        Args:
+            dataloader: torch data loader of labeled frames, or a DALI or OpenCV video loader
+
+        Returns:
+            tuple
+                - keypoints of shape (num_rows, 2 * num_keypoints), one row per prediction in
+                  the order of the loader, as returned by `predict_step`
+                - confidences of shape (num_rows, num_keypoints)
+
+        """
+        dataloader = self._loader(dataloader)
+        self.model.eval()
+        self.model.to(self.device)
+
+        outputs: Dict[str, np.ndarray] = {}
+        num_rows = 0
+        with torch.inference_mode():
+            for batch_idx, batch in enumerate(self._batches(dataloader)):
+                batch = _map_tensors(
+                    lambda path, tensor: tensor.to(self.device, non_blocking=True), batch,
+                )
+                keypoints, confidences = self.model.predict_step(
+                    batch_dict=batch, batch_idx=batch_idx,
+                )[:2]
+                num_rows_batch = keypoints.shape[0]
+                if not outputs:
+                    # every batch but the last usually has as many rows as the first one
+                    capacity = num_rows_batch * len(dataloader)
+                    outputs["keypoints"] = np.empty((capacity, keypoints.shape[1]), np.float32)
+                    outputs["confidences"] = np.empty((capacity, confidences.shape[1]), np.float32)
+                if num_rows + num_rows_batch > outputs["keypoints"].shape[0]:
+                    for key in outputs:
+                        outputs[key] = _grow(outputs[key], num_rows + num_rows_batch)
+                rows = slice(num_rows, num_rows + num_rows_batch)
+                # copying to the host also waits for the batch, so its pinned buffer can be reused
+                outputs["keypoints"][rows] = keypoints.float().cpu().numpy()
+                outputs["confidences"][rows] = confidences.float().cpu().numpy()
+                num_rows += num_rows_batch
+
+        if not outputs:
+            num_keypoints = self.model.num_keypoints
+            return (
+                np.empty((0, 2 * num_keypoints), np.float32),
+                np.empty((0, num_keypoints), np.float32),
+            )
+        return outputs["keypoints"][:num_rows], outputs["confidences"][:num_rows]
@@ -1,8 +1,12 @@
 """Path handling functions."""
 
+import hashlib
+import json
 import os
-from typing import List, Optional, Tuple, Union
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
+import h5py
+import numpy as np
 import pandas as pd
 from omegaconf import DictConfig, ListConfig
 from typeguard import typechecked
@@ -11,7 +15,12 @@ from typeguard import typechecked
 __all__ = [
     "ckpt_path_from_base_path",
     "check_if_semi_supervised",
+    "load_label_csv",
     "load_label_csv_from_cfg",
+    "register_prediction_format",
+    "split_prediction_file",
+    "save_predictions",
+    "load_predictions",
     "get_keypoint_names",
     "return_absolute_path",
     "return_absolute_data_paths",
@@ -84,6 +93,123 @@ def check_if_semi_supervised(losses_to_use: Union[ListConfig, list, None] = None
     return semi_supervised
 
 
+def _label_cache_file(csv_file: str, header_rows: List[int]) -> str:
+    directory, name = os.path.split(os.path.abspath(csv_file))
+    # one cache per header layout; callers with different header rows do not evict each other
+    header = "-".join(str(row) for row in header_rows)
+    return os.path.join(directory, f".{name}.header{header}.cache.npz")
+
+
+def _file_sha1(path: str) -> str:
+    hasher = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _read_label_cache(
+    cache_file: str, csv_file: str, header_rows: List[int],
+) -> Optional[pd.DataFrame]:
+    """Return the cached labels if they are still valid for the csv file, else None."""
+    if not os.path.isfile(cache_file):
+        return None
+    try:
+        with np.load(cache_file, allow_pickle=False) as cache:
+            meta = json.loads(str(cache["meta"]))
+            if meta["header_rows"] != header_rows:
+                return None
+            stat = os.stat(csv_file)
+            if meta["size"] != stat.st_size:
+                return None
+            mtime_changed = meta["mtime_ns"] != stat.st_mtime_ns
+            if mtime_changed and meta["sha1"] != _file_sha1(csv_file):
+                # file was modified; a changed mtime alone (e.g. after copying) is not enough
+                return None
+            columns = pd.MultiIndex.from_arrays(
+                [level.tolist() for level in cache["columns"]], names=meta["column_names"],
+            )
+            index = pd.Index(cache["index"].tolist(), name=meta["index_name"])
+            labels_df = pd.DataFrame(cache["values"], index=index, columns=columns)
+    except (OSError, KeyError, ValueError):
+        # unreadable or outdated cache format; parse the csv file again
+        return None
+    if mtime_changed:
+        # same content; record the new mtime so that later loads do not hash the file again
+        _write_label_cache(cache_file, csv_file, header_rows, labels_df, sha1=meta["sha1"])
+    return labels_df
+
+
+def _write_label_cache(
+    cache_file: str,
+    csv_file: str,
+    header_rows: List[int],
+    labels_df: pd.DataFrame,
+    sha1: Optional[str] = None,
+) -> None:
+    """Save parsed labels next to the csv file; silently skipped if they cannot be stored."""
+    values = labels_df.to_numpy()
+    if values.dtype == object or labels_df.columns.nlevels < 2 \
+            or not all(isinstance(i, str) for i in labels_df.index):
+        # only numeric labels with a multi-row header, indexed by image paths, are cached
+        return
+    stat = os.stat(csv_file)
+    meta = {
+        "header_rows": header_rows,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha1": sha1 or _file_sha1(csv_file),
+        "column_names": list(labels_df.columns.names),
+        "index_name": labels_df.index.name,
+    }
+    columns = np.array([
+        [str(v) for v in labels_df.columns.get_level_values(level)]
+        for level in range(labels_df.columns.nlevels)
+    ])
+    # write to a temporary file first so that concurrent readers never see a partial cache
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, "wb") as f:
+            np.savez(
+                f,
+                meta=np.array(json.dumps(meta)),
+                index=np.array(list(labels_df.index)),
+                columns=columns,
+                values=values,
+            )
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        # e.g. read-only data directory
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+@typechecked
+def load_label_csv(csv_file: str, header_rows: List[int] = [0, 1, 2]) -> pd.DataFrame:
+    """Load a label csv file, reusing a binary copy of previously parsed labels when possible.
+
+    Parsing the multi-row csv header with pandas is slow, so after the first parse the index,
+    header and values are stored in a hidden `.npz` file next to the csv file, one per value of
+    `header_rows`. The cached copy is used as long as the csv file has the same size and
+    modification time, or the same content.
+
+    Args:
+        csv_file: absolute path to the label csv file
+        header_rows: which rows in the csv are header rows
+
+    Returns:
+        labels with image paths as index and a multi-level column header
+
+    """
+    header_rows = list(header_rows)
+    cache_file = _label_cache_file(csv_file, header_rows)
+    labels_df = _read_label_cache(cache_file, csv_file, header_rows)
+    if labels_df is None:
+        labels_df = pd.read_csv(csv_file, header=header_rows, index_col=0)
+        _write_label_cache(cache_file, csv_file, header_rows, labels_df)
+    return labels_df
+
+
 @typechecked
 def load_label_csv_from_cfg(cfg: Union[DictConfig, dict]) -> pd.DataFrame:
     """Helper function for easy loading.
@@ -96,10 +222,242 @@ def load_label_csv_from_cfg(cfg: Union[DictConfig, dict]) -> pd.DataFrame:
     """
 
     csv_file = os.path.join(cfg["data"]["data_dir"], cfg["data"]["csv_file"])
-    labels_df = pd.read_csv(csv_file, header=[0, 1, 2], index_col=0)
+    labels_df = load_label_csv(csv_file, header_rows=[0, 1, 2])
     return labels_df
 
 
+# file extension -> (writer, reader); extensions are matched case-insensitively
+_PREDICTION_FORMATS: Dict[str, Tuple[Callable, Callable]] = {}
+
+
+def register_prediction_format(extension: str, writer: Callable, reader: Callable) -> None:
+    """Add a prediction file format, which is selected by the extension of the file name.
+
+    Args:
+        extension: file extension including the leading dot, e.g. ".parquet"
+        writer: function (predictions dataframe, file name, compression) -> None
+        reader: function (file name) -> predictions dataframe with a three-level column header
+
+    """
+    _PREDICTION_FORMATS[extension.lower()] = (writer, reader)
+
+
+def split_prediction_file(preds_file: str) -> Optional[Tuple[str, str]]:
+    """Split a prediction file name into its stem and the extension that selects its format.
+
+    Files derived from a prediction file (metrics, heatmaps, views) are named after the stem.
+
+    Args:
+        preds_file: prediction file name
+
+    Returns:
+        tuple (stem, extension), or None if no prediction format uses the extension
+
+    """
+    name = preds_file.lower()
+    # longest extension first, e.g. ".csv.gz" before ".gz"
+    for extension in sorted(_PREDICTION_FORMATS, key=len, reverse=True):
+        if name.endswith(extension):
+            return preds_file[:-len(extension)], preds_file[-len(extension):]
+    return None
+
+
+def _prediction_format(preds_file: str) -> Tuple[Callable, Callable]:
+    split = split_prediction_file(preds_file)
+    if split is None:
+        raise NotImplementedError(
+            f"{preds_file} is not a supported prediction file; supported extensions are "
+            f"{sorted(_PREDICTION_FORMATS)}"
+        )
+    return _PREDICTION_FORMATS[split[1].lower()]
+
+
+def _numeric_columns(preds_df: pd.DataFrame) -> np.ndarray:
+    return np.array(
+        [pd.api.types.is_numeric_dtype(dtype) for dtype in preds_df.dtypes], dtype=bool,
+    )
+
+
+def _header_meta(preds_df: pd.DataFrame) -> dict:
+    return {
+        "columns": [
+            [str(v) for v in preds_df.columns.get_level_values(level)]
+            for level in range(preds_df.columns.nlevels)
+        ],
+        "column_names": list(preds_df.columns.names),
+        "index_name": preds_df.index.name,
+    }
+
+
+def _predictions_to_arrays(preds_df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    # float32 values of the numeric columns, and the text of the others (e.g. the split of each
+    # labeled frame)
+    numeric = _numeric_columns(preds_df)
+    arrays = {
+        "values": preds_df.loc[:, numeric].to_numpy(dtype=np.float32),
+        "numeric": numeric,
+        "index": np.array(list(preds_df.index)),
+    }
+    if not numeric.all():
+        arrays["text"] = preds_df.loc[:, ~numeric].to_numpy().astype(str)
+    return arrays
+
+
+def _predictions_from_arrays(arrays: Dict[str, np.ndarray], meta: dict) -> pd.DataFrame:
+    numeric = arrays["numeric"].astype(bool)
+    columns = pd.MultiIndex.from_arrays(meta["columns"], names=meta["column_names"])
+    index = pd.Index(arrays["index"].tolist(), name=meta["index_name"])
+    preds_df = pd.DataFrame(arrays["values"], index=index, columns=columns[numeric])
+    if not numeric.all():
+        text_df = pd.DataFrame(arrays["text"], index=index, columns=columns[~numeric])
+        preds_df = pd.concat([preds_df, text_df], axis=1).reindex(columns=columns)
+    return preds_df
+
+
+def _write_csv(preds_df: pd.DataFrame, preds_file: str, compression: Optional[str]) -> None:
+    # compression of csv files follows their extension, e.g. ".csv.gz"
+    preds_df.to_csv(preds_file)
+
+
+def _read_csv(preds_file: str) -> pd.DataFrame:
+    return pd.read_csv(preds_file, header=[0, 1, 2], index_col=0)
+
+
+def _write_parquet(preds_df: pd.DataFrame, preds_file: str, compression: Optional[str]) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # parquet columns need flat string names; the header is restored from the file metadata
+    flat_df = preds_df.copy()
+    flat_df.columns = [str(i) for i in range(preds_df.shape[1])]
+    flat_df = flat_df.astype({
+        str(i): np.float32 for i in np.flatnonzero(_numeric_columns(preds_df))
+    })
+    table = pa.Table.from_pandas(flat_df)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        b"lightning_pose": json.dumps(_header_meta(preds_df)).encode(),
+    })
+    pq.write_table(table, preds_file, compression=compression or "none")
+
+
+def _read_parquet(preds_file: str) -> pd.DataFrame:
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(preds_file)
+    meta = json.loads(table.schema.metadata[b"lightning_pose"])
+    preds_df = table.to_pandas()
+    preds_df.columns = pd.MultiIndex.from_arrays(meta["columns"], names=meta["column_names"])
+    return preds_df
+
+
+def _write_hdf5(preds_df: pd.DataFrame, preds_file: str, compression: Optional[str]) -> None:
+    arrays = _predictions_to_arrays(preds_df)
+    values = arrays.pop("values")
+    with h5py.File(preds_file, "w") as f:
+        if values.size > 0:
+            # chunks of consecutive frames, so that a range of frames is read without loading
+            # the entire file
+            f.create_dataset(
+                "values",
+                data=values,
+                chunks=(min(values.shape[0], 4096), values.shape[1]),
+                compression=compression,
+            )
+        else:
+            f.create_dataset("values", data=values)
+        for name, array in arrays.items():
+            if array.dtype.kind == "U":
+                # hdf5 stores text as bytes
+                array = np.char.encode(array, "utf-8")
+            f.create_dataset(name, data=array)
+        f.attrs["meta"] = json.dumps(_header_meta(preds_df))
+
+
+def _read_hdf5(preds_file: str) -> pd.DataFrame:
+    with h5py.File(preds_file, "r") as f:
+        if "meta" in f.attrs:
+            meta = json.loads(f.attrs["meta"])
+            arrays = {}
+            for name, dataset in f.items():
+                array = dataset[()]
+                if array.dtype.kind == "S":
+                    array = np.char.decode(array, "utf-8")
+                arrays[name] = array
+            return _predictions_from_arrays(arrays, meta)
+    # written by pandas, e.g. DLC predictions; requires pytables
+    return pd.read_hdf(preds_file)
+
+
+def _write_npz(preds_df: pd.DataFrame, preds_file: str, compression: Optional[str]) -> None:
+    arrays = _predictions_to_arrays(preds_df)
+    meta = _header_meta(preds_df)
+    save = np.savez_compressed if compression else np.savez
+    # pass an open file; numpy would otherwise append ".npz" to names without that extension
+    with open(preds_file, "wb") as f:
+        save(f, meta=np.array(json.dumps(meta)), **arrays)
+
+
+def _read_npz(preds_file: str) -> pd.DataFrame:
+    with np.load(preds_file, allow_pickle=False) as f:
+        meta = json.loads(str(f["meta"]))
+        arrays = {name: f[name] for name in f.files if name != "meta"}
+    return _predictions_from_arrays(arrays, meta)
+
+
+for _extension in [".csv", ".csv.gz", ".csv.bz2", ".csv.zip", ".csv.xz", ".csv.zst"]:
+    register_prediction_format(_extension, _write_csv, _read_csv)
+register_prediction_format(".parquet", _write_parquet, _read_parquet)
+# ".hdf5" is left for heatmaps (see `predictions._heatmaps_file`), which are not predictions
+register_prediction_format(".h5", _write_hdf5, _read_hdf5)
+register_prediction_format(".npz", _write_npz, _read_npz)
+
+
+@typechecked
+def save_predictions(
+    preds_df: pd.DataFrame, preds_file: str, compression: Optional[str] = None,
+) -> None:
+    """Save predictions in the format selected by the extension of the file name.
+
+    Besides DLC-style csv files, predictions can be saved as parquet (requires pyarrow), hdf5 or
+    npz files. These formats store values as float32 and are much faster to write and read
+    than csv files; the column header, the index and non-numeric columns are kept.
+
+    Args:
+        preds_df: predictions with a three-level (scorer, bodyparts, coords) column header
+        preds_file: absolute path of the prediction file, e.g. "predictions.parquet"
+        compression: codec for formats that support one: parquet ("snappy", "zstd", "gzip",
+            ...), hdf5 ("gzip", "lzf"); any value compresses npz files. csv files are
+            compressed according to their extension, e.g. ".csv.gz"
+
+    """
+    writer, _ = _prediction_format(preds_file)
+    writer(preds_df, preds_file, compression)
+
+
+@typechecked
+def load_predictions(preds_file: str, header_rows: List[int] = [0, 1, 2]) -> pd.DataFrame:
+    """Load predictions saved in any format supported by `save_predictions`.
+
+    Args:
+        preds_file: absolute path of the prediction file
+        header_rows: levels of the (scorer, bodyparts, coords) column header to keep; the
+            equivalent of the header rows of a csv file
+
+    Returns:
+        predictions with frame indices or image names as index
+
+    """
+    _, reader = _prediction_format(preds_file)
+    if reader is _read_csv:
+        return pd.read_csv(preds_file, header=list(header_rows), index_col=0)
+    preds_df = reader(preds_file)
+    drop_levels = [level for level in range(preds_df.columns.nlevels) if level not in header_rows]
+    if drop_levels:
+        preds_df.columns = preds_df.columns.droplevel(drop_levels)
+    return preds_df
+
+
 @typechecked
 def get_keypoint_names(
     cfg: Optional[DictConfig] = None,
@@ -113,7 +471,7 @@ def get_keypoint_names(
             else:
                 # assume dlc format
                 header_rows = [0, 1, 2]
-        csv_data = pd.read_csv(csv_file, header=header_rows)
+        csv_data = load_label_csv(csv_file, header_rows=list(header_rows))
         # collect marker names from multiindex header
         if header_rows == [1, 2] or header_rows == [0, 1]:
             # self.keypoint_names = csv_data.columns.levels[0]
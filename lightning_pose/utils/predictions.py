@@ -4,9 +4,11 @@ import datetime
 import gc
 import os
 import time
-from typing import Dict, List, Optional, Tuple, Type, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Type, Union
 
 import cv2
+import h5py
 import lightning.pytorch as pl
 import matplotlib.pyplot as plt
 import numpy as np
@@ -18,11 +20,13 @@ from torchtyping import TensorType
 from tqdm import tqdm
 from typeguard import typechecked
 
-from lightning_pose.data.dali import LitDaliWrapper, PrepareDALI
 from lightning_pose.data.datamodules import BaseDataModule, UnlabeledDataModule
-from lightning_pose.data.utils import count_frames
+from lightning_pose.data.opencv import OpenCVVideoLoader, PackedClipLoader, get_video_preparer
+from lightning_pose.data.utils import DALIGenericIterator, count_frames
 from lightning_pose.models import ALLOWED_MODELS
 from lightning_pose.utils import pretty_print_str
+from lightning_pose.utils.inference import InferenceEngine
+from lightning_pose.utils.io import save_predictions, split_prediction_file
 
 # to ignore imports for sphix-autoapidoc
 __all__ = [
@@ -30,6 +34,11 @@ __all__ = [
     "PredictionHandler",
     "predict_dataset",
     "predict_single_video",
+    "predict_videos",
+    "predict_video_clips",
+    "StreamingPredictionWriter",
+    "HeatmapWriter",
+    "predict_single_video_streaming",
     "make_dlc_pandas_index",
     "get_model_class",
     "load_model_from_checkpoint",
@@ -313,7 +322,8 @@ def predict_dataset(
     Args:
         cfg: hydra config
         data_module: data module that contains dataloaders for train, val, test splits
-        preds_file: absolute filename for the predictions .csv file
+        preds_file: absolute filename for the predictions file; its extension selects the file
+            format, see `save_predictions`
         ckpt_file: absolute path to the checkpoint of your trained model; requires .ckpt suffix
         trainer: pl.Trainer object
         model: Lightning Module
@@ -335,19 +345,19 @@ def predict_dataset(
         trainer = pl.Trainer(devices=1, accelerator="auto")
         delete_trainer = True
 
-    labeled_preds = trainer.predict(
-        model=model,
-        dataloaders=data_module.full_labeled_dataloader(),
-        return_predictions=True,
+    labeled_preds = _predict_loader(
+        cfg=cfg, model=model, trainer=trainer, dataloader=data_module.full_labeled_dataloader(),
     )
 
     pred_handler = PredictionHandler(cfg=cfg, data_module=data_module, video_file=None)
     labeled_preds_df = pred_handler(preds=labeled_preds)
+    compression = cfg.eval.get("predictions_compression", None)
     if isinstance(labeled_preds_df, dict):
+        stem, extension = split_prediction_file(preds_file) or os.path.splitext(preds_file)
         for view_name, df in labeled_preds_df.items():
-            df.to_csv(preds_file.replace(".csv", f"_{view_name}.csv"))
+            save_predictions(df, f"{stem}_{view_name}{extension}", compression=compression)
     else:
-        labeled_preds_df.to_csv(preds_file)
+        save_predictions(labeled_preds_df, preds_file, compression=compression)
 
     # clear up memory
     if delete_model:
@@ -371,21 +381,22 @@ def predict_single_video(
     model: Optional[ALLOWED_MODELS] = None,
     save_heatmaps: Optional[bool] = False,
 ) -> pd.DataFrame:
-    """Make predictions for a single video, loading frame sequences using DALI.
+    """Make predictions for a single video, loading frame sequences using DALI or OpenCV.
 
-    This function initializes a DALI pipeline, prepares a dataloader, and passes it on
-    to _make_predictions().
+    This function initializes a DALI pipeline (or an OpenCV loader, depending on
+    `cfg.dali.general.backend`), prepares a dataloader, and passes it on to _make_predictions().
 
     Args:
         cfg_file: either a hydra config or a path pointing to one, with all the model specs.
             needed for loading the model.
         video_file: absolute path to a single video you want to get predictions for, .mp4 file.
-        preds_file: absolute filename for the predictions .csv file
+        preds_file: absolute filename for the predictions file; its extension selects the file
+            format, see `save_predictions`
         data_module: contains keypoint names for prediction file
         ckpt_file: absolute path to the checkpoint of your trained model; requires .ckpt suffix
         trainer: pl.Trainer object
         model: Lightning Module
-        save_heatmaps: export heatmaps as numpy array
+        save_heatmaps: export heatmaps to "<preds_file stem>_heatmaps.hdf5", see `HeatmapWriter`
 
     Returns:
         pandas dataframe with predictions
@@ -405,88 +416,672 @@ def predict_single_video(
 
     delete_trainer = False
     if trainer is None:
-        trainer = pl.Trainer(accelerator="gpu", devices=1)
+        trainer = pl.Trainer(accelerator="auto", devices=1)
         delete_trainer = True
 
     # ----------------------------------------------------------------------------------
     # set up
     # ----------------------------------------------------------------------------------
     # initialize
-    model_type = "context" if cfg.model.model_type == "heatmap_mhcrnn" else "base"
     cfg.training.imgaug = "default"
-    vid_pred_class = PrepareDALI(
+    predict_loader = _get_video_loader(cfg=cfg, video_file=video_file)
+
+    # ----------------------------------------------------------------------------------
+    # compute predictions
+    # ----------------------------------------------------------------------------------
+    preds_df = _predict_video(
+        cfg=cfg,
+        model=model,
+        trainer=trainer,
+        predict_loader=predict_loader,
+        video_file=video_file,
+        data_module=data_module,
+        heatmaps_file=_heatmaps_file(preds_file) if save_heatmaps else None,
+    )
+    _save_video_predictions(
+        preds_df=preds_df,
+        preds_file=preds_file,
+        compression=cfg.eval.get("predictions_compression", None),
+    )
+
+    # clear up memory
+    if delete_model:
+        del model
+    if delete_trainer:
+        del trainer
+    del predict_loader
+    gc.collect()
+    torch.cuda.empty_cache()
+
+    return preds_df
+
+
+def _predict_loader(
+    cfg: DictConfig,
+    model: ALLOWED_MODELS,
+    trainer: pl.Trainer,
+    dataloader: Union[torch.utils.data.DataLoader, DALIGenericIterator, OpenCVVideoLoader],
+) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+    """Predict keypoints and confidences with the inference engine set in `cfg.eval`."""
+    engine = cfg.eval.get("inference_engine", "lightning")
+    if engine == "lightning":
+        return trainer.predict(model=model, dataloaders=dataloader, return_predictions=True)
+    elif engine == "lean":
+        keypoints, confidences = InferenceEngine(
+            model=model,
+            batch_size=cfg.eval.get("inference_batch_size", None),
+            prefetch=cfg.eval.get("inference_prefetch", 2),
+        ).predict(dataloader)
+        return [(torch.from_numpy(keypoints), torch.from_numpy(confidences))]
+    else:
+        raise NotImplementedError(f"{engine} is not a valid inference engine")
+
+
+def _get_video_loader(
+    cfg: DictConfig, video_file: str,
+) -> Union[DALIGenericIterator, OpenCVVideoLoader]:
+    """Build the prediction loader of a single video for the configured video backend."""
+    model_type = "context" if cfg.model.model_type == "heatmap_mhcrnn" else "base"
+    vid_pred_class = get_video_preparer(cfg.dali)(
         train_stage="predict",
         model_type=model_type,
         dali_config=cfg.dali,
         filenames=[video_file],
         resize_dims=[cfg.data.image_resize_dims.height, cfg.data.image_resize_dims.width]
     )
-    # get loader
-    predict_loader = vid_pred_class()
+    return vid_pred_class()
+
+
+def _predict_video(
+    cfg: DictConfig,
+    model: ALLOWED_MODELS,
+    trainer: pl.Trainer,
+    predict_loader: Union[DALIGenericIterator, OpenCVVideoLoader],
+    video_file: str,
+    data_module: Optional[Union[BaseDataModule, UnlabeledDataModule]] = None,
+    heatmaps_file: Optional[str] = None,
+) -> pd.DataFrame:
+    """Run a model over the frames of a prediction loader.
 
+    Heatmaps of heatmap models are written to `heatmaps_file` during inference, if given.
+
+    Returns:
+        pandas dataframe with predictions
+
+    """
     # initialize prediction handler class
     pred_handler = PredictionHandler(cfg=cfg, data_module=data_module, video_file=video_file)
 
-    # ----------------------------------------------------------------------------------
-    # compute predictions
-    # ----------------------------------------------------------------------------------
-
     # use a different function for now to return heatmaps
-    if save_heatmaps:
-        model.to("cuda")
+    if heatmaps_file is not None:
+        model.to(_TORCH_DEVICE)
         if predict_loader.do_context:
             batch_size = cfg.dali.context.predict.sequence_length
         else:
             batch_size = cfg.dali.base.predict.sequence_length
-        keypoints, confidences, heatmaps = _predict_frames(
-            cfg=cfg,
-            model=model,
-            dataloader=predict_loader,
-            n_frames=pred_handler.frame_count,
-            batch_size=batch_size,
-            return_heatmaps=True,
-        )
+        heatmap_writer = None
+        if "heatmap" in cfg.model.model_type:
+            heatmap_writer = HeatmapWriter(
+                heatmaps_file=heatmaps_file,
+                n_frames=pred_handler.frame_count,
+                num_keypoints=model.num_keypoints,
+                heatmap_shape=tuple(model.output_shape),
+                crop_size=cfg.eval.get("heatmaps_crop_size", None),
+                compression=cfg.eval.get("heatmaps_compression", "gzip"),
+            )
+        try:
+            keypoints, confidences = _predict_frames(
+                cfg=cfg,
+                model=model,
+                dataloader=predict_loader,
+                n_frames=pred_handler.frame_count,
+                batch_size=batch_size,
+                heatmap_writer=heatmap_writer,
+            )
+            if heatmap_writer is not None:
+                heatmap_writer.close()
+        finally:
+            # leaves no temporary file behind if predicting fails
+            if heatmap_writer is not None:
+                heatmap_writer.abort()
         preds = [(torch.tensor(keypoints), torch.tensor(confidences))]
-        if heatmaps is not None:
-            heatmaps_file = preds_file.replace(".csv", "_heatmaps.npy")
-            os.makedirs(os.path.dirname(heatmaps_file), exist_ok=True)
-            np.save(heatmaps_file, heatmaps)
 
     else:
-        preds = trainer.predict(
-            model=model,
-            dataloaders=predict_loader,
-            return_predictions=True,
+        preds = _predict_loader(
+            cfg=cfg, model=model, trainer=trainer, dataloader=predict_loader,
         )
 
     # call this instance on a single vid's preds
     preds_df = pred_handler(preds=preds)
-    # save the predictions to a csv; create directory if it doesn't exist
+    return preds_df
+
+
+def _heatmaps_file(preds_file: str) -> str:
+    stem, _ = split_prediction_file(preds_file) or os.path.splitext(preds_file)
+    # not a prediction file extension, so that heatmaps are never listed among predictions
+    return f"{stem}_heatmaps.hdf5"
+
+
+def _save_video_predictions(
+    preds_df: pd.DataFrame, preds_file: str, compression: Optional[str] = None,
+) -> None:
+    # save the predictions; create directory if it doesn't exist
     os.makedirs(os.path.dirname(preds_file), exist_ok=True)
-    preds_df.to_csv(preds_file)
+    save_predictions(preds_df, preds_file, compression=compression)
+
+
+@typechecked
+def predict_videos(
+    cfg_file: Union[str, DictConfig],
+    video_files: List[str],
+    preds_files: List[str],
+    data_module: Optional[Union[BaseDataModule, UnlabeledDataModule]] = None,
+    ckpt_file: Optional[str] = None,
+    trainer: Optional[pl.Trainer] = None,
+    model: Optional[ALLOWED_MODELS] = None,
+    save_heatmaps: Optional[bool] = False,
+    postprocess: Optional[Callable[[int, pd.DataFrame], None]] = None,
+) -> None:
+    """Make predictions for several videos, overlapping inference with setup and output.
+
+    Videos are inferred one after another, as with `predict_single_video`, but while one video
+    is inferred, the loader of the next video is prepared and the outputs of the previous video
+    are saved in background threads, so that the model does not wait for either.
+
+    Args:
+        cfg_file: either a hydra config or a path pointing to one, with all the model specs.
+            needed for loading the model.
+        video_files: absolute paths to the videos you want to get predictions for
+        preds_files: absolute filenames for the predictions files, one per video; their
+            extensions select the file format, see `save_predictions`
+        data_module: contains keypoint names for prediction file
+        ckpt_file: absolute path to the checkpoint of your trained model; requires .ckpt suffix
+        trainer: pl.Trainer object
+        model: Lightning Module
+        save_heatmaps: export heatmaps to "<preds_file stem>_heatmaps.hdf5", see `HeatmapWriter`
+        postprocess: called in the background with the index of each video and its predictions
+            after they are saved, e.g. to create labeled videos or compute metrics
+
+    """
+
+    if len(video_files) != len(preds_files):
+        raise ValueError("must pass one predictions file per video")
+    if len(video_files) == 0:
+        return
+
+    cfg = get_cfg_file(cfg_file=cfg_file).copy()  # copy because we update imgaug field below
+    cfg.training.imgaug = "default"
+
+    delete_model = False
+    if model is None:
+        skip_data_module = True if data_module is None else False
+        model = load_model_from_checkpoint(
+            cfg=cfg, ckpt_file=ckpt_file, eval=True, data_module=data_module,
+            skip_data_module=skip_data_module,
+        )
+        delete_model = True
+
+    delete_trainer = False
+    if trainer is None:
+        trainer = pl.Trainer(accelerator="auto", devices=1)
+        delete_trainer = True
+
+    compression = cfg.eval.get("predictions_compression", None)
+
+    def _save_outputs(idx: int, preds_df: pd.DataFrame) -> None:
+        _save_video_predictions(
+            preds_df=preds_df, preds_file=preds_files[idx], compression=compression,
+        )
+        if postprocess is not None:
+            postprocess(idx, preds_df)
+
+    # one thread prepares loaders, the other saves outputs; each keeps the order of the videos
+    prepare_pool = ThreadPoolExecutor(max_workers=1)
+    output_pool = ThreadPoolExecutor(max_workers=1)
+    outputs = []
+    try:
+        next_loader = prepare_pool.submit(_get_video_loader, cfg, video_files[0])
+        for idx, video_file in enumerate(video_files):
+            predict_loader = next_loader.result()
+            if idx + 1 < len(video_files):
+                next_loader = prepare_pool.submit(_get_video_loader, cfg, video_files[idx + 1])
+            pretty_print_str(f"Predicting video: {video_file}...")
+            # heatmaps are written during inference; they are too large to be held in memory
+            preds_df = _predict_video(
+                cfg=cfg,
+                model=model,
+                trainer=trainer,
+                predict_loader=predict_loader,
+                video_file=video_file,
+                data_module=data_module,
+                heatmaps_file=_heatmaps_file(preds_files[idx]) if save_heatmaps else None,
+            )
+            del predict_loader
+            outputs.append(output_pool.submit(_save_outputs, idx, preds_df))
+    finally:
+        prepare_pool.shutdown(wait=True)
+        output_pool.shutdown(wait=True)
+    # raise errors from the background threads
+    for output in outputs:
+        output.result()
 
     # clear up memory
     if delete_model:
         del model
     if delete_trainer:
         del trainer
-    del predict_loader
     gc.collect()
     torch.cuda.empty_cache()
 
-    return preds_df
+
+@typechecked
+def predict_video_clips(
+    cfg_file: Union[str, DictConfig],
+    video_files: List[str],
+    preds_files: List[str],
+    data_module: Optional[Union[BaseDataModule, UnlabeledDataModule]] = None,
+    ckpt_file: Optional[str] = None,
+    model: Optional[ALLOWED_MODELS] = None,
+) -> None:
+    """Make predictions for many short videos, packing their frames into full batches.
+
+    Frames of consecutive clips share batches (see `PackedClipLoader`), so that clips cost no
+    pipeline setup and no partially empty final batch each. Predictions are scattered back into
+    one file per clip, written as soon as the clip is complete; clips without frames, or that
+    cannot be opened, get a file without rows. Unlike the DALI pipelines, context models predict
+    the first and last two frames of each clip from padded context.
+
+    Args:
+        cfg_file: either a hydra config or a path pointing to one, with all the model specs.
+            needed for loading the model.
+        video_files: absolute paths to the videos you want to get predictions for
+        preds_files: absolute filenames for the predictions files, one per video; their
+            extensions select the file format, see `save_predictions`
+        data_module: contains keypoint names for prediction file
+        ckpt_file: absolute path to the checkpoint of your trained model; requires .ckpt suffix
+        model: Lightning Module
+
+    """
+
+    if len(video_files) != len(preds_files):
+        raise ValueError("must pass one predictions file per video")
+    if len(video_files) == 0:
+        return
+
+    cfg = get_cfg_file(cfg_file=cfg_file)
+
+    delete_model = False
+    if model is None:
+        skip_data_module = True if data_module is None else False
+        model = load_model_from_checkpoint(
+            cfg=cfg, ckpt_file=ckpt_file, eval=True, data_module=data_module,
+            skip_data_module=skip_data_module,
+        )
+        delete_model = True
+    model.to(_TORCH_DEVICE)
+
+    do_context = cfg.model.model_type == "heatmap_mhcrnn"
+    if do_context:
+        sequence_length = cfg.dali.context.predict.sequence_length
+    else:
+        sequence_length = cfg.dali.base.predict.sequence_length
+    loader = PackedClipLoader(
+        filenames=video_files,
+        resize_dims=[cfg.data.image_resize_dims.height, cfg.data.image_resize_dims.width],
+        sequence_length=sequence_length,
+        do_context=do_context,
+    )
+    columns = PredictionHandler(
+        cfg=cfg, data_module=data_module, video_file=video_files[0],
+    ).make_dlc_pandas_index()
+    compression = cfg.eval.get("predictions_compression", None)
+
+    def _save_clip(
+        clip_idx: int, keypoints: List[np.ndarray], confidences: List[np.ndarray],
+    ) -> None:
+        if keypoints:
+            pred_arr = PredictionHandler.make_pred_arr_undo_resize(
+                np.concatenate(keypoints), np.concatenate(confidences),
+            )
+        else:
+            pred_arr = np.empty((0, len(columns)))
+        os.makedirs(os.path.dirname(preds_files[clip_idx]), exist_ok=True)
+        preds_df = pd.DataFrame(pred_arr, columns=columns)
+        save_predictions(preds_df, preds_files[clip_idx], compression=compression)
+
+    def _save_clips(
+        clip_idx: int, clip_next: int, keypoints: List[np.ndarray], confidences: List[np.ndarray],
+    ) -> None:
+        if clip_idx >= 0:
+            _save_clip(clip_idx, keypoints, confidences)
+        # clips without frames never appear in a batch; they get files without rows
+        for clip_empty in range(clip_idx + 1, clip_next):
+            _save_clip(clip_empty, [], [])
+
+    # predictions of the clip currently being assembled; clips are completed in order
+    clip_curr, keypoints_curr, confidences_curr = -1, [], []
+    with torch.inference_mode():
+        for n, (batch, clip_idxs, _) in enumerate(tqdm(loader)):
+            batch = model.transfer_batch_to_device(batch, model.device, 0)
+            pred_keypoints, confidence = model.predict_step(batch_dict=batch, batch_idx=n)[:2]
+            pred_keypoints = pred_keypoints.cpu().numpy()
+            confidence = confidence.cpu().numpy()
+            for clip_idx in np.unique(clip_idxs[clip_idxs >= 0]):
+                if clip_idx != clip_curr:
+                    _save_clips(clip_curr, clip_idx, keypoints_curr, confidences_curr)
+                    clip_curr, keypoints_curr, confidences_curr = clip_idx, [], []
+                rows = clip_idxs == clip_idx
+                keypoints_curr.append(pred_keypoints[rows])
+                confidences_curr.append(confidence[rows])
+    _save_clips(clip_curr, len(video_files), keypoints_curr, confidences_curr)
+
+    # clear up memory
+    if delete_model:
+        del model
+    gc.collect()
+    torch.cuda.empty_cache()
+
+
+class StreamingPredictionWriter:
+    """Write video predictions to a csv file batch by batch, holding no more than one batch.
+
+    Rows are assigned to video frames in the same way as `PredictionHandler`: rows beyond the
+    end of the video are discarded and, for context models, whose first prediction belongs to the
+    third frame of the video, predictions are shifted by two frames and the first and last two
+    frames are padded. If a context model returns fewer rows than the video has frames, the
+    remaining frames are padded with its first prediction, as in
+    `PredictionHandler.fix_context_preds_confs`; the last three frames are therefore only written
+    once the writer is closed. The csv file is identical to the one written from the dataframe
+    returned by `PredictionHandler`.
+
+    """
+
+    def __init__(
+        self,
+        preds_file: str,
+        columns: pd.MultiIndex,
+        frame_count: int,
+        do_context: bool = False,
+        zero_pad_confidence: bool = False,
+    ) -> None:
+        """
+
+        Args:
+            preds_file: absolute filename for the predictions .csv file; other formats cannot be
+                appended to
+            columns: dlc-style column index, see `make_dlc_pandas_index`
+            frame_count: number of frames in the video
+            do_context: predictions come from a context model
+            zero_pad_confidence: set confidences of the padded edge frames of a context model to 0
+
+        """
+        if not preds_file.lower().endswith(".csv"):
+            raise NotImplementedError("streaming predictions can only be written to .csv files")
+        self.preds_file = preds_file
+        self.columns = columns
+        self.frame_count = frame_count
+        self.do_context = do_context
+        self.zero_pad_confidence = zero_pad_confidence
+        self.num_frames_written = 0
+        self._num_rows_received = 0
+        self._first_row = None
+        self._pending = np.empty((0, len(columns)))
+        os.makedirs(os.path.dirname(preds_file), exist_ok=True)
+        # write to a temporary file so that an interrupted run never leaves a partial csv file
+        self._tmp_file = f"{preds_file}.{os.getpid()}.tmp"
+        self._f = open(self._tmp_file, "w")
+        pd.DataFrame(columns=columns).to_csv(self._f)
+
+    def _write_rows(self, rows: np.ndarray) -> None:
+        if rows.shape[0] == 0:
+            return
+        frames = np.arange(self.num_frames_written, self.num_frames_written + rows.shape[0])
+        pd.DataFrame(rows, index=frames, columns=self.columns).to_csv(self._f, header=False)
+        self.num_frames_written += rows.shape[0]
+
+    def _pad_rows(self, row: np.ndarray, num_rows: int) -> np.ndarray:
+        rows = np.tile(row, (num_rows, 1))
+        if self.zero_pad_confidence:
+            rows[:, 2::3] = 0.0
+        return rows
+
+    def write(self, keypoints: np.ndarray, confidences: np.ndarray) -> None:
+        """Write the predictions of one batch.
+
+        Args:
+            keypoints: shape (batch, n_keypoints * 2)
+            confidences: shape (batch, n_keypoints)
+
+        """
+        rows = PredictionHandler.make_pred_arr_undo_resize(keypoints, confidences)
+        first_frame = self._num_rows_received + (2 if self.do_context else 0)
+        self._num_rows_received += rows.shape[0]
+        # discard rows beyond the end of the video
+        rows = rows[:max(self.frame_count - first_frame, 0)]
+        if rows.shape[0] == 0:
+            return
+        if not self.do_context:
+            self._write_rows(rows)
+            return
+        if self._first_row is None:
+            # no valid predictions for the first two frames; copy the prediction of frame 2
+            self._first_row = rows[0].copy()
+            self._write_rows(self._pad_rows(rows[0], 2))
+        # hold back the last three frames, whose rows depend on the number of predictions
+        rows = np.concatenate([self._pending, rows])
+        self._write_rows(rows[:-3])
+        self._pending = rows[-3:]
+
+    def close(self) -> None:
+        """Write the held back final frames of context models and move the csv file into place."""
+        if self._first_row is not None:
+            if self._num_rows_received >= self.frame_count:
+                # no valid predictions for the last two frames; copy frame -3
+                rows = np.concatenate([self._pending[:1], self._pad_rows(self._pending[0], 2)])
+            else:
+                # fewer predictions than frames: the last two predictions are dropped and the
+                # missing frames are padded with the first prediction
+                num_kept = min(
+                    max(self._num_rows_received - self.num_frames_written, 0),
+                    self._pending.shape[0],
+                )
+                num_pad = self.frame_count - self.num_frames_written - num_kept
+                rows = np.concatenate([
+                    self._pending[:num_kept], np.tile(self._first_row, (num_pad, 1)),
+                ])
+                if self.zero_pad_confidence:
+                    rows[-2:, 2::3] = 0.0
+            self._write_rows(rows)
+        self._f.close()
+        os.replace(self._tmp_file, self.preds_file)
+
+    def abort(self) -> None:
+        """Close and remove the temporary csv file; does nothing after `close`."""
+        self._f.close()
+        if os.path.exists(self._tmp_file):
+            os.remove(self._tmp_file)
+
+
+class HeatmapWriter:
+    """Write heatmaps to a chunked, compressed hdf5 file batch by batch, in float16.
+
+    The file holds a "heatmaps" dataset of shape (n_frames, num_keypoints, height, width) with
+    one chunk per frame, so that any range of frames or keypoints is read without loading the
+    rest of the file, e.g. `h5py.File(heatmaps_file)["heatmaps"][100:200, 3]`. If `crop_size`
+    is given, only a window of that size around the peak of each heatmap is kept, and an
+    "offsets" dataset of shape (n_frames, num_keypoints, 2) stores the (row, column) of the
+    top-left corner of each window in the full heatmap.
+
+    """
+
+    def __init__(
+        self,
+        heatmaps_file: str,
+        n_frames: int,
+        num_keypoints: int,
+        heatmap_shape: Tuple[int, int],
+        crop_size: Optional[int] = None,
+        compression: Optional[str] = "gzip",
+    ) -> None:
+        """
+
+        Args:
+            heatmaps_file: absolute filename for the heatmaps .hdf5 file
+            n_frames: number of frames in the video; heatmaps of later frames are discarded
+            num_keypoints: number of keypoints
+            heatmap_shape: (height, width) of the heatmaps
+            crop_size: side length of the window kept around the peak of each heatmap; None
+                keeps the full heatmaps
+            compression: hdf5 compression filter, e.g. "gzip" or "lzf"; None to disable
+
+        """
+        height, width = heatmap_shape
+        if crop_size is not None and not 0 < crop_size <= min(height, width):
+            raise ValueError(
+                f"heatmap crop size must be between 1 and {min(height, width)}, not {crop_size}"
+            )
+        self.heatmaps_file = heatmaps_file
+        self.n_frames = n_frames
+        self.crop_size = crop_size
+        self.num_frames_written = 0
+        os.makedirs(os.path.dirname(heatmaps_file), exist_ok=True)
+        # write to a temporary file so that an interrupted run never leaves a partial file
+        self._tmp_file = f"{heatmaps_file}.{os.getpid()}.tmp"
+        self._f = h5py.File(self._tmp_file, "w")
+        out_height, out_width = (crop_size, crop_size) if crop_size else (height, width)
+        self._heatmaps = self._f.create_dataset(
+            "heatmaps",
+            shape=(n_frames, num_keypoints, out_height, out_width),
+            dtype=np.float16,
+            chunks=(1, num_keypoints, out_height, out_width) if n_frames > 0 else None,
+            compression=compression if n_frames > 0 else None,
+        )
+        self._heatmaps.attrs["heatmap_shape"] = [height, width]
+        self._offsets = None
+        if crop_size:
+            self._offsets = self._f.create_dataset(
+                "offsets", shape=(n_frames, num_keypoints, 2), dtype=np.int32,
+            )
+
+    def write(self, heatmaps: torch.Tensor) -> None:
+        """Write the heatmaps of one batch.
+
+        Args:
+            heatmaps: shape (batch, num_keypoints, height, width), on any device
+
+        """
+        # discard frames beyond the end of the video
+        heatmaps = heatmaps[:max(self.n_frames - self.num_frames_written, 0)].detach()
+        batch, num_keypoints, height, width = heatmaps.shape
+        if batch == 0:
+            return
+        start, end = self.num_frames_written, self.num_frames_written + batch
+        if self.crop_size:
+            # crop on the device so that only the windows are transferred
+            size, device = self.crop_size, heatmaps.device
+            peaks = heatmaps.flatten(2).argmax(dim=-1)
+            peak_rows = torch.div(peaks, width, rounding_mode="floor")
+            top = (peak_rows - size // 2).clamp(0, height - size)
+            left = (peaks % width - size // 2).clamp(0, width - size)
+            window = torch.arange(size, device=device)
+            rows = (top[..., None] + window)[..., :, None]
+            cols = (left[..., None] + window)[..., None, :]
+            frame_idxs = torch.arange(batch, device=device)[:, None, None, None]
+            keypoint_idxs = torch.arange(num_keypoints, device=device)[None, :, None, None]
+            heatmaps = heatmaps[frame_idxs, keypoint_idxs, rows, cols]
+            self._offsets[start:end] = torch.stack([top, left], dim=-1).cpu().numpy()
+        self._heatmaps[start:end] = heatmaps.to(torch.float16).cpu().numpy()
+        self.num_frames_written = end
+
+    def close(self) -> None:
+        """Close the file and move it into place."""
+        self._f.close()
+        os.replace(self._tmp_file, self.heatmaps_file)
+
+    def abort(self) -> None:
+        """Close and remove the temporary file; does nothing after `close`."""
+        self._f.close()
+        if os.path.exists(self._tmp_file):
+            os.remove(self._tmp_file)
+
+
+@typechecked
+def predict_single_video_streaming(
+    cfg_file: Union[str, DictConfig],
+    video_file: str,
+    preds_file: str,
+    data_module: Optional[Union[BaseDataModule, UnlabeledDataModule]] = None,
+    ckpt_file: Optional[str] = None,
+    model: Optional[ALLOWED_MODELS] = None,
+) -> None:
+    """Make predictions for a single video with memory use independent of the video length.
+
+    Unlike `predict_single_video`, predictions are not collected: each batch of frames is pushed
+    through the model and its predictions are appended to the csv file right away.
+
+    Args:
+        cfg_file: either a hydra config or a path pointing to one, with all the model specs.
+            needed for loading the model.
+        video_file: absolute path to a single video you want to get predictions for, .mp4 file.
+        preds_file: absolute filename for the predictions .csv file
+        data_module: contains keypoint names for prediction file
+        ckpt_file: absolute path to the checkpoint of your trained model; requires .ckpt suffix
+        model: Lightning Module
+
+    """
+
+    cfg = get_cfg_file(cfg_file=cfg_file).copy()  # copy because we update imgaug field below
+
+    delete_model = False
+    if model is None:
+        skip_data_module = True if data_module is None else False
+        model = load_model_from_checkpoint(
+            cfg=cfg, ckpt_file=ckpt_file, eval=True, data_module=data_module,
+            skip_data_module=skip_data_module,
+        )
+        delete_model = True
+    model.to(_TORCH_DEVICE)
+
+    cfg.training.imgaug = "default"
+    predict_loader = _get_video_loader(cfg=cfg, video_file=video_file)
+
+    pred_handler = PredictionHandler(cfg=cfg, data_module=data_module, video_file=video_file)
+    writer = StreamingPredictionWriter(
+        preds_file=preds_file,
+        columns=pred_handler.make_dlc_pandas_index(),
+        frame_count=pred_handler.frame_count,
+        do_context=pred_handler.do_context,
+        zero_pad_confidence=cfg.model.model_type != "heatmap_mhcrnn",
+    )
+    try:
+        with torch.inference_mode():
+            for n, batch in enumerate(tqdm(predict_loader, total=len(predict_loader))):
+                batch = model.transfer_batch_to_device(batch, model.device, 0)
+                pred_keypoints, confidence = model.predict_step(batch_dict=batch, batch_idx=n)[:2]
+                writer.write(pred_keypoints.cpu().numpy(), confidence.cpu().numpy())
+        writer.close()
+    finally:
+        # leaves no temporary file behind if predicting fails
+        writer.abort()
+
+    # clear up memory
+    if delete_model:
+        del model
+    del predict_loader
+    gc.collect()
+    torch.cuda.empty_cache()
 
 
 @typechecked
 def _predict_frames(
     cfg: DictConfig,
     model: ALLOWED_MODELS,
-    dataloader: Union[torch.utils.data.DataLoader, LitDaliWrapper],
+    dataloader: Union[torch.utils.data.DataLoader, DALIGenericIterator, OpenCVVideoLoader],
     n_frames: int,
     batch_size: int,
-    return_heatmaps: bool = False,
-) -> Tuple[np.ndarray, np.ndarray, Union[np.ndarray, None]]:
-    """Predict all frames in a data loader without undoing the resize/reshape; can return heatmaps.
+    heatmap_writer: Optional[HeatmapWriter] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Predict all frames in a data loader without undoing the resize/reshape; can save heatmaps.
 
     Args:
         cfg: hydra config.
@@ -494,35 +1089,26 @@ def _predict_frames(
         dataloader: dataloader ready to be iterated
         n_frames: total number of frames in the dataset or video
         batch_size: regular batch_size for images or sequence_length for videos
-        return_heatmaps: return heatmaps as a numpy array
+        heatmap_writer: receives the heatmaps of each batch; ignored for regression models
 
     Returns:
-        keypoints, confidences, and potentially heatmaps.
+        keypoints and confidences.
 
     """
 
-    if "heatmap" not in cfg.model.model_type:
-        return_heatmaps = False
+    return_heatmaps = heatmap_writer is not None and "heatmap" in cfg.model.model_type
 
     keypoints_np = np.zeros((n_frames, model.num_keypoints * 2))
     confidence_np = np.zeros((n_frames, model.num_keypoints))
 
-    if return_heatmaps:
-        heatmaps_np = np.zeros((
-            n_frames,
-            model.num_keypoints,
-            model.output_shape[0],  # // (2 ** model.downsample_factor),
-            model.output_shape[1],  # // (2 ** model.downsample_factor)
-        ))
-    else:
-        heatmaps_np = None
-
     t_beg = time.time()
     n_frames_counter = 0  # total frames processed
     n_batches = int(np.ceil(n_frames / batch_size))
     n = -1
     with torch.inference_mode():
         for n, batch in enumerate(tqdm(dataloader, total=n_batches)):
+            # batches from cpu video loaders are not on the model device yet
+            batch = model.transfer_batch_to_device(batch, model.device, 0)
 
             if cfg.model.model_type == "heatmap":
                 # push batch through model
@@ -532,7 +1118,6 @@ def _predict_frames(
                 # send to numpy
                 pred_keypoints = pred_keypoints.detach().cpu().numpy()
                 confidence = confidence.detach().cpu().numpy()
-                pred_heatmaps = pred_heatmaps.detach().cpu().numpy()
 
             elif cfg.model.model_type == "heatmap_mhcrnn":
                 # push batch through model
@@ -542,7 +1127,6 @@ def _predict_frames(
                 # send to numpy
                 pred_keypoints = pred_keypoints.detach().cpu().numpy()
                 confidence = confidence.detach().cpu().numpy()
-                pred_heatmaps = pred_heatmaps.detach().cpu().numpy()
 
             else:
                 # push batch through model
@@ -554,28 +1138,29 @@ def _predict_frames(
                 confidence = confidence.detach().cpu().numpy()
                 pred_heatmaps = None
 
+            if return_heatmaps:
+                # cropped and converted to float16 on the device; frames beyond the end of the
+                # video are discarded by the writer
+                heatmap_writer.write(pred_heatmaps)
+
             n_frames_curr = pred_keypoints.shape[0]
             if n_frames_counter + n_frames_curr > n_frames:
                 # final sequence
                 final_batch_size = n_frames - n_frames_counter
                 keypoints_np[n_frames_counter:] = pred_keypoints[:final_batch_size]
                 confidence_np[n_frames_counter:] = confidence[:final_batch_size]
-                if return_heatmaps:
-                    heatmaps_np[n_frames_counter:] = pred_heatmaps[:final_batch_size]
                 n_frames_curr = final_batch_size
             else:  # at every sequence except the final
                 keypoints_np[n_frames_counter:n_frames_counter + n_frames_curr] = pred_keypoints
                 confidence_np[n_frames_counter:n_frames_counter + n_frames_curr] = confidence
-                if return_heatmaps:
-                    heatmaps_np[n_frames_counter:n_frames_counter + n_frames_curr] = pred_heatmaps
 
             n_frames_counter += n_frames_curr
 
     t_end = time.time()
     pretty_print_str("inference speed: %1.2f fr/sec" % ((n * batch_size) / (t_end - t_beg)))
 
-    # for regression networks, confidence_np will be all zeros, heatmaps_np will be None
-    return keypoints_np, confidence_np, heatmaps_np
+    # for regression networks, confidence_np will be all zeros
+    return keypoints_np, confidence_np
 
 
 @typechecked
@@ -15,8 +15,8 @@ from omegaconf.errors import ValidationError
 from typeguard import typechecked
 import warnings
 
-from lightning_pose.callbacks import AnnealWeight, UnfreezeBackbone
-from lightning_pose.data.augmentations import imgaug_transform
+from lightning_pose.callbacks import AnnealWeight, FrameCacheMonitor, UnfreezeBackbone
+from lightning_pose.data.augmentations import imgaug_transform, torch_transform
 from lightning_pose.data.datamodules import BaseDataModule, UnlabeledDataModule
 from lightning_pose.data.datasets import (
     BaseTrackingDataset,
@@ -43,10 +43,19 @@ from lightning_pose.models import (
 from lightning_pose.utils.io import (
     check_if_semi_supervised,
     get_keypoint_names,
+    load_label_csv,
+    load_predictions,
     return_absolute_path,
+    split_prediction_file,
 )
 from lightning_pose.utils.pca import KeypointPCA
-from lightning_pose.utils.predictions import create_labeled_video, predict_single_video
+from lightning_pose.utils.predictions import (
+    create_labeled_video,
+    predict_single_video,
+    predict_single_video_streaming,
+    predict_video_clips,
+    predict_videos,
+)
 
 # to ignore imports for sphix-autoapidoc
 __all__ = [
@@ -59,6 +68,7 @@ __all__ = [
     "calculate_train_batches",
     "compute_metrics",
     "export_predictions_and_labeled_video",
+    "export_predictions_and_labeled_videos",
 ]
 
 
@@ -86,6 +96,18 @@ def get_dataset(
 ) -> Union[BaseTrackingDataset, HeatmapDataset, MultiviewHeatmapDataset]:
     """Create a dataset that contains labeled data."""
 
+    # optional store of pre-decoded frames; relative paths are relative to the data directory
+    if cfg.data.get("frame_store_dir", None) is not None:
+        frame_store_dir = os.path.join(data_dir, cfg.data.frame_store_dir)
+    else:
+        frame_store_dir = None
+
+    # optional in-memory cache of decoded frames shared by all data loader workers
+    if cfg.data.get("frame_cache_gb", None):
+        frame_cache_bytes = int(cfg.data.frame_cache_gb * 1e9)
+    else:
+        frame_cache_bytes = None
+
     if cfg.model.model_type == "regression":
         if cfg.data.get("view_names", None) and len(cfg.data.view_names) > 1:
             raise NotImplementedError("Multi-view support only available for heatmap-based models")
@@ -95,6 +117,9 @@ def get_dataset(
                 csv_path=cfg.data.csv_file,
                 imgaug_transform=imgaug_transform,
                 do_context=False,  # no context for regression models
+                frame_store_dir=frame_store_dir,
+                reduced_resolution_decode=cfg.data.get("reduced_resolution_decode", False),
+                frame_cache_bytes=frame_cache_bytes,
             )
     elif cfg.model.model_type == "heatmap" or cfg.model.model_type == "heatmap_mhcrnn":
         if cfg.data.get("view_names", None) and len(cfg.data.view_names) > 1:
@@ -110,7 +135,10 @@ def get_dataset(
                 imgaug_transform=imgaug_transform,
                 uniform_heatmaps=cfg.training.get("uniform_heatmaps_for_nan_keypoints", False),
                 do_context=cfg.model.model_type == "heatmap_mhcrnn",  # context only for mhcrnn
-                delimiter=cfg.data.get("image_delimiter", 'img')
+                delimiter=cfg.data.get("image_delimiter", 'img'),
+                frame_store_dir=frame_store_dir,
+                reduced_resolution_decode=cfg.data.get("reduced_resolution_decode", False),
+                frame_cache_bytes=frame_cache_bytes,
             )
         else:
             dataset = HeatmapDataset(
@@ -120,7 +148,10 @@ def get_dataset(
                 downsample_factor=cfg.data.downsample_factor,
                 do_context=cfg.model.model_type == "heatmap_mhcrnn",  # context only for mhcrnn
                 uniform_heatmaps=cfg.training.get("uniform_heatmaps_for_nan_keypoints", False),
-                delimiter=cfg.data.get("image_delimiter", 'img')
+                delimiter=cfg.data.get("image_delimiter", 'img'),
+                frame_store_dir=frame_store_dir,
+                reduced_resolution_decode=cfg.data.get("reduced_resolution_decode", False),
+                frame_cache_bytes=frame_cache_bytes,
             )
 
     else:
@@ -145,6 +176,18 @@ def get_data_module(
         )
     cfg.training.num_gpus = max(cfg.training.num_gpus, 1)
 
+    # optionally augment labeled training batches on the device rather than in the dataset
+    if cfg.training.get("imgaug_backend", "imgaug") == "torch":
+        torch_augmentation = torch_transform(cfg)
+    else:
+        torch_augmentation = None
+
+    # optional tar shards of labeled frames; relative paths are relative to the data directory
+    if cfg.data.get("label_shard_dir", None) is not None:
+        label_shard_dir = os.path.join(dataset.root_directory, cfg.data.label_shard_dir)
+    else:
+        label_shard_dir = None
+
     semi_supervised = check_if_semi_supervised(cfg.model.losses_to_use)
     if not semi_supervised:
         # Divide config batch_size by num_gpus to maintain the same effective batch
@@ -174,6 +217,10 @@ def get_data_module(
             val_probability=cfg.training.val_prob,
             train_frames=cfg.training.train_frames,
             torch_seed=cfg.training.rng_seed_data_pt,
+            batch_augmentation=cfg.training.get("batch_augmentation", False),
+            torch_augmentation=torch_augmentation,
+            heatmaps_on_device=cfg.training.get("heatmaps_on_device", False),
+            label_shard_dir=label_shard_dir,
         )
     else:
         if cfg.model.model_type == "heatmap_mhcrnn" and cfg.dali.context.train.batch_size < 5:
@@ -201,6 +248,10 @@ def get_data_module(
             dali_config=cfg.dali,
             torch_seed=cfg.training.rng_seed_data_pt,
             imgaug=cfg.training.get("imgaug", "default"),
+            batch_augmentation=cfg.training.get("batch_augmentation", False),
+            torch_augmentation=torch_augmentation,
+            heatmaps_on_device=cfg.training.get("heatmaps_on_device", False),
+            label_shard_dir=label_shard_dir,
         )
     return data_module
 
@@ -498,6 +549,10 @@ def get_callbacks(
         anneal_weight_callback = AnnealWeight(**cfg.callbacks.anneal_weight)
         callbacks.append(anneal_weight_callback)
 
+    if cfg.data.get("frame_cache_gb", None):
+        # report hits and misses of the shared frame cache after every epoch
+        callbacks.append(FrameCacheMonitor())
+
     return callbacks
 
 
@@ -546,7 +601,7 @@ def compute_metrics(
     preds_file: Union[str, List[str]],
     data_module: Optional[Union[BaseDataModule, UnlabeledDataModule]] = None,
 ) -> None:
-    """Compute various metrics on predictions csv file, potentially for multiple views."""
+    """Compute various metrics on predictions file, potentially for multiple views."""
     if (
         cfg.data.get("view_names", None)
         and len(cfg.data.view_names) > 1
@@ -588,14 +643,19 @@ def compute_metrics_single(
     preds_file: str,
     data_module: Optional[Union[BaseDataModule, UnlabeledDataModule]] = None,
 ) -> None:
-    """Compute various metrics on a predictions csv file from a single view."""
+    """Compute various metrics on a predictions file from a single view.
+
+    Metrics are saved as csv files next to the predictions file, named after its stem.
+
+    """
 
     # get keypoint names
-    labels_df = pd.read_csv(labels_file, header=[0, 1, 2], index_col=0)
+    labels_df = load_label_csv(labels_file, header_rows=[0, 1, 2])
     keypoint_names = get_keypoint_names(
         cfg, csv_file=labels_file, header_rows=[0, 1, 2])
     # load predictions
-    pred_df = pd.read_csv(preds_file, header=[0, 1, 2], index_col=0)
+    pred_df = load_predictions(preds_file)
+    stem, _ = split_prediction_file(preds_file) or os.path.splitext(preds_file)
     xyl_mask = pred_df.columns.get_level_values("coords").isin(["x", "y", "likelihood"])
     tmp = pred_df.loc[:, xyl_mask].to_numpy().reshape(pred_df.shape[0], -1, 3)
 
@@ -644,7 +704,7 @@ def compute_metrics_single(
         # add train/val/test split
         if set is not None:
             error_df["set"] = set
-        save_file = preds_file.replace(".csv", "_pixel_error.csv")
+        save_file = f"{stem}_pixel_error.csv"
         error_df.to_csv(save_file)
 
     if "temporal" in metrics_to_compute:
@@ -655,7 +715,7 @@ def compute_metrics_single(
         # add train/val/test split
         if set is not None:
             temporal_norm_df["set"] = set
-        save_file = preds_file.replace(".csv", "_temporal_norm.csv")
+        save_file = f"{stem}_temporal_norm.csv"
         temporal_norm_df.to_csv(save_file)
 
     if "pca_singleview" in metrics_to_compute:
@@ -676,7 +736,7 @@ def compute_metrics_single(
         # add train/val/test split
         if set is not None:
             pcasv_df["set"] = set
-        save_file = preds_file.replace(".csv", "_pca_singleview_error.csv")
+        save_file = f"{stem}_pca_singleview_error.csv"
         pcasv_df.to_csv(save_file)
 
     if "pca_multiview" in metrics_to_compute:
@@ -697,7 +757,7 @@ def compute_metrics_single(
         # add train/val/test split
         if set is not None:
             pcamv_df["set"] = set
-        save_file = preds_file.replace(".csv", "_pca_multiview_error.csv")
+        save_file = f"{stem}_pca_multiview_error.csv"
         pcamv_df.to_csv(save_file)
 
 
@@ -719,31 +779,141 @@ def export_predictions_and_labeled_video(
         raise ValueError("either 'ckpt_file' or 'model' must be passed")
 
     # compute predictions
-    preds_df = predict_single_video(
-        video_file=video_file,
-        ckpt_file=ckpt_file,
+    if cfg.eval.get("streaming_predictions", False):
+        # predictions are written to disk batch by batch and never held in memory
+        if save_heatmaps:
+            raise NotImplementedError("heatmaps cannot be saved with streaming predictions")
+        predict_single_video_streaming(
+            video_file=video_file,
+            ckpt_file=ckpt_file,
+            cfg_file=cfg,
+            preds_file=prediction_csv_file,
+            model=model,
+            data_module=data_module,
+        )
+        preds_df = None
+    else:
+        preds_df = predict_single_video(
+            video_file=video_file,
+            ckpt_file=ckpt_file,
+            cfg_file=cfg,
+            preds_file=prediction_csv_file,
+            trainer=trainer,
+            model=model,
+            data_module=data_module,
+            save_heatmaps=save_heatmaps,
+        )
+
+    # create labeled video
+    if labeled_mp4_file is not None:
+        if preds_df is None:
+            preds_df = load_predictions(prediction_csv_file)
+        _export_labeled_video(cfg, video_file, preds_df, labeled_mp4_file)
+
+
+def _export_labeled_video(
+    cfg: DictConfig, video_file: str, preds_df: pd.DataFrame, labeled_mp4_file: str,
+) -> None:
+    os.makedirs(os.path.dirname(labeled_mp4_file), exist_ok=True)
+    # transform df to numpy array
+    keypoints_arr = np.reshape(preds_df.to_numpy(), [preds_df.shape[0], -1, 3])
+    xs_arr = keypoints_arr[:, :, 0]
+    ys_arr = keypoints_arr[:, :, 1]
+    mask_array = keypoints_arr[:, :, 2] > cfg.eval.confidence_thresh_for_vid
+    # video generation
+    video_clip = VideoFileClip(video_file)
+    create_labeled_video(
+        clip=video_clip,
+        xs_arr=xs_arr,
+        ys_arr=ys_arr,
+        mask_array=mask_array,
+        filename=labeled_mp4_file,
+    )
+
+
+@typechecked
+def export_predictions_and_labeled_videos(
+    video_files: List[str],
+    cfg: DictConfig,
+    prediction_csv_files: List[str],
+    ckpt_file: Optional[str] = None,
+    trainer: Optional[pl.Trainer] = None,
+    model: Optional[ALLOWED_MODELS] = None,
+    data_module: Optional[Union[BaseDataModule, UnlabeledDataModule]] = None,
+    labeled_mp4_files: Optional[List[Optional[str]]] = None,
+    save_heatmaps: Optional[bool] = False,
+    skip_failed_metrics: bool = False,
+) -> None:
+    """Export predictions csvs, labeled videos and metrics for several video files.
+
+    While one video is inferred, the loader of the next video is prepared and the outputs of the
+    previous video are written in background threads. Errors raised in the background are
+    re-raised once the outputs of all inferred videos have been written. If
+    `skip_failed_metrics` is True, errors computing the metrics of a video are printed instead,
+    and the remaining videos are processed as usual.
+
+    """
+
+    if ckpt_file is None and model is None:
+        raise ValueError("either 'ckpt_file' or 'model' must be passed")
+    if labeled_mp4_files is None:
+        labeled_mp4_files = [None] * len(video_files)
+
+    def _export_outputs(idx: int, preds_df: Optional[pd.DataFrame] = None) -> None:
+        if labeled_mp4_files[idx] is not None:
+            if preds_df is None:
+                preds_df = load_predictions(prediction_csv_files[idx])
+            _export_labeled_video(cfg, video_files[idx], preds_df, labeled_mp4_files[idx])
+        # compute and save various metrics
+        try:
+            compute_metrics(
+                cfg=cfg, preds_file=prediction_csv_files[idx], data_module=data_module,
+            )
+        except Exception as e:
+            if not skip_failed_metrics:
+                raise
+            print(f"Error computing metrics on video {video_files[idx]}:\n{e}")
+
+    if cfg.eval.get("pack_video_clips", False):
+        # frames of consecutive (short) videos share prediction batches
+        if save_heatmaps:
+            raise NotImplementedError("heatmaps cannot be saved when packing video clips")
+        predict_video_clips(
+            cfg_file=cfg,
+            video_files=video_files,
+            preds_files=prediction_csv_files,
+            data_module=data_module,
+            ckpt_file=ckpt_file,
+            model=model,
+        )
+        for idx in range(len(video_files)):
+            _export_outputs(idx)
+        return
+
+    if cfg.eval.get("streaming_predictions", False):
+        # predictions are already written while the model runs
+        if save_heatmaps:
+            raise NotImplementedError("heatmaps cannot be saved with streaming predictions")
+        for idx, video_file in enumerate(video_files):
+            predict_single_video_streaming(
+                video_file=video_file,
+                ckpt_file=ckpt_file,
+                cfg_file=cfg,
+                preds_file=prediction_csv_files[idx],
+                model=model,
+                data_module=data_module,
+            )
+            _export_outputs(idx)
+        return
+
+    predict_videos(
         cfg_file=cfg,
-        preds_file=prediction_csv_file,
+        video_files=video_files,
+        preds_files=prediction_csv_files,
+        data_module=data_module,
+        ckpt_file=ckpt_file,
         trainer=trainer,
         model=model,
-        data_module=data_module,
         save_heatmaps=save_heatmaps,
+        postprocess=_export_outputs,
     )
-
-    # create labeled video
-    if labeled_mp4_file is not None:
-        os.makedirs(os.path.dirname(labeled_mp4_file), exist_ok=True)
-        # transform df to numpy array
-        keypoints_arr = np.reshape(preds_df.to_numpy(), [preds_df.shape[0], -1, 3])
-        xs_arr = keypoints_arr[:, :, 0]
-        ys_arr = keypoints_arr[:, :, 1]
-        mask_array = keypoints_arr[:, :, 2] > cfg.eval.confidence_thresh_for_vid
-        # video generation
-        video_clip = VideoFileClip(video_file)
-        create_labeled_video(
-            clip=video_clip,
-            xs_arr=xs_arr,
-            ys_arr=ys_arr,
-            mask_array=mask_array,
-            filename=labeled_mp4_file,
-        )
@@ -0,0 +1,37 @@
+"""Pack labeled frames into tar shards that are streamed during training."""
+
+import os
+
+import hydra
+from omegaconf import DictConfig
+
+from lightning_pose.data.datasets import MultiviewHeatmapDataset
+from lightning_pose.data.shards import write_label_shards
+from lightning_pose.utils import pretty_print_str
+from lightning_pose.utils.io import return_absolute_data_paths
+from lightning_pose.utils.scripts import get_dataset, get_imgaug_transform
+
+
+@hydra.main(config_path="configs", config_name="config_mirror-mouse-example")
+def create_label_shards(cfg: DictConfig) -> None:
+
+    if cfg.data.get("label_shard_dir", None) is None:
+        raise ValueError("Set data.label_shard_dir in the config to create label shards")
+
+    pretty_print_str("Packing labeled frames into tar shards")
+
+    data_dir, _ = return_absolute_data_paths(data_cfg=cfg.data)
+    imgaug_transform = get_imgaug_transform(cfg=cfg)
+    dataset = get_dataset(cfg=cfg, data_dir=data_dir, imgaug_transform=imgaug_transform)
+    if isinstance(dataset, MultiviewHeatmapDataset):
+        raise NotImplementedError("label shards are only supported for single-view datasets")
+
+    write_label_shards(
+        dataset=dataset,
+        shard_dir=os.path.join(data_dir, cfg.data.label_shard_dir),
+        samples_per_shard=cfg.data.get("label_shard_size", 1000),
+    )
+
+
+if __name__ == "__main__":
+    create_label_shards()
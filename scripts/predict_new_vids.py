@@ -14,8 +14,7 @@ from lightning_pose.utils.io import (
 )
 from lightning_pose.utils.predictions import load_model_from_checkpoint
 from lightning_pose.utils.scripts import (
-    compute_metrics,
-    export_predictions_and_labeled_video,
+    export_predictions_and_labeled_videos,
     get_data_module,
     get_dataset,
     get_imgaug_transform,
@@ -40,7 +39,7 @@ def predict_videos_in_dir(cfg: DictConfig):
     """
 
     # get pl trainer for prediction
-    trainer = pl.Trainer(accelerator="gpu", devices=1)
+    trainer = pl.Trainer(accelerator="auto", devices=1)
 
     # load data module, which contains info about keypoint names, etc.
     data_dir, video_dir = return_absolute_data_paths(data_cfg=cfg.data)
@@ -75,45 +74,42 @@ def predict_videos_in_dir(cfg: DictConfig):
         # loop over videos in a provided directory
         video_files = get_videos_in_dir(return_absolute_path(cfg.eval.test_videos_directory))
 
+        # file format of the predictions, e.g. csv or parquet
+        preds_ext = "." + cfg.eval.get("predictions_format", "csv")
+        prediction_csv_files = []
+        labeled_mp4_files = []
         for video_file in video_files:
 
             # prediction_csv_file = video_pred_path_handler()
             prediction_csv_file = os.path.join(
                 absolute_cfg_path,
                 "video_preds",
-                os.path.basename(video_file).replace(".mp4", ".csv")
+                os.path.basename(video_file).replace(".mp4", preds_ext)
             )
+            prediction_csv_files.append(prediction_csv_file)
 
             if cfg.eval.get("save_vids_after_training", False):
-                labeled_mp4_file = prediction_csv_file.replace(".csv", "_labeled.mp4")
+                labeled_mp4_files.append(prediction_csv_file.replace(preds_ext, "_labeled.mp4"))
             else:
-                labeled_mp4_file = None
+                labeled_mp4_files.append(None)
 
             # debug
             print(f"\n\n{prediction_csv_file = }\n\n")
 
-            export_predictions_and_labeled_video(
-                video_file=video_file,
-                cfg=cfg,
-                ckpt_file=ckpt_file,
-                prediction_csv_file=prediction_csv_file,
-                labeled_mp4_file=labeled_mp4_file,
-                trainer=trainer,
-                model=model,
-                data_module=data_module,
-                save_heatmaps=cfg.eval.get("predict_vids_after_training_save_heatmaps", False),
-            )
-
-            # compute and save various metrics
-            try:
-                compute_metrics(
-                    cfg=cfg,
-                    preds_file=prediction_csv_file,
-                    data_module=data_module,
-                )
-            except Exception as e:
-                print(f"Error predicting on video {video_file}:\n{e}")
-                continue
+        # the next video is prepared and the previous one saved while a video is inferred;
+        # also computes and saves various metrics, skipping videos whose metrics fail
+        export_predictions_and_labeled_videos(
+            video_files=video_files,
+            cfg=cfg,
+            ckpt_file=ckpt_file,
+            prediction_csv_files=prediction_csv_files,
+            labeled_mp4_files=labeled_mp4_files,
+            trainer=trainer,
+            model=model,
+            data_module=data_module,
+            save_heatmaps=cfg.eval.get("predict_vids_after_training_save_heatmaps", False),
+            skip_failed_metrics=True,
+        )
 
 
 if __name__ == "__main__":
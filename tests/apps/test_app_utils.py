@@ -65,3 +65,21 @@ def test_get_model_folders(tmpdir):
             assert os.path.join(model_parent, model) in trained_models
         else:
             assert os.path.join(model_parent, model) not in trained_models
+
+
+def test_video_prediction_files(tmpdir):
+
+    from lightning_pose.apps.utils import get_all_videos, update_vid_metric_files_list
+
+    # predictions, metrics and heatmaps of two videos
+    model_dir = os.path.join(str(tmpdir), "model")
+    video_dir = os.path.join(model_dir, "video_preds")
+    os.makedirs(video_dir)
+    for video in ["vid0", "vid1"]:
+        for suffix in [".csv", "_temporal_norm.csv", "_heatmaps.hdf5"]:
+            os.mknod(os.path.join(video_dir, video + suffix))
+
+    # heatmaps are neither videos nor prediction files
+    assert sorted(get_all_videos([model_dir])) == ["vid0", "vid1"]
+    files = update_vid_metric_files_list("vid0", [model_dir])
+    assert sorted(str(f) for f in files[0]) == ["vid0.csv", "vid0_temporal_norm.csv"]
@@ -556,6 +556,24 @@ def remove_logs() -> Callable:
     return _remove_logs
 
 
+@pytest.fixture
+def read_frames_sequentially() -> Callable:
+
+    def _read_frames_sequentially(video_file: str, frame_idxs: List[int]) -> dict:
+        """Decode a video from its first frame without seeking; return the requested frames."""
+        cap = cv2.VideoCapture(video_file)
+        frames = {}
+        for frame_idx in range(max(frame_idxs) + 1):
+            ok, frame = cap.read()
+            assert ok, f"could not read frame {frame_idx} of {video_file}"
+            if frame_idx in frame_idxs:
+                frames[frame_idx] = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        cap.release()
+        return frames
+
+    return _read_frames_sequentially
+
+
 @pytest.fixture
 def run_model_test() -> Callable:
 
@@ -3,11 +3,19 @@
 import copy
 import os
 
+import imgaug.augmenters as iaa
 import numpy as np
 import pytest
+import torch
 from PIL import Image
+from torch.utils.data import default_collate
 
-from lightning_pose.data.augmentations import imgaug_transform
+from lightning_pose.data.augmentations import (
+    BatchAugmentationCollate,
+    TorchAugmentation,
+    imgaug_transform,
+    torch_transform,
+)
 
 
 def test_imgaug_transform_default(cfg, base_dataset):
@@ -114,3 +122,213 @@ def test_imgaug_transform_dlc_top_down(cfg, base_dataset):
     )
     im_1 = im_1[0]
     assert not np.allclose(im_0, im_1)
+
+
+def test_batch_augmentation_collate(heatmap_dataset):
+
+    # resize-only pipeline so that per-frame and batch augmentation are deterministic
+    dataset = copy.deepcopy(heatmap_dataset)
+    dataset.imgaug_transform = iaa.Sequential([heatmap_dataset.imgaug_transform[-1]])
+    idxs = [0, 1, 2, 3]
+
+    batch_0 = default_collate([dataset[idx] for idx in idxs])
+
+    dataset.return_raw_images = True
+    collate_fn = BatchAugmentationCollate(dataset)
+    batch_1 = collate_fn([dataset[idx] for idx in idxs])
+
+    assert batch_0.keys() == batch_1.keys()
+    assert torch.allclose(batch_0["images"], batch_1["images"], atol=1e-6)
+    assert torch.allclose(batch_0["keypoints"], batch_1["keypoints"], equal_nan=True)
+    assert torch.allclose(batch_0["heatmaps"], batch_1["heatmaps"])
+    assert torch.equal(batch_0["idxs"], batch_1["idxs"])
+    assert torch.equal(batch_0["bbox"], batch_1["bbox"])
+
+
+def _resized_example(cfg, base_dataset, idx=0):
+    """Load a resized uint8 frame and its keypoints."""
+    img_name = base_dataset.image_names[idx]
+    keypoints_on_image = base_dataset.keypoints[idx].numpy()
+    file_name = os.path.join(base_dataset.root_directory, img_name)
+    image = np.asarray(Image.open(file_name).convert("RGB"))
+    resize = iaa.Resize({
+        "height": cfg.data.image_resize_dims.height,
+        "width": cfg.data.image_resize_dims.width,
+    })
+    return _augment(resize, image, keypoints_on_image)
+
+
+def _augment(aug, image, keypoints):
+    """Apply an imgaug augmenter to one frame and its (num_keypoints, 2) keypoints."""
+    images_aug, keypoints_aug = aug(
+        images=np.expand_dims(image, axis=0),
+        keypoints=np.expand_dims(keypoints, axis=0),
+    )  # expands add batch dim for imgaug
+    return images_aug[0], keypoints_aug[0]
+
+
+def _to_torch(image, keypoints):
+    """uint8 (height, width, 3) frame -> (1, 3, height, width) tensor in [0, 1]."""
+    images = torch.from_numpy(image).permute(2, 0, 1).unsqueeze(0).float() / 255.0
+    return images, torch.from_numpy(np.asarray(keypoints, dtype=np.float32)).unsqueeze(0)
+
+
+def test_torch_transform(cfg, base_dataset):
+
+    cfg_tmp = copy.deepcopy(cfg)
+    height = cfg.data.image_resize_dims.height
+    width = cfg.data.image_resize_dims.width
+    batch_size = 4
+    images = torch.randn(batch_size, 3, height, width)
+    keypoints = torch.rand(batch_size, base_dataset.num_targets) * min(height, width)
+
+    # default pipeline: no augmentation
+    cfg_tmp.training.imgaug = "default"
+    pipe = torch_transform(cfg_tmp)
+    images_aug, keypoints_aug = pipe(images=images, keypoints=keypoints)
+    assert torch.equal(images_aug, images)
+    assert torch.equal(keypoints_aug, keypoints)
+
+    # dlc pipelines: shapes are preserved for single frames and context frames
+    for kind in ["dlc", "dlc-top-down"]:
+        cfg_tmp.training.imgaug = kind
+        pipe = torch_transform(cfg_tmp)
+        images_aug, keypoints_aug = pipe(images=images, keypoints=keypoints)
+        assert images_aug.shape == images.shape
+        assert keypoints_aug.shape == keypoints.shape
+        assert not torch.allclose(images_aug, images)
+        images_context = torch.randn(batch_size, 5, 3, height, width)
+        images_aug, keypoints_aug = pipe(images=images_context, keypoints=keypoints)
+        assert images_aug.shape == images_context.shape
+        assert torch.isfinite(images_aug).all()
+
+    # invalid pipeline: ensure error is raised
+    with pytest.raises(NotImplementedError):
+        TorchAugmentation(kind="null")
+
+
+def test_torch_transform_imgaug_parity(cfg, base_dataset):
+
+    pipe = TorchAugmentation(kind="dlc-top-down")
+    image, keypoints = _resized_example(cfg, base_dataset)
+    images_t, keypoints_t = _to_torch(image, keypoints)
+    kps_t = keypoints_t.reshape(1, -1, 2)
+    yes = torch.tensor([True])
+    no = torch.tensor([False])
+
+    # horizontal and vertical flips: exact
+    for flip_lr, flip_ud, aug in [
+        (yes, no, iaa.Fliplr(1.0)),
+        (no, yes, iaa.Flipud(1.0)),
+    ]:
+        im_ref, kps_ref = _augment(aug, image, keypoints)
+        im, kps = pipe._flip(images_t, kps_t, flip_lr, flip_ud, num_frames=1)
+        im_ref_t, kps_ref_t = _to_torch(im_ref, kps_ref)
+        assert torch.allclose(im, im_ref_t)
+        assert torch.allclose(kps, kps_ref_t.reshape(1, -1, 2), equal_nan=True)
+
+    # rotation: keypoints match, images match up to interpolation differences
+    angle = 15.0
+    im_ref, kps_ref = _augment(iaa.Affine(rotate=angle), image, keypoints)
+    im, kps = pipe._rotate(images_t, kps_t, torch.tensor([angle]), num_frames=1)
+    im_ref_t, kps_ref_t = _to_torch(im_ref, kps_ref)
+    assert torch.allclose(kps, kps_ref_t.reshape(1, -1, 2), atol=1e-3, equal_nan=True)
+    assert (im - im_ref_t).abs().mean() < 0.02
+
+    # crop and pad followed by resize: keypoints match, images match up to interpolation
+    height, width = image.shape[:2]
+    px = (-10, 12, 8, -6)  # top, right, bottom, left
+    percent = torch.tensor([[
+        px[0] / height, px[1] / width, px[2] / height, px[3] / width,
+    ]])
+    crop = iaa.Sequential([
+        iaa.CropAndPad(px=px, keep_size=False),
+        iaa.Resize({"height": height, "width": width}, interpolation="linear"),
+    ])
+    im_ref, kps_ref = _augment(crop, image, keypoints)
+    im, kps = pipe._crop_and_pad(images_t, kps_t, percent, num_frames=1)
+    im_ref_t, kps_ref_t = _to_torch(im_ref, kps_ref)
+    assert torch.allclose(kps, kps_ref_t.reshape(1, -1, 2), atol=1e-3, equal_nan=True)
+    assert (im - im_ref_t).abs().mean() < 0.05
+
+    # histogram equalization: matches up to rounding
+    im_ref = iaa.AllChannelsHistogramEqualization()(image=image)
+    im = pipe._histogram_equalization(images_t, num_frames=1)
+    assert (im - _to_torch(im_ref, keypoints)[0]).abs().max() <= 1.5 / 255
+
+    # context frames share augmentation parameters
+    images_context = images_t.unsqueeze(1).repeat(1, 5, 1, 1, 1)
+    images_aug, _ = pipe(
+        images=(images_context - pipe.mean) / pipe.std, keypoints=keypoints_t,
+    )
+    for i in range(1, 5):
+        assert torch.allclose(images_aug[:, 0], images_aug[:, i])
+
+
+def test_torch_transform_imgaug_parity_resized(base_dataset):
+    """Pixel-sized parameters are rescaled to match imgaug applied before resizing."""
+
+    pipe = TorchAugmentation(kind="dlc")
+    img_name = base_dataset.image_names[0]
+    image = np.asarray(
+        Image.open(os.path.join(base_dataset.root_directory, img_name)).convert("RGB")
+    )
+    keypoints = base_dataset.keypoints[0].numpy()
+    height, width = image.shape[:2]
+    resize = iaa.Resize({"height": height // 2, "width": width // 2}, interpolation="linear")
+    scale = torch.tensor([(height // 2) / height])
+    image_small, keypoints_small = _augment(resize, image, keypoints)
+    images_t, keypoints_t = _to_torch(image_small, keypoints_small)
+    kps_t = keypoints_t.reshape(1, -1, 2)
+    torch.manual_seed(0)
+
+    # crop and pad: pixel amounts are rounded in original image pixels
+    percent = (0.0111, -0.0126, 0.0236, -0.0088)  # top, right, bottom, left
+    crop = iaa.Sequential([iaa.CropAndPad(percent=percent, keep_size=False), resize])
+    _, kps_ref = _augment(crop, image, keypoints)
+    _, kps = pipe._crop_and_pad(images_t, kps_t, torch.tensor([percent]), 1, scale)
+    kps_ref = _to_torch(image, kps_ref)[1].reshape(1, -1, 2)
+    assert torch.allclose(kps, kps_ref, atol=1e-3, equal_nan=True)
+    _, kps = pipe._crop_and_pad(images_t, kps_t, torch.tensor([percent]), 1)
+    assert not torch.allclose(kps, kps_ref, atol=1e-3, equal_nan=True)
+
+    # coarse dropout: the dropout mask has as many cells as imgaug's at the original size
+    def num_cells(mask):
+        return 1 + int((mask[1:] != mask[:-1]).any(axis=1).sum())
+
+    ones = np.full_like(image, 255)
+    drop = iaa.CoarseDropout(p=0.5, size_percent=0.3, per_channel=False)
+    cells_ref = num_cells(drop(image=ones)[:, :, 0])
+    for s in [scale, torch.ones(1)]:
+        im = pipe._coarse_dropout(
+            torch.ones_like(images_t), 1, p=0.5, size_percent=0.3, per_channel=0.0, scale=s,
+        )
+        cells = num_cells(im[0, 0].numpy())
+        assert (abs(cells - cells_ref) <= 1) == (s == scale).item()
+
+    # motion blur: the kernel shrinks with the frame, which stays closer to imgaug
+    im_ref = _to_torch(
+        resize(image=iaa.MotionBlur(k=5, angle=0, direction=0)(image=image)), keypoints
+    )[0]
+    errors = {}
+    for s in [scale, torch.ones(1)]:
+        errors[s.item()] = np.mean([
+            (pipe._motion_blur(images_t, 1, k=5, angle=0, scale=s) - im_ref).abs().mean()
+            for _ in range(8)
+        ])
+    assert errors[scale.item()] < errors[1.0]
+
+    # elastic transform: keypoint displacement matches imgaug in original image pixels
+    num = 32
+    valid = ~np.isnan(keypoints).any(axis=1)
+    elastic = iaa.ElasticTransformation(alpha=10, sigma=5, seed=0)
+    _, kps_ref = elastic(images=np.stack([image] * num), keypoints=[keypoints[valid]] * num)
+    disp_ref = np.sqrt(((np.stack(kps_ref) - keypoints[valid]) ** 2).sum(-1).mean())
+    kps_t = kps_t[:, torch.from_numpy(valid)]
+    for s in [scale, torch.ones(1)]:
+        _, kps = pipe._elastic(
+            images_t.repeat(num, 1, 1, 1), kps_t.repeat(num, 1, 1), s.repeat(num),
+            alpha=(10, 10), sigma=5,
+        )
+        disp = ((kps - kps_t) ** 2).sum(-1).mean().sqrt().item() / scale.item()
+        assert (1 / 1.4 < disp / disp_ref < 1.4) == (s == scale).item()
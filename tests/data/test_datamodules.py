@@ -190,6 +190,97 @@ def test_subsampling_of_training_frames(base_dataset):
     torch.cuda.empty_cache()
 
 
+def test_split_views_share_dataset(heatmap_data_module, multiview_heatmap_data_module):
+
+    # splits share labels with the full dataset but have their own imgaug pipelines
+    dataset = heatmap_data_module.dataset
+    train_dataset = heatmap_data_module.train_dataset.dataset
+    val_dataset = heatmap_data_module.val_dataset.dataset
+    test_dataset = heatmap_data_module.test_dataset.dataset
+    for split in [train_dataset, val_dataset, test_dataset]:
+        assert split is not dataset
+        assert split.keypoints is dataset.keypoints
+        assert split.image_names is dataset.image_names
+    assert train_dataset.imgaug_transform is dataset.imgaug_transform
+    assert len(val_dataset.imgaug_transform) == 1
+    assert len(test_dataset.imgaug_transform) == 1
+    assert len(dataset.imgaug_transform) > 1
+
+    # pipelines of multiview splits are propagated to each view
+    dataset = multiview_heatmap_data_module.dataset
+    val_dataset = multiview_heatmap_data_module.val_dataset.dataset
+    for view_name, view_dataset in val_dataset.dataset.items():
+        assert view_dataset is not dataset.dataset[view_name]
+        assert view_dataset.keypoints is dataset.dataset[view_name].keypoints
+        assert len(view_dataset.imgaug_transform) == 1
+        assert len(dataset.dataset[view_name].imgaug_transform) > 1
+
+
+def test_heatmap_datamodule_batch_augmentation(cfg, heatmap_dataset):
+
+    from lightning_pose.data.datamodules import BaseDataModule
+
+    im_height = cfg.data.image_resize_dims.height
+    im_width = cfg.data.image_resize_dims.width
+    train_size = 4
+
+    data_module = BaseDataModule(
+        heatmap_dataset, train_batch_size=train_size, num_workers=0, batch_augmentation=True,
+    )
+    data_module.setup()
+
+    # augmentations are deferred to the collate function for training data only
+    assert data_module.train_dataset.dataset.return_raw_images
+    assert not data_module.val_dataset.dataset.return_raw_images
+    assert not heatmap_dataset.return_raw_images
+
+    train_batch = next(iter(data_module.train_dataloader()))
+    val_batch = next(iter(data_module.val_dataloader()))
+    assert train_batch.keys() == val_batch.keys()
+    for key in ["images", "keypoints", "heatmaps", "bbox"]:
+        assert train_batch[key].shape[1:] == val_batch[key].shape[1:]
+        assert train_batch[key].dtype == val_batch[key].dtype
+    assert train_batch["images"].shape == (train_size, 3, im_height, im_width)
+    assert train_batch["heatmaps"].shape[2:] == heatmap_dataset.output_shape
+
+    # cleanup
+    del data_module
+    del train_batch
+    del val_batch
+    torch.cuda.empty_cache()
+
+
+def test_heatmap_datamodule_heatmaps_on_device(cfg, heatmap_dataset):
+
+    import copy
+
+    from lightning_pose.data.datamodules import BaseDataModule
+
+    # compare against heatmaps computed in the dataset; use deterministic validation batches
+    dataset = copy.deepcopy(heatmap_dataset)
+    data_module_ref = BaseDataModule(dataset, num_workers=0)
+    data_module_ref.setup()
+    batch_ref = next(iter(data_module_ref.val_dataloader()))
+
+    data_module = BaseDataModule(heatmap_dataset, num_workers=0, heatmaps_on_device=True)
+    data_module.setup()
+    # the flag is only set on the split datasets, not on the dataset passed by the caller
+    assert heatmap_dataset.return_heatmaps
+    assert not data_module.train_dataset.dataset.return_heatmaps
+    batch = next(iter(data_module.val_dataloader()))
+    assert "heatmaps" not in batch
+    batch = data_module.on_after_batch_transfer(batch, dataloader_idx=0)
+
+    assert torch.allclose(batch["images"], batch_ref["images"])
+    assert torch.allclose(batch["heatmaps"], batch_ref["heatmaps"])
+    assert torch.allclose(batch["keypoints"], batch_ref["keypoints"], equal_nan=True)
+
+    # cleanup
+    del data_module, data_module_ref
+    del batch, batch_ref
+    torch.cuda.empty_cache()
+
+
 def test_base_data_module_combined(cfg, base_data_module_combined):
 
     im_height = cfg.data.image_resize_dims.height
@@ -1,7 +1,15 @@
 """Test basic dataset functionality."""
 
+import copy
+import os
+
+import imgaug.augmenters as iaa
+import numpy as np
 import torch
 
+from lightning_pose.data.datasets import BaseTrackingDataset
+from lightning_pose.utils.scripts import get_imgaug_transform
+
 
 def test_base_dataset(cfg, base_dataset):
 
@@ -59,6 +67,29 @@ def test_multiview_heatmap_dataset(cfg_multiview, multiview_heatmap_dataset):
     assert type(batch["keypoints"]) is torch.Tensor
 
 
+def test_multiview_heatmap_dataset_fusion(multiview_heatmap_dataset):
+
+    # resize-only pipeline so that per-view outputs are deterministic
+    dataset = copy.deepcopy(multiview_heatmap_dataset)
+    for view_dataset in dataset.dataset.values():
+        view_dataset.imgaug_transform = iaa.Sequential([view_dataset.imgaug_transform[-1]])
+
+    idx = 0
+    batch = dataset[idx]
+    view_batches = [dataset.dataset[view][idx] for view in dataset.view_names]
+    assert batch["concat_order"] == dataset.view_names
+    assert torch.allclose(batch["images"], torch.stack([b["images"] for b in view_batches]))
+    assert torch.allclose(
+        batch["keypoints"], torch.cat([b["keypoints"] for b in view_batches]), equal_nan=True,
+    )
+    assert torch.allclose(batch["heatmaps"], torch.cat([b["heatmaps"] for b in view_batches]))
+    assert torch.equal(batch["bbox"], torch.cat([b["bbox"] for b in view_batches]))
+
+    # views are loaded in a thread pool, which is not copied along with the dataset
+    assert dataset._executor is not None
+    assert copy.deepcopy(dataset)._executor is None
+
+
 def test_heatmap_dataset_context(cfg, heatmap_dataset_context):
 
     im_height = cfg.data.image_resize_dims.height
@@ -77,6 +108,34 @@ def test_heatmap_dataset_context(cfg, heatmap_dataset_context):
     assert isinstance(batch["images"], torch.Tensor)
     assert isinstance(batch["keypoints"], torch.Tensor)
 
+    # check precomputed context frames
+    dataset = heatmap_dataset_context
+    assert dataset.context_idxs.shape == (len(dataset), 5)
+    for idx in range(len(dataset)):
+        # center frame is always the labeled frame itself
+        assert dataset.context_idxs[idx, 2] == idx
+        context_names = dataset._get_context_names(dataset.image_names[idx])
+        for j, frame_idx in enumerate(dataset.context_idxs[idx]):
+            name = dataset.frame_names[frame_idx]
+            if name != dataset.image_names[idx]:
+                assert name == context_names[j]
+                assert os.path.exists(os.path.join(dataset.root_directory, name))
+
+
+def test_heatmap_dataset_context_single_pass(heatmap_dataset_context):
+
+    # resize-only pipeline so that stacked and per-frame outputs are deterministic
+    dataset = copy.deepcopy(heatmap_dataset_context)
+    dataset.imgaug_transform = iaa.Sequential([heatmap_dataset_context.imgaug_transform[-1]])
+
+    idx = 0
+    batch = dataset[idx]
+    for i, frame_idx in enumerate(dataset.context_idxs[idx]):
+        image, _ = dataset._read_image(dataset.frame_names[frame_idx])
+        transformed_image = dataset.imgaug_transform(images=np.expand_dims(image, axis=0))[0]
+        transformed_image = dataset.pytorch_transform(transformed_image)
+        assert torch.allclose(batch["images"][i], transformed_image, atol=1e-6)
+
 
 def test_multiview_heatmap_dataset_context(cfg_multiview, multiview_heatmap_dataset_context):
     im_height = cfg_multiview.data.image_resize_dims.height
@@ -96,6 +155,209 @@ def test_multiview_heatmap_dataset_context(cfg_multiview, multiview_heatmap_data
     assert type(batch["keypoints"]) is torch.Tensor
 
 
+def test_heatmap_dataset_compute_heatmaps(heatmap_dataset, tmp_path):
+
+    # resize-only pipeline so that heatmaps are deterministic
+    dataset = copy.deepcopy(heatmap_dataset)
+    dataset.imgaug_transform = iaa.Sequential([heatmap_dataset.imgaug_transform[-1]])
+    assert dataset.resize_only
+
+    heatmaps_ref = torch.stack([dataset[idx]["heatmaps"] for idx in range(len(dataset))])
+
+    # chunks cover the full dataset in order
+    starts = []
+    for start, heatmaps in dataset.iter_heatmaps(chunk_size=7):
+        starts.append(start)
+        assert torch.allclose(heatmaps, heatmaps_ref[start:start + heatmaps.shape[0]], atol=1e-6)
+    assert starts == list(range(0, len(dataset), 7))
+
+    heatmaps = dataset.compute_heatmaps(chunk_size=7)
+    assert torch.allclose(heatmaps, heatmaps_ref, atol=1e-6)
+
+    # memory-mapped cache is created once and reused
+    heatmaps = dataset.compute_heatmaps(chunk_size=7, cache_dir=str(tmp_path))
+    assert torch.allclose(heatmaps, heatmaps_ref, atol=1e-6)
+    cache_files = os.listdir(tmp_path)
+    assert len(cache_files) == 1
+    mtime = os.path.getmtime(os.path.join(tmp_path, cache_files[0]))
+    heatmaps = dataset.compute_heatmaps(cache_dir=str(tmp_path))
+    assert torch.allclose(heatmaps, heatmaps_ref, atol=1e-6)
+    assert os.listdir(tmp_path) == cache_files
+    assert os.path.getmtime(os.path.join(tmp_path, cache_files[0])) == mtime
+
+
+def test_base_dataset_reduced_resolution_decode(cfg, toy_data_dir, tmp_path):
+
+    import pandas as pd
+    from PIL import Image
+
+    # convert a few labeled frames to jpeg, which supports reduced-resolution decoding
+    csv_data = pd.read_csv(
+        os.path.join(toy_data_dir, cfg.data.csv_file), header=[0, 1, 2], index_col=0,
+    ).iloc[:4]
+    new_index = []
+    for img_name in csv_data.index:
+        new_name = os.path.splitext(img_name)[0] + ".jpg"
+        os.makedirs(os.path.join(tmp_path, os.path.dirname(new_name)), exist_ok=True)
+        Image.open(os.path.join(toy_data_dir, img_name)).convert("RGB").save(
+            os.path.join(tmp_path, new_name), quality=95,
+        )
+        new_index.append(new_name)
+    csv_data.index = new_index
+    csv_data.to_csv(os.path.join(tmp_path, "labels.csv"))
+
+    # resize target much smaller than the frames
+    imgaug_transform = iaa.Sequential([iaa.Resize({"height": 128, "width": 128})])
+    dataset_full = BaseTrackingDataset(
+        root_directory=str(tmp_path), csv_path="labels.csv", imgaug_transform=imgaug_transform,
+    )
+    dataset_reduced = BaseTrackingDataset(
+        root_directory=str(tmp_path), csv_path="labels.csv", imgaug_transform=imgaug_transform,
+        reduced_resolution_decode=True,
+    )
+
+    image_full, shape_full = dataset_full._read_image(new_index[0])
+    image_reduced, shape_reduced = dataset_reduced._read_image(new_index[0])
+    assert shape_full == shape_reduced == image_full.shape[:2]
+    assert image_reduced.shape[0] < image_full.shape[0]
+    assert image_reduced.shape[0] >= 128 and image_reduced.shape[1] >= 128
+
+    for idx in range(len(dataset_full)):
+        batch_full = dataset_full[idx]
+        batch_reduced = dataset_reduced[idx]
+        # keypoints and bounding boxes refer to the same coordinates
+        assert torch.allclose(
+            batch_full["keypoints"], batch_reduced["keypoints"], atol=1e-4, equal_nan=True,
+        )
+        assert torch.equal(batch_full["bbox"], batch_reduced["bbox"])
+        assert batch_full["images"].shape == batch_reduced["images"].shape
+        assert (batch_full["images"] - batch_reduced["images"]).abs().mean() < 0.1
+
+
 def test_equal_return_sizes(base_dataset, heatmap_dataset):
     # can only assert the batches are the same if not using imgaug pipeline
     assert base_dataset[0]["images"].shape == heatmap_dataset[0]["images"].shape
+
+
+def test_base_dataset_frame_store(cfg, toy_data_dir, tmp_path):
+
+    # resize-only pipeline so that outputs from both datasets are identical
+    cfg_tmp = copy.deepcopy(cfg)
+    cfg_tmp.training.imgaug = "default"
+    imgaug_transform = get_imgaug_transform(cfg_tmp)
+
+    dataset_files = BaseTrackingDataset(
+        root_directory=toy_data_dir,
+        csv_path=cfg.data.csv_file,
+        imgaug_transform=imgaug_transform,
+    )
+    dataset_store = BaseTrackingDataset(
+        root_directory=toy_data_dir,
+        csv_path=cfg.data.csv_file,
+        imgaug_transform=imgaug_transform,
+        frame_store_dir=str(tmp_path),
+    )
+    assert len(dataset_store.frame_store) == len(dataset_store)
+    store_files = sorted(os.listdir(tmp_path))
+    assert len(store_files) == 2
+
+    for idx in [0, len(dataset_store) - 1]:
+        batch_files = dataset_files[idx]
+        batch_store = dataset_store[idx]
+        assert torch.allclose(batch_files["images"], batch_store["images"])
+        assert torch.allclose(batch_files["keypoints"], batch_store["keypoints"], equal_nan=True)
+        assert torch.equal(batch_files["bbox"], batch_store["bbox"])
+
+    # a second dataset on the same data reuses the existing store
+    BaseTrackingDataset(
+        root_directory=toy_data_dir,
+        csv_path=cfg.data.csv_file,
+        imgaug_transform=imgaug_transform,
+        frame_store_dir=str(tmp_path),
+    )
+    assert sorted(os.listdir(tmp_path)) == store_files
+
+
+def test_base_dataset_frame_cache(cfg, toy_data_dir):
+
+    cfg_tmp = copy.deepcopy(cfg)
+    cfg_tmp.training.imgaug = "default"
+    imgaug_transform = get_imgaug_transform(cfg_tmp)
+
+    dataset_files = BaseTrackingDataset(
+        root_directory=toy_data_dir,
+        csv_path=cfg.data.csv_file,
+        imgaug_transform=imgaug_transform,
+    )
+    # budget for two frames
+    frame, _ = dataset_files._decode_image(
+        os.path.join(toy_data_dir, dataset_files.image_names[0])
+    )
+    dataset_cache = BaseTrackingDataset(
+        root_directory=toy_data_dir,
+        csv_path=cfg.data.csv_file,
+        imgaug_transform=imgaug_transform,
+        frame_cache_bytes=2 * frame.nbytes,
+    )
+    cache = dataset_cache.frame_cache
+    assert cache.num_slots == 2
+
+    for idx in [0, 1, 0, 1]:
+        assert torch.allclose(dataset_files[idx]["images"], dataset_cache[idx]["images"])
+    assert cache.stats() == {"hits": 2, "misses": 2, "frames": 2}
+
+    # least recently used frame is evicted
+    dataset_cache[2]
+    assert dataset_cache.image_names[0] not in cache
+    assert dataset_cache.image_names[1] in cache
+    assert dataset_cache.image_names[2] in cache
+
+    # frames decoded in workers are visible to all processes
+    loader = torch.utils.data.DataLoader(dataset_cache, batch_size=1, num_workers=2)
+    for _ in loader:
+        pass
+    assert cache.hits + cache.misses == 5 + len(dataset_cache)
+    assert len(cache) == 2
+
+
+def test_base_dataset_video_frames(cfg, toy_data_dir, tmp_path, read_frames_sequentially):
+
+    from lightning_pose.data.video import split_video_frame_name
+
+    assert split_video_frame_name("videos/test_vid.mp4:12") == ("videos/test_vid.mp4", 12)
+    assert split_video_frame_name("labeled-data/img01.png") is None
+
+    # reference the first labeled rows as frames of the toy video
+    csv_file = os.path.join(toy_data_dir, cfg.data.csv_file)
+    with open(csv_file, "r") as f:
+        lines = f.read().splitlines()[:8]
+    frame_idxs = [0, 1, 10, 20, 30]
+    for i, frame_idx in enumerate(frame_idxs):
+        _, values = lines[3 + i].split(",", 1)
+        lines[3 + i] = f"videos/test_vid.mp4:{frame_idx},{values}"
+    csv_video = tmp_path / "CollectedData_video.csv"
+    csv_video.write_text("\n".join(lines) + "\n")
+
+    imgaug_transform = iaa.Sequential([iaa.Resize({"height": 128, "width": 128})])
+    dataset = BaseTrackingDataset(
+        root_directory=toy_data_dir,
+        csv_path=str(csv_video),
+        imgaug_transform=imgaug_transform,
+        do_context=True,
+    )
+    assert len(dataset) == len(frame_idxs)
+    example = dataset[2]
+    assert example["images"].shape == (5, 3, 128, 128)
+
+    # labeled and context frames match the frames of a sequential read of the video
+    reader = dataset.video_reader
+    video_file = os.path.join(toy_data_dir, "videos", "test_vid.mp4")
+    context_idxs = sorted({max(i + j, 0) for i in frame_idxs for j in range(-2, 3)})
+    frames = read_frames_sequentially(video_file, context_idxs)
+    for frame_idx in context_idxs[::-1] + context_idxs:
+        assert np.array_equal(reader.read(video_file, frame_idx), frames[frame_idx])
+    frame = frames[10]
+    frame_shape = reader.frame_shape(video_file)
+    assert frame.shape == (*frame_shape, 3)
+    assert torch.equal(example["bbox"], torch.tensor([0, 0, *frame_shape]))
+    assert dataset[0]["images"].shape == (5, 3, 128, 128)
@@ -0,0 +1,191 @@
+"""Test the OpenCV video loading backend."""
+
+import copy
+
+import numpy as np
+import pytest
+import torch
+
+
+def test_prepare_opencv_single_view(cfg, video_list):
+
+    from lightning_pose.data.opencv import PrepareOpenCV, get_video_preparer
+    from lightning_pose.data.video import VideoFrameReader
+
+    im_height = 256
+    im_width = 256
+
+    cfg_tmp = copy.deepcopy(cfg)
+    cfg_tmp.dali.general.backend = "opencv"
+    assert get_video_preparer(cfg_tmp.dali) is PrepareOpenCV
+
+    num_frames = VideoFrameReader().num_frames(video_list[0])
+
+    # -----------------------
+    # base model
+    # -----------------------
+    vid_pred_class = PrepareOpenCV(
+        train_stage="predict",
+        model_type="base",
+        filenames=video_list,
+        dali_config=cfg_tmp.dali,
+        resize_dims=[im_height, im_width],
+    )
+    loader = vid_pred_class()
+    sequence_length = cfg.dali.base.predict.sequence_length
+    batches = list(loader)
+    assert len(batches) == vid_pred_class.num_iters == len(loader)
+    for batch in batches:
+        assert batch["frames"].shape == (sequence_length, 3, im_height, im_width)
+        assert batch["transforms"].shape == (1,)
+        assert batch["bbox"].shape == (sequence_length, 4)
+        assert not batch["is_multiview"]
+    # sequences are consecutive and the last one is padded with black frames
+    frames = torch.cat([batch["frames"] for batch in batches])
+    assert len(frames) >= num_frames
+    padded = frames[num_frames:]
+    assert torch.allclose(padded, frames[-1].expand_as(padded))
+
+    # -----------------------
+    # context model
+    # -----------------------
+    vid_pred_class = PrepareOpenCV(
+        train_stage="predict",
+        model_type="context",
+        filenames=video_list,
+        dali_config=cfg_tmp.dali,
+        resize_dims=[im_height, im_width],
+    )
+    loader = vid_pred_class()
+    sequence_length = cfg.dali.context.predict.sequence_length
+    batches = list(loader)
+    assert len(batches) == vid_pred_class.num_iters
+    # consecutive sequences overlap by 4 frames
+    assert torch.allclose(batches[0]["frames"][-4:], batches[1]["frames"][:4])
+
+    # augmentations return the affine transform of each sequence
+    vid_train_class = PrepareOpenCV(
+        train_stage="train",
+        model_type="base",
+        filenames=video_list,
+        dali_config=cfg_tmp.dali,
+        resize_dims=[im_height, im_width],
+        imgaug="dlc",
+    )
+    loader = vid_train_class()
+    batch = next(iter(loader))
+    assert batch["frames"].shape == (cfg.dali.base.train.sequence_length, 3, im_height, im_width)
+    assert batch["transforms"].shape == (2, 3)
+    assert np.all(np.isfinite(batch["frames"].numpy()))
+
+
+def test_prepare_opencv_multiview(cfg_multiview, video_list):
+
+    from lightning_pose.data.opencv import PrepareOpenCV
+
+    im_height = 256
+    im_width = 256
+
+    num_views = 2
+    filenames = [video_list] * num_views  # really just copies of the same video
+
+    for model_type in ["base", "context"]:
+        vid_pred_class = PrepareOpenCV(
+            train_stage="predict",
+            model_type=model_type,
+            filenames=filenames,
+            dali_config=cfg_multiview.dali,
+            resize_dims=[im_height, im_width],
+        )
+        loader = vid_pred_class()
+        batch = next(iter(loader))
+        batch_size = cfg_multiview.dali[model_type].predict.sequence_length
+        assert batch["frames"].shape == (batch_size, num_views, 3, im_height, im_width)
+        assert batch["transforms"].shape == (num_views, 1, 1)
+        assert batch["bbox"].shape == (batch_size, num_views * 4)
+        assert torch.allclose(batch["frames"][:, 0], batch["frames"][:, 1])
+
+
+def test_get_video_preparer(cfg):
+
+    from lightning_pose.data.dali import PrepareDALI
+    from lightning_pose.data.opencv import get_video_preparer
+
+    assert get_video_preparer(cfg.dali) is PrepareDALI
+
+    cfg_tmp = copy.deepcopy(cfg)
+    cfg_tmp.dali.general.backend = "ffmpeg"
+    with pytest.raises(NotImplementedError):
+        get_video_preparer(cfg_tmp.dali)
+
+
+def test_opencv_loader_workers(cfg, video_list):
+
+    from lightning_pose.data.opencv import PrepareOpenCV
+
+    cfg_tmp = copy.deepcopy(cfg)
+    cfg_tmp.dali.general.backend = "opencv"
+    cfg_tmp.dali.general.num_workers = 2
+
+    def make_loader():
+        return PrepareOpenCV(
+            train_stage="train",
+            model_type="base",
+            filenames=video_list,
+            dali_config=cfg_tmp.dali,
+            resize_dims=[128, 128],
+        )()
+
+    loader = make_loader()
+    assert loader.num_workers == 2
+    # workers together return the batches of one epoch
+    batches = list(loader)
+    assert len(batches) == len(loader)
+    assert batches[0]["frames"].shape == (cfg.dali.base.train.sequence_length, 3, 128, 128)
+
+    # sequences are split between workers without overlap and are seeded deterministically
+    worker_sequences = [loader._worker_sequences(0, worker_id, 2) for worker_id in range(2)]
+    assert sum(len(sequences) for sequences in worker_sequences) == loader.num_iters
+    assert worker_sequences == [make_loader()._worker_sequences(0, w, 2) for w in range(2)]
+    assert worker_sequences != [loader._worker_sequences(1, w, 2) for w in range(2)]
+
+
+def test_packed_clip_loader(video_list):
+
+    from lightning_pose.data.opencv import PackedClipLoader
+    from lightning_pose.data.video import get_video_metadata
+
+    num_frames = get_video_metadata(video_list[0])["num_frames"]
+    filenames = [video_list[0]] * 3
+    sequence_length = 32
+
+    for do_context in [False, True]:
+        loader = PackedClipLoader(
+            filenames=filenames,
+            resize_dims=[64, 64],
+            sequence_length=sequence_length,
+            do_context=do_context,
+        )
+        clip_idxs, frame_idxs = [], []
+        num_batches = 0
+        for batch, clip_idxs_b, frame_idxs_b in loader:
+            assert batch["frames"].shape == (sequence_length, 3, 64, 64)
+            assert batch["bbox"].shape == (sequence_length, 4)
+            num_rows = sequence_length - 4 if do_context else sequence_length
+            assert len(clip_idxs_b) == len(frame_idxs_b) == num_rows
+            clip_idxs.append(clip_idxs_b)
+            frame_idxs.append(frame_idxs_b)
+            num_batches += 1
+        clip_idxs = np.concatenate(clip_idxs)
+        frame_idxs = np.concatenate(frame_idxs)
+        valid = clip_idxs >= 0
+        # every frame of every clip gets exactly one prediction row, in order
+        expected_clips = np.repeat(np.arange(len(filenames)), num_frames)
+        expected_frames = np.tile(np.arange(num_frames), len(filenames))
+        assert np.array_equal(clip_idxs[valid], expected_clips)
+        assert np.array_equal(frame_idxs[valid], expected_frames)
+        # frames are packed across clips; only the last batch is incomplete
+        num_stream = len(filenames) * (num_frames + (4 if do_context else 0))
+        step = sequence_length - 4 if do_context else sequence_length
+        overlap = 4 if do_context else 0
+        assert num_batches == int(np.ceil((num_stream - overlap) / step))
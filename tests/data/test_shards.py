@@ -0,0 +1,113 @@
+"""Test packing and streaming of labeled frames in tar shards."""
+
+import copy
+import os
+import shutil
+
+import pytest
+import torch
+from torch.utils.data import DataLoader
+
+from lightning_pose.utils.scripts import get_imgaug_transform
+
+
+def test_sharded_labeled_dataset(cfg, heatmap_dataset, tmp_path):
+
+    from lightning_pose.data.shards import ShardedLabeledDataset, write_label_shards
+
+    # resize-only pipeline so that streamed and indexed examples are identical
+    cfg_tmp = copy.deepcopy(cfg)
+    cfg_tmp.training.imgaug = "default"
+    dataset = heatmap_dataset.with_transform(get_imgaug_transform(cfg_tmp))
+
+    shard_files = write_label_shards(dataset, str(tmp_path), samples_per_shard=20)
+    assert len(shard_files) == (len(dataset) + 19) // 20
+
+    indices = list(range(0, len(dataset), 3))
+    sharded = ShardedLabeledDataset(dataset, str(tmp_path), indices=indices, shuffle_buffer=1)
+    assert len(sharded) == len(indices)
+    examples = list(sharded)
+    assert sorted(example["idxs"] for example in examples) == indices
+    for example in examples[:3]:
+        example_ref = dataset[example["idxs"]]
+        assert torch.allclose(example["images"], example_ref["images"])
+        assert torch.allclose(example["keypoints"], example_ref["keypoints"], equal_nan=True)
+        assert torch.allclose(example["heatmaps"], example_ref["heatmaps"])
+        assert torch.equal(example["bbox"], example_ref["bbox"])
+
+    # every frame is streamed exactly once across workers, whether workers split shards
+    # (more shards than workers) or frames (fewer shards than workers)
+    for num_workers in [2, 8]:
+        loader = DataLoader(sharded, batch_size=4, num_workers=num_workers)
+        idxs = torch.cat([batch["idxs"] for batch in loader]).tolist()
+        assert sorted(idxs) == indices
+
+
+def test_sharded_labeled_dataset_stale(cfg, heatmap_dataset, tmp_path):
+
+    from lightning_pose.data.shards import ShardedLabeledDataset, write_label_shards
+
+    with pytest.raises(FileNotFoundError):
+        ShardedLabeledDataset(heatmap_dataset, str(tmp_path))
+
+    write_label_shards(heatmap_dataset, str(tmp_path))
+    dataset = heatmap_dataset.with_transform(heatmap_dataset.imgaug_transform)
+    dataset.image_names = dataset.image_names[::-1]
+    with pytest.raises(ValueError):
+        ShardedLabeledDataset(dataset, str(tmp_path))
+
+
+def test_sharded_labeled_dataset_labels(cfg, heatmap_dataset, tmp_path):
+
+    from lightning_pose.data.shards import ShardedLabeledDataset, write_label_shards
+
+    # work on a copy of the labeled frames, which are modified below
+    cfg_tmp = copy.deepcopy(cfg)
+    cfg_tmp.training.imgaug = "default"
+    dataset = heatmap_dataset.with_transform(get_imgaug_transform(cfg_tmp))
+    dataset.root_directory = str(tmp_path / "data")
+    dataset.keypoints = dataset.keypoints.clone()
+    shutil.copytree(
+        os.path.join(heatmap_dataset.root_directory, "labeled-data"),
+        os.path.join(dataset.root_directory, "labeled-data"),
+    )
+    shard_dir = str(tmp_path / "shards")
+    write_label_shards(dataset, shard_dir, samples_per_shard=20)
+
+    # edited labels are streamed without rebuilding the shards
+    dataset.keypoints[0, 0] += 5.0
+    sharded = ShardedLabeledDataset(dataset, shard_dir, indices=[0], shuffle_buffer=1)
+    example = next(iter(sharded))
+    assert torch.allclose(example["keypoints"], dataset[0]["keypoints"], equal_nan=True)
+    assert torch.allclose(example["heatmaps"], dataset[0]["heatmaps"])
+
+    # replaced images make the shards stale
+    img_file = os.path.join(dataset.root_directory, dataset.image_names[0])
+    shutil.copyfile(os.path.join(dataset.root_directory, dataset.image_names[1]), img_file)
+    with pytest.raises(ValueError):
+        ShardedLabeledDataset(dataset, shard_dir)
+
+
+def test_sharded_labeled_dataset_worker_split(heatmap_dataset, tmp_path, monkeypatch):
+
+    from types import SimpleNamespace
+
+    from lightning_pose.data.shards import ShardedLabeledDataset, write_label_shards
+
+    shard_files = write_label_shards(heatmap_dataset, str(tmp_path), samples_per_shard=20)
+    sharded = ShardedLabeledDataset(heatmap_dataset, str(tmp_path))
+
+    # with more workers than shards, each worker reads a contiguous range of frames and only
+    # opens the shards holding them
+    num_workers = 2 * len(shard_files)
+    kept = []
+    for worker_id in range(num_workers):
+        monkeypatch.setattr(
+            torch.utils.data, "get_worker_info",
+            lambda: SimpleNamespace(num_workers=num_workers, id=worker_id),
+        )
+        worker_shards, keep = sharded._worker_split()
+        assert len(worker_shards) <= 2
+        assert worker_shards == sorted({shard_files[idx // 20] for idx in keep})
+        kept.extend(keep)
+    assert sorted(kept) == list(range(len(heatmap_dataset)))
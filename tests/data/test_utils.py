@@ -45,6 +45,22 @@ def test_data_extractor(base_data_module_combined, multiview_heatmap_data_module
     assert keypoint_tensor.shape == (num_frames, 28)  # 72 = 0.8 * 90 images, 7 * 2 * 2 coords
 
 
+def test_data_extractor_keypoints_only(heatmap_data_module, multiview_heatmap_data_module):
+
+    from lightning_pose.data.utils import DataExtractor
+
+    # keypoints computed from the labels match those returned by the resize-only val loader
+    for data_module in [heatmap_data_module, multiview_heatmap_data_module]:
+        extractor = DataExtractor(data_module=data_module, cond="val")
+        assert extractor.keypoints_only
+        keypoints, images = extractor()
+        assert images is None
+        keypoints_loader, _ = extractor.iterate_over_dataloader(
+            extractor.verify_labeled_loader(extractor.get_loader())
+        )
+        assert torch.allclose(keypoints, keypoints_loader, atol=1e-4, equal_nan=True)
+
+
 def test_split_sizes_from_probabilities():
 
     from lightning_pose.data.utils import split_sizes_from_probabilities
@@ -120,11 +136,12 @@ def test_count_frames(video_list):
 
     from lightning_pose.data.utils import count_frames
 
-    # make sure value is correct in the single view case
+    # make sure value is correct in the single view case; frames are counted exactly
     num_frames = 0
     for video_file in video_list:
         cap = cv2.VideoCapture(video_file)
-        num_frames += int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        while cap.grab():
+            num_frames += 1
         cap.release()
     num_frames_1 = count_frames(video_list)
     assert num_frames == num_frames_1
@@ -270,6 +287,42 @@ def test_generate_uniform_heatmaps(cfg, toy_data_dir):
     torch.cuda.empty_cache()  # remove tensors from gpu
 
 
+def test_generate_heatmaps_separable():
+
+    height, width = 128, 96
+    output_shape = (32, 24)
+    sigma = 1.25
+    keypoints = torch.rand(3, 4, 2) * torch.tensor([width, height])
+    keypoints[0, 1, :] = torch.nan
+
+    # dense reference: evaluate the 2d gaussian on the full grid
+    kps = keypoints.clone()
+    kps[:, :, 1] *= output_shape[0] / height
+    kps[:, :, 0] *= output_shape[1] / width
+    yy, xx = torch.meshgrid(
+        torch.arange(output_shape[0]), torch.arange(output_shape[1]), indexing="ij",
+    )
+    dist = (xx - kps[:, :, 0, None, None]) ** 2 + (yy - kps[:, :, 1, None, None]) ** 2
+    heatmaps_ref = torch.exp(-dist / (2 * sigma**2))
+    heatmaps_ref = heatmaps_ref / heatmaps_ref.sum(dim=(2, 3), keepdim=True)
+
+    for uniform_heatmaps in [False, True]:
+        heatmaps = generate_heatmaps(
+            keypoints, height=height, width=width, output_shape=output_shape, sigma=sigma,
+            uniform_heatmaps=uniform_heatmaps,
+        )
+        assert heatmaps.shape == (3, 4, *output_shape)
+        # valid keypoints match dense computation
+        assert torch.allclose(heatmaps[1:], heatmaps_ref[1:], atol=1e-6)
+        assert torch.allclose(heatmaps[0, [0, 2, 3]], heatmaps_ref[0, [0, 2, 3]], atol=1e-6)
+        # missing keypoints are filled
+        if uniform_heatmaps:
+            fill = 1.0 / (output_shape[0] * output_shape[1])
+            assert torch.allclose(heatmaps[0, 1], torch.full(output_shape, fill))
+        else:
+            assert torch.all(heatmaps[0, 1] == 0)
+
+
 def test_generate_heatmaps_weird_shape(cfg, toy_data_dir):
 
     from lightning_pose.utils.scripts import get_dataset, get_imgaug_transform
@@ -0,0 +1,82 @@
+"""Test video metadata and random frame access."""
+
+import json
+import os
+import shutil
+
+import cv2
+import numpy as np
+
+
+def test_get_video_metadata(video_list, tmp_path):
+
+    from lightning_pose.data import video
+    from lightning_pose.data.video import get_video_metadata
+
+    video_file = str(tmp_path / "test_vid.mp4")
+    shutil.copyfile(video_list[0], video_file)
+    cache_file = str(tmp_path / ".test_vid.mp4.meta.json")
+
+    metadata = get_video_metadata(video_file)
+    for key in ["num_frames", "fps", "height", "width", "codec", "keyframes"]:
+        assert key in metadata
+    assert metadata["num_frames"] > 0
+    assert os.path.isfile(cache_file)
+    if metadata["keyframes"]:
+        assert metadata["keyframes"][0] == 0
+
+    # later calls in any process read the sidecar file instead of probing the video
+    with open(cache_file, "r") as f:
+        cached = json.load(f)
+    cached["num_frames"] = -1
+    with open(cache_file, "w") as f:
+        json.dump(cached, f)
+    video._video_metadata.clear()
+    assert get_video_metadata(video_file)["num_frames"] == -1
+
+    # a modified video is probed again
+    os.utime(video_file, ns=(0, 0))
+    assert get_video_metadata(video_file)["num_frames"] == metadata["num_frames"]
+
+
+def test_probe_video_cv2(video_list):
+
+    from lightning_pose.data.video import _probe_video_cv2
+
+    # the frame count of the container, verified at the end of the video, matches the number of
+    # frames decoded one by one
+    cap = cv2.VideoCapture(video_list[0])
+    num_frames = 0
+    while cap.grab():
+        num_frames += 1
+    cap.release()
+    assert _probe_video_cv2(video_list[0])["num_frames"] == num_frames
+    assert _probe_video_cv2(video_list[0], tail=1)["num_frames"] == num_frames
+
+
+def test_video_frame_reader(video_list, read_frames_sequentially):
+
+    from lightning_pose.data.video import VideoFrameReader, get_video_metadata
+
+    reader = VideoFrameReader(max_forward=2)
+    video_file = video_list[0]
+    num_frames = reader.num_frames(video_file)
+
+    # frames around and between keyframes, where seeks are most likely to land on the wrong frame
+    keyframes = get_video_metadata(video_file)["keyframes"] or list(range(0, num_frames, 100))
+    frame_idxs = {0, 1, num_frames - 1}
+    for kf_prev, kf in zip(keyframes, keyframes[1:] + [num_frames]):
+        frame_idxs.update([kf - 1, kf, kf + 1, (kf_prev + kf) // 2])
+    frame_idxs = sorted(i for i in frame_idxs if 0 <= i < num_frames)
+    frames = read_frames_sequentially(video_file, frame_idxs)
+
+    # random access returns the same frames as sequential reading, whether the reader seeks
+    # (fresh reader or backward jump) or decodes forward from its last position
+    for frame_idx in frame_idxs:
+        assert np.array_equal(VideoFrameReader().read(video_file, frame_idx), frames[frame_idx])
+    rng = np.random.default_rng(0)
+    for frame_idx in rng.permutation(frame_idxs):
+        assert np.array_equal(reader.read(video_file, frame_idx), frames[frame_idx])
+    for frame_idx in frame_idxs:
+        assert np.array_equal(reader.read(video_file, frame_idx), frames[frame_idx])
+    assert frames[0].shape == (*reader.frame_shape(video_file), 3)
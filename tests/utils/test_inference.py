@@ -0,0 +1,47 @@
+"""Test the inference module."""
+
+import copy
+import gc
+
+import lightning.pytorch as pl
+import numpy as np
+import torch
+
+from lightning_pose.utils.scripts import get_loss_factories, get_model
+
+
+def test_inference_engine(cfg, heatmap_data_module):
+    """The lean inference loop reproduces the predictions of `pl.Trainer.predict`."""
+
+    from lightning_pose.utils.inference import InferenceEngine
+
+    cfg_tmp = copy.deepcopy(cfg)
+    cfg_tmp.model.model_type = "heatmap"
+    cfg_tmp.model.losses_to_use = []
+    loss_factories = get_loss_factories(cfg=cfg_tmp, data_module=heatmap_data_module)
+    model = get_model(cfg=cfg_tmp, data_module=heatmap_data_module, loss_factories=loss_factories)
+
+    dataloader = heatmap_data_module.full_labeled_dataloader()
+    trainer = pl.Trainer(accelerator="auto", devices=1)
+    preds = trainer.predict(model=model, dataloaders=dataloader, return_predictions=True)
+    keypoints_ref = torch.vstack([pred[0] for pred in preds]).cpu().numpy()
+    confidences_ref = torch.vstack([pred[1] for pred in preds]).cpu().numpy()
+
+    devices = ["cpu", "cuda"] if torch.cuda.is_available() else ["cpu"]
+    for device in devices:
+        # a batch size that does not divide the dataset, with and without a prefetch thread
+        for prefetch in [0, 2]:
+            keypoints, confidences = InferenceEngine(
+                model=model, device=device, batch_size=7, prefetch=prefetch,
+            ).predict(dataloader)
+            assert keypoints.dtype == np.float32
+            assert keypoints.shape == keypoints_ref.shape
+            assert confidences.shape == confidences_ref.shape
+            assert np.allclose(keypoints, keypoints_ref, atol=1e-2)
+            assert np.allclose(confidences, confidences_ref, atol=1e-3)
+
+    # remove tensors from gpu
+    del loss_factories
+    del model
+    gc.collect()
+    torch.cuda.empty_cache()
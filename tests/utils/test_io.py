@@ -26,6 +26,52 @@ def test_check_if_semisupervised():
     assert flag
 
 
+def test_load_label_csv(toy_data_dir, tmpdir):
+
+    import json
+
+    import numpy as np
+    import pandas as pd
+
+    from lightning_pose.utils.io import _label_cache_file, load_label_csv
+
+    csv_file = os.path.join(str(tmpdir), "CollectedData.csv")
+    shutil.copyfile(os.path.join(toy_data_dir, "CollectedData.csv"), csv_file)
+    cache_file = _label_cache_file(csv_file, [0, 1, 2])
+    labels_ref = pd.read_csv(csv_file, header=[0, 1, 2], index_col=0)
+
+    # first load parses the csv and writes the cache
+    labels = load_label_csv(csv_file)
+    pd.testing.assert_frame_equal(labels, labels_ref)
+    assert os.path.isfile(cache_file)
+
+    # second load is served from the cache
+    mtime = os.path.getmtime(cache_file)
+    labels = load_label_csv(csv_file)
+    pd.testing.assert_frame_equal(labels, labels_ref)
+    assert os.path.getmtime(cache_file) == mtime
+
+    # other header rows are cached separately and leave the first cache untouched
+    labels_ref_header = pd.read_csv(csv_file, header=[1, 2], index_col=0)
+    labels = load_label_csv(csv_file, header_rows=[1, 2])
+    pd.testing.assert_frame_equal(labels, labels_ref_header)
+    assert os.path.isfile(_label_cache_file(csv_file, [1, 2]))
+    assert os.path.getmtime(cache_file) == mtime
+
+    # a new mtime with unchanged content (e.g. after copying) is recorded in the cache
+    os.utime(csv_file, ns=(os.stat(csv_file).st_atime_ns, os.stat(csv_file).st_mtime_ns + 10 ** 9))
+    labels = load_label_csv(csv_file)
+    pd.testing.assert_frame_equal(labels, labels_ref)
+    with np.load(cache_file) as cache:
+        assert json.loads(str(cache["meta"]))["mtime_ns"] == os.stat(csv_file).st_mtime_ns
+
+    # editing the csv invalidates the cache
+    labels_ref.iloc[0, 0] += 1.0
+    labels_ref.to_csv(csv_file)
+    labels = load_label_csv(csv_file)
+    pd.testing.assert_frame_equal(labels, labels_ref)
+
+
 def test_get_videos_in_dir(toy_data_dir, tmpdir):
 
     from lightning_pose.utils.io import get_videos_in_dir
@@ -136,3 +182,44 @@ def test_check_video_paths(toy_data_dir, tmpdir):
     for v_list in video_list_5:
         assert isinstance(v_list, list)
         assert len(v_list) == 1
+
+
+@pytest.mark.parametrize("extension", [".csv", ".h5", ".npz", ".parquet"])
+def test_save_load_predictions(tmpdir, extension):
+
+    import numpy as np
+    import pandas as pd
+
+    from lightning_pose.utils.io import load_predictions, save_predictions, split_prediction_file
+
+    if extension == ".parquet":
+        pytest.importorskip("pyarrow")
+
+    columns = pd.MultiIndex.from_tuples(
+        [("heatmap_tracker", bp, c) for bp in ["nose", "paw"] for c in ["x", "y", "likelihood"]],
+        names=["scorer", "bodyparts", "coords"],
+    )
+    preds_df = pd.DataFrame(
+        np.random.rand(10, 6), columns=columns, index=[f"img{i}.png" for i in range(10)],
+    )
+    preds_df[("set", "", "")] = ["train"] * 5 + ["test"] * 5
+
+    preds_file = os.path.join(str(tmpdir), f"predictions{extension}")
+    assert split_prediction_file(preds_file) == (
+        os.path.join(str(tmpdir), "predictions"), extension,
+    )
+    save_predictions(preds_df, preds_file, compression=None if extension == ".csv" else "gzip")
+
+    preds_loaded = load_predictions(preds_file)
+    xyl = preds_loaded.columns.get_level_values("coords").isin(["x", "y", "likelihood"])
+    assert list(preds_loaded.index) == list(preds_df.index)
+    assert preds_loaded.columns.get_level_values("bodyparts")[:6].tolist() == \
+        preds_df.columns.get_level_values("bodyparts")[:6].tolist()
+    assert np.allclose(preds_loaded.loc[:, xyl].to_numpy(float), preds_df.iloc[:, :6], atol=1e-6)
+    assert preds_loaded.iloc[:, -1].tolist() == preds_df.iloc[:, -1].tolist()
+
+    # dropping header levels matches reading csv files with fewer header rows
+    assert load_predictions(preds_file, header_rows=[1, 2]).columns.nlevels == 2
+
+    with pytest.raises(NotImplementedError):
+        save_predictions(preds_df, os.path.join(str(tmpdir), "predictions.txt"))
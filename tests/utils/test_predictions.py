@@ -3,7 +3,10 @@
 import copy
 import gc
 
+import h5py
 import lightning.pytorch as pl
+import numpy as np
+import pandas as pd
 import torch
 
 from lightning_pose.utils.scripts import get_loss_factories, get_model
@@ -90,7 +93,7 @@ def test_predict_single_video(cfg, heatmap_data_module, video_list, remove_logs,
 
     """
 
-    from lightning_pose.utils.predictions import predict_single_video
+    from lightning_pose.utils.predictions import predict_single_video, predict_videos
 
     # make a basic heatmap tracker
     cfg_tmp = copy.deepcopy(cfg)
@@ -163,6 +166,28 @@ def test_predict_single_video(cfg, heatmap_data_module, video_list, remove_logs,
         model=model,
         save_heatmaps=True,
     )
+    with h5py.File(str(tmpdir.join("test4_heatmaps.hdf5")), "r") as f:
+        num_frames = pd.read_csv(str(tmpdir.join("test4.csv")), header=[0, 1, 2]).shape[0]
+        assert f["heatmaps"].shape[:2] == (num_frames, model.num_keypoints)
+        assert f["heatmaps"].dtype == "float16"
+
+    # test 5: several videos at once, overlapping setup and output with inference
+    preds_files = [str(tmpdir.join(f"test5_{i}.csv")) for i in range(2)]
+    postprocessed = []
+    predict_videos(
+        cfg_file=cfg_tmp,
+        video_files=[video_list[0]] * 2,
+        preds_files=preds_files,
+        data_module=heatmap_data_module,
+        trainer=trainer,
+        model=model,
+        postprocess=lambda idx, preds_df: postprocessed.append((idx, preds_df.shape)),
+    )
+    df_single = pd.read_csv(str(tmpdir.join("test1.csv")), header=[0, 1, 2], index_col=0)
+    for preds_file in preds_files:
+        df_multi = pd.read_csv(preds_file, header=[0, 1, 2], index_col=0)
+        assert df_multi.shape == df_single.shape
+    assert sorted(postprocessed) == [(0, df_single.shape), (1, df_single.shape)]
 
     # remove tensors from gpu
     del loss_factories
@@ -172,3 +197,178 @@ def test_predict_single_video(cfg, heatmap_data_module, video_list, remove_logs,
 
     # clean up logging
     remove_logs()
+
+
+def test_predict_video_clips(cfg, heatmap_data_module, video_list, tmpdir):
+
+    from lightning_pose.data.video import get_video_metadata
+    from lightning_pose.utils.predictions import predict_single_video, predict_video_clips
+
+    # untrained heatmap tracker; both predictions use the opencv video backend
+    cfg_tmp = copy.deepcopy(cfg)
+    cfg_tmp.model.model_type = "heatmap"
+    cfg_tmp.model.losses_to_use = []
+    cfg_tmp.dali.general.backend = "opencv"
+    loss_factories = get_loss_factories(cfg=cfg_tmp, data_module=heatmap_data_module)
+    model = get_model(cfg=cfg_tmp, data_module=heatmap_data_module, loss_factories=loss_factories)
+    model.eval()
+
+    # clips: a video, an empty (unreadable) file, and the video again
+    num_frames = get_video_metadata(video_list[0])["num_frames"]
+    empty_file = str(tmpdir.join("empty.mp4"))
+    open(empty_file, "w").close()
+    video_files = [video_list[0], empty_file, video_list[0]]
+    preds_files = [str(tmpdir.join(f"clip_{i}.csv")) for i in range(len(video_files))]
+    predict_video_clips(
+        cfg_file=cfg_tmp,
+        video_files=video_files,
+        preds_files=preds_files,
+        data_module=heatmap_data_module,
+        model=model,
+    )
+    dfs = [pd.read_csv(f, header=[0, 1, 2], index_col=0) for f in preds_files]
+    assert [df.shape[0] for df in dfs] == [num_frames, 0, num_frames]
+
+    # clips are predicted like single videos
+    df_single = predict_single_video(
+        cfg_file=cfg_tmp,
+        video_file=video_list[0],
+        preds_file=str(tmpdir.join("single.csv")),
+        data_module=heatmap_data_module,
+        model=model,
+    )
+    for df in [dfs[0], dfs[2]]:
+        assert df.columns.equals(df_single.columns)
+        assert np.allclose(df.to_numpy(), df_single.to_numpy(), atol=1e-2)
+
+    # remove tensors from gpu
+    del loss_factories
+    del model
+    gc.collect()
+    torch.cuda.empty_cache()
+
+
+def test_streaming_prediction_writer(cfg, video_list, tmpdir):
+    """Streamed csv files match the dataframes assembled from all predictions at once."""
+
+    import os
+
+    import numpy as np
+
+    from lightning_pose.utils.predictions import PredictionHandler, StreamingPredictionWriter
+
+    num_keypoints = len(cfg.data.keypoint_names)
+    for model_type, sequence_length, step in [("heatmap", 16, 16), ("heatmap_mhcrnn", 16, 12)]:
+        cfg_tmp = copy.deepcopy(cfg)
+        cfg_tmp.model.model_type = model_type
+        handler = PredictionHandler(cfg=cfg_tmp, data_module=None, video_file=video_list[0])
+        frame_count = handler.frame_count
+
+        # fake model outputs with the batch layout of the video loaders
+        num_rows = sequence_length if step == sequence_length else sequence_length - 4
+        num_iters = int(np.ceil(frame_count / step))
+        rng = np.random.default_rng(0)
+        keypoints_all = rng.random((num_iters * num_rows, 2 * num_keypoints))
+        confidences_all = rng.random((num_iters * num_rows, num_keypoints))
+
+        # the loader covers the video, or returns fewer rows than the video has frames
+        for num_rows_total in [num_iters * num_rows, frame_count - 1, frame_count // 2]:
+            preds = [
+                (
+                    torch.tensor(keypoints_all[i:min(i + num_rows, num_rows_total)]),
+                    torch.tensor(confidences_all[i:min(i + num_rows, num_rows_total)]),
+                )
+                for i in range(0, num_rows_total, num_rows)
+            ]
+
+            file_full = os.path.join(tmpdir, f"{model_type}_{num_rows_total}_full.csv")
+            handler(preds=preds).to_csv(file_full)
+
+            file_stream = os.path.join(tmpdir, f"{model_type}_{num_rows_total}_stream.csv")
+            writer = StreamingPredictionWriter(
+                preds_file=file_stream,
+                columns=handler.make_dlc_pandas_index(),
+                frame_count=frame_count,
+                do_context=handler.do_context,
+                zero_pad_confidence=model_type != "heatmap_mhcrnn",
+            )
+            for keypoints, confidences in preds:
+                writer.write(keypoints.numpy(), confidences.numpy())
+            writer.close()
+            assert not os.path.exists(writer._tmp_file)
+
+            df_full = pd.read_csv(file_full, header=[0, 1, 2], index_col=0)
+            df_stream = pd.read_csv(file_stream, header=[0, 1, 2], index_col=0)
+            pd.testing.assert_frame_equal(df_full, df_stream)
+            assert writer.num_frames_written == df_full.shape[0]
+
+    # a failed run leaves neither the csv file nor the temporary file behind
+    file_abort = os.path.join(tmpdir, "abort.csv")
+    writer = StreamingPredictionWriter(
+        preds_file=file_abort, columns=handler.make_dlc_pandas_index(), frame_count=frame_count,
+    )
+    writer.write(keypoints_all[:num_rows], confidences_all[:num_rows])
+    writer.abort()
+    assert not os.path.exists(file_abort)
+    assert not os.path.exists(writer._tmp_file)
+
+
+def test_heatmap_writer(tmpdir):
+
+    import os
+
+    from lightning_pose.utils.predictions import HeatmapWriter
+
+    n_frames, num_keypoints, height, width = 10, 3, 16, 20
+    heatmaps = torch.rand(12, num_keypoints, height, width)
+    # place the peaks, including one at the border of the heatmap
+    heatmaps[:, 0, 5, 7] = 2.0
+    heatmaps[:, 1, 0, 19] = 2.0
+    heatmaps[:, 2, 15, 0] = 2.0
+
+    # full heatmaps; frames beyond the end of the video are discarded
+    heatmaps_file = str(tmpdir.join("full_heatmaps.hdf5"))
+    writer = HeatmapWriter(heatmaps_file, n_frames, num_keypoints, (height, width))
+    writer.write(heatmaps[:8])
+    writer.write(heatmaps[8:])
+    writer.close()
+    with h5py.File(heatmaps_file, "r") as f:
+        assert f["heatmaps"].dtype == np.float16
+        assert f["heatmaps"].shape == (n_frames, num_keypoints, height, width)
+        assert np.allclose(f["heatmaps"][()], heatmaps[:n_frames].numpy(), atol=2e-3)
+        assert "offsets" not in f
+
+    # windows around the peaks
+    heatmaps_file = str(tmpdir.join("crop_heatmaps.hdf5"))
+    writer = HeatmapWriter(heatmaps_file, n_frames, num_keypoints, (height, width), crop_size=5)
+    writer.write(heatmaps)
+    writer.close()
+    with h5py.File(heatmaps_file, "r") as f:
+        assert f["heatmaps"].shape == (n_frames, num_keypoints, 5, 5)
+        offsets = f["offsets"][()]
+        assert np.all(offsets[:, 0] == [3, 5])
+        assert np.all(offsets[:, 1] == [0, 15])
+        assert np.all(offsets[:, 2] == [11, 0])
+        for k in range(num_keypoints):
+            top, left = offsets[0, k]
+            assert np.allclose(
+                f["heatmaps"][:, k],
+                heatmaps[:n_frames, k, top:top + 5, left:left + 5].numpy(),
+                atol=2e-3,
+            )
+
+    # a failed run leaves neither the heatmaps file nor the temporary file behind
+    heatmaps_file = str(tmpdir.join("abort_heatmaps.hdf5"))
+    writer = HeatmapWriter(heatmaps_file, n_frames, num_keypoints, (height, width))
+    writer.write(heatmaps[:8])
+    writer.abort()
+    assert not os.path.exists(heatmaps_file)
+    assert not os.path.exists(writer._tmp_file)
+
+    # aborting after closing keeps the file
+    heatmaps_file = str(tmpdir.join("closed_heatmaps.hdf5"))
+    writer = HeatmapWriter(heatmaps_file, n_frames, num_keypoints, (height, width))
+    writer.write(heatmaps)
+    writer.close()
+    writer.abort()
+    assert os.path.exists(heatmaps_file)
@@ -7,10 +7,12 @@ tested) in conftest.py
 
 import copy
 import gc
+import h5py
 import lightning.pytorch as pl
 from omegaconf import OmegaConf
 from omegaconf.errors import ValidationError
 import os
+import pandas as pd
 import pytest
 import torch
 from unittest.mock import Mock
@@ -19,6 +21,7 @@ from lightning_pose.data.datasets import BaseTrackingDataset
 from lightning_pose.utils.scripts import (
     calculate_train_batches,
     export_predictions_and_labeled_video,
+    export_predictions_and_labeled_videos,
     get_data_module,
     get_loss_factories,
     get_model,
@@ -83,7 +86,7 @@ def test_export_predictions_and_labeled_video(
     # test 1: all available inputs
     csv_file = str(tmpdir.join("test1.csv"))
     mp4_file = str(tmpdir.join("test1.mp4"))
-    npy_file = csv_file.replace(".csv", "_heatmaps.npy")
+    heatmaps_file = csv_file.replace(".csv", "_heatmaps.hdf5")
     export_predictions_and_labeled_video(
         video_file=video_list[0],
         cfg=cfg_tmp,
@@ -97,12 +100,12 @@ def test_export_predictions_and_labeled_video(
     )
     assert os.path.exists(csv_file)
     assert os.path.exists(mp4_file)
-    assert not os.path.exists(npy_file)
+    assert not os.path.exists(heatmaps_file)
 
     # test 2: no trainer
     csv_file = str(tmpdir.join("test2.csv"))
     mp4_file = str(tmpdir.join("test2.mp4"))
-    npy_file = csv_file.replace(".csv", "_heatmaps.npy")
+    heatmaps_file = csv_file.replace(".csv", "_heatmaps.hdf5")
     export_predictions_and_labeled_video(
         video_file=video_list[0],
         cfg=cfg_tmp,
@@ -116,12 +119,12 @@ def test_export_predictions_and_labeled_video(
     )
     assert os.path.exists(csv_file)
     assert os.path.exists(mp4_file)
-    assert not os.path.exists(npy_file)
+    assert not os.path.exists(heatmaps_file)
 
     # test 3: no trainer, no model, save heatmaps
     csv_file = str(tmpdir.join("test3.csv"))
     mp4_file = str(tmpdir.join("test3.mp4"))
-    npy_file = csv_file.replace(".csv", "_heatmaps.npy")
+    heatmaps_file = csv_file.replace(".csv", "_heatmaps.hdf5")
     export_predictions_and_labeled_video(
         video_file=video_list[0],
         cfg=cfg_tmp,
@@ -135,7 +138,10 @@ def test_export_predictions_and_labeled_video(
     )
     assert os.path.exists(csv_file)
     assert os.path.exists(mp4_file)
-    assert os.path.exists(npy_file)
+    with h5py.File(heatmaps_file, "r") as f:
+        num_frames = pd.read_csv(csv_file, header=[0, 1, 2]).shape[0]
+        assert f["heatmaps"].shape[:2] == (num_frames, model.num_keypoints)
+        assert f["heatmaps"].dtype == "float16"
 
     # test 4: raise proper error
     with pytest.raises(ValueError):
@@ -180,6 +186,39 @@ def _supervised_multi_gpu_cfg(cfg):
     )
 
 
+def test_export_predictions_and_labeled_videos_metrics_errors(cfg, monkeypatch):
+
+    video_files = ["video_0.mp4", "video_1.mp4", "video_2.mp4"]
+    exported = []
+
+    def fake_predict_videos(video_files, postprocess, **kwargs):
+        for idx in range(len(video_files)):
+            postprocess(idx)
+
+    def fake_compute_metrics(cfg, preds_file, data_module):
+        if preds_file == "video_1.csv":
+            raise ValueError("metrics failed")
+        exported.append(preds_file)
+
+    monkeypatch.setattr("lightning_pose.utils.scripts.predict_videos", fake_predict_videos)
+    monkeypatch.setattr("lightning_pose.utils.scripts.compute_metrics", fake_compute_metrics)
+    kwargs = dict(
+        video_files=video_files,
+        cfg=cfg,
+        prediction_csv_files=[f.replace(".mp4", ".csv") for f in video_files],
+        model=Mock(),
+    )
+
+    # by default, metrics errors are raised
+    with pytest.raises(ValueError):
+        export_predictions_and_labeled_videos(**kwargs)
+
+    # predict_new_vids.py skips videos whose metrics fail
+    exported.clear()
+    export_predictions_and_labeled_videos(skip_failed_metrics=True, **kwargs)
+    assert exported == ["video_0.csv", "video_2.csv"]
+
+
 def test_get_data_module_num_gpus_0(cfg):
     cfg = _supervised_multi_gpu_cfg(cfg)
     # when num_gpus is set to 0, i.e. from a deprecated config